@@ -25,12 +25,59 @@ def create_app(config_class=Config):
     return app
 
 
+# Librerie pesanti (~100 ms) che l'app importa al primo uso e non all'avvio
+# (app/gsc/gsc.py, app/gsc/client.py): non le pagano i comandi `flask`, le
+# pagine che non toccano Search Console, i worker avviati senza preload. Con
+# `preload_app` gunicorn.conf.py le carica nel master (`import_deferred`),
+# così i worker, anche quelli riciclati da max_requests, le ereditano col fork.
+DEFERRED_IMPORTS = (
+    "google.oauth2.credentials",
+    "google_auth_oauthlib.flow",
+    "googleapiclient.discovery",
+    "google_auth_httplib2",
+)
+
+
+def import_deferred():
+    import importlib
+
+    for name in DEFERRED_IMPORTS:
+        importlib.import_module(name)
+
+
+def dispose_engines(app, close=True):
+    """Svuota il pool dell'engine: i processi nuovi aprono le loro connessioni
+    al primo uso. Con `preload_app` (gunicorn.conf.py) l'app, e quindi
+    l'engine, nasce nel master, che apre connessioni già in create_app
+    (`_ensure_tables`): il master le chiude prima di forkare, e ogni worker
+    dopo il fork abbandona con `close=False` quelle eventualmente ereditate,
+    senza chiudere un socket che non è suo. Senza questo, più worker
+    userebbero la stessa connessione."""
+    from app.extensions import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def _engine_options(app):
+    """Opzioni del pool da Config (DB_POOL_*). SQLite resta ai default di
+    Flask-SQLAlchemy: in memoria usa StaticPool, che non ha dimensioni."""
+    options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    options.setdefault("pool_pre_ping", app.config["DB_POOL_PRE_PING"])
+    if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        options.setdefault("pool_size", app.config["DB_POOL_SIZE"])
+        options.setdefault("max_overflow", app.config["DB_MAX_OVERFLOW"])
+        options.setdefault("pool_recycle", app.config["DB_POOL_RECYCLE"])
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+
 def _register_extensions(app):
-    from app.extensions import admin, csrf, db, login_manager
+    from app.extensions import csrf, db, login_manager
 
+    _engine_options(app)
     db.init_app(app)
     csrf.init_app(app)
-    admin.init_app(app)
 
     login_manager.init_app(app)
     login_manager.login_view = "auth.login"
@@ -45,7 +92,11 @@ def _register_extensions(app):
 
     from app.admin import init_admin
 
-    init_admin()
+    init_admin(app)
+
+    from app.metrics.timing import init_timing
+
+    init_timing(app)
 
 
 def _register_blueprints(app):
@@ -54,12 +105,14 @@ def _register_blueprints(app):
     from app.dashboard.routes import dashboard_bp
     from app.gsc.gsc import gsc_bp
     from app.main.routes import main_bp
+    from app.metrics.routes import metrics_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(gsc_bp)
     app.register_blueprint(ai_bp)
+    app.register_blueprint(metrics_bp)
 
 
 def _register_cli(app):
@@ -70,7 +123,8 @@ def _register_cli(app):
     @app.cli.command("init-db")
     def init_db():
         """Crea le tabelle nel database configurato (DATABASE_URL)."""
-        db.create_all()
+        if not _upgrade_schema(app):
+            raise click.ClickException("Tabelle nel vecchio formato: lancia prima `flask migrate-sites`.")
         print("Tabelle create.")
 
     @app.cli.command("make-admin")
@@ -87,14 +141,120 @@ def _register_cli(app):
         db.session.commit()
         print(f"{user.email} ora può accedere a /admin/.")
 
+    @app.cli.command("ingest")
+    @click.option("--workers", type=int, default=None, help="Account in parallelo (default: INGEST_WORKERS).")
+    def ingest(workers):
+        """Un giro di sync dello storico GSC su tutti gli account collegati."""
+        from app.gsc.ingest import run_ingest
+
+        results = run_ingest(workers)
+        if results is None:
+            print("Ingest già in corso in un altro processo.")
+            return
+        for user_id, sites in results.items():
+            for site_url, outcome in sites.items():
+                print(f"utente {user_id} {site_url or '-'}: {outcome}")
+        print(f"Ingest completato: {len(results)} account.")
+
+    @app.cli.command("migrate-sites")
+    def migrate_sites():
+        """Porta le tabelle per sito dalle chiavi site_url a site_id (una tantum)."""
+        from app.gsc.migrate_sites import migrate_to_site_ids
+
+        copied = migrate_to_site_ids()
+        for table, rows in copied.items():
+            print(f"{table}: {rows} righe copiate")
+        if not copied:
+            print("Niente da migrare: le tabelle usano già site_id.")
+        _upgrade_schema(app)
+
+    @app.cli.command("rotate-token-key")
+    @click.option("--batch-size", type=int, default=None, help="Connessioni per transazione (default: 500).")
+    def rotate_token_key(batch_size):
+        """Ricifra i token OAuth con TOKEN_ENCRYPTION_KEY (dopo una rotazione della chiave)."""
+        from app.gsc.repository import ROTATION_BATCH, rotate_token_encryption
+
+        seen, rotated, failed = rotate_token_encryption(batch_size or ROTATION_BATCH)
+        print(f"{rotated} connessioni ricifrate su {seen}.")
+        if failed:
+            print(f"{failed} connessioni con token non decifrabili: vedi i warning nel log.")
+
+    @app.cli.command("pack-series")
+    def pack_series():
+        """Riscrive in formato compatto (GscSiteYear) lo storico di tutti i siti."""
+        from app.gsc.packed import pack_all_sites
+
+        packed = pack_all_sites()
+        print(f"Impacchettati {sum(packed.values())} anni di {len(packed)} siti.")
+
+
+def _schema_version():
+    from sqlalchemy.exc import OperationalError, ProgrammingError
 
-def _ensure_tables(app):
-    """Crea le tabelle mancanti all'avvio, così non serve ricordarsi di
-    lanciare `flask init-db` a mano (es. dopo un `docker compose up` da zero).
-    Non tocca le tabelle già esistenti: è lo stesso `db.create_all()` di
-    `init-db`, solo eseguito automaticamente. Vedi README per quando invece
-    servono migration vere."""
     from app.extensions import db
+    from app.models import SchemaVersion
+
+    try:
+        return db.session.query(SchemaVersion.version).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        # Tabella assente: DB nuovo, o creato prima del versionamento.
+        db.session.rollback()
+        return 0
+
+
+def _upgrade_schema(app):
+    """`db.create_all()` più il controllo delle tabelle ancora da migrare; se
+    è tutto a posto registra SCHEMA_VERSION. Ritorna True se lo schema è
+    aggiornato. create_all() crea le tabelle mancanti ma non altera quelle
+    esistenti: vedi README per quando servono migration vere."""
+    from datetime import datetime, timezone
+
+    from sqlalchemy.exc import IntegrityError
+
+    from app.extensions import db
+    from app.gsc.migrate_sites import pending_migration
+    from app.models import SCHEMA_VERSION, SchemaVersion
+
+    db.create_all()
+    pending = pending_migration()
+    if pending:
+        app.logger.error(
+            "Tabelle nel vecchio formato (%s): lancia `flask migrate-sites`.", ", ".join(pending)
+        )
+        return False
+    row = db.session.get(SchemaVersion, 1) or SchemaVersion(id=1)
+    row.version = SCHEMA_VERSION
+    row.updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    db.session.add(row)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # un altro processo l'ha appena registrata
+    return True
+
+
+def _ensure_tables(app):
+    """Allinea lo schema all'avvio, così non serve ricordarsi di lanciare
+    `flask init-db` a mano (es. dopo un `docker compose up` da zero). Di
+    solito costa una query: se la versione registrata in SchemaVersion è
+    quella del codice non c'è altro da fare. Solo su un DB nuovo o più
+    vecchio passa da `_upgrade_schema` (create_all e controlli, che
+    ispezionano le tabelle una per una).
+
+    Con tabelle ancora da migrare l'app non parte: le route le troverebbero
+    nel formato vecchio e risponderebbero 500. Fanno eccezione i comandi
+    `flask` (c'è un contesto click), perché `flask migrate-sites` deve poter
+    creare l'app per sistemarle."""
+    import click
+
+    from app.models import SCHEMA_VERSION
 
     with app.app_context():
-        db.create_all()
+        version = _schema_version()
+        if version < SCHEMA_VERSION:
+            if not _upgrade_schema(app) and click.get_current_context(silent=True) is None:
+                raise RuntimeError("Schema del DB nel vecchio formato: lancia `flask migrate-sites`.")
+        elif version > SCHEMA_VERSION:
+            app.logger.warning(
+                "Schema del DB alla versione %d, questo codice si aspetta la %d.", version, SCHEMA_VERSION
+            )
@@ -1,8 +1,27 @@
-from app.admin.views import UserAdminView
-from app.extensions import admin, db
-from app.models import User
+from flask_admin import Admin, AdminIndexView
+from flask_admin.theme import Bootstrap4Theme
 
+from app.admin.views import AiBudgetAdminView, RuleThresholdsAdminView, UserAdminView
+from app.extensions import AdminAuthMixin, db
+from app.models import AiBudget, RuleThresholds, User
 
-def init_admin():
-    """Registra le viste CRUD di Flask-Admin. Chiamata da create_app()."""
+
+class SecureAdminIndexView(AdminAuthMixin, AdminIndexView):
+    pass
+
+
+admin = Admin(
+    name="LinkBayCMS",
+    theme=Bootstrap4Theme(swatch="flatly"),
+    index_view=SecureAdminIndexView(),
+)
+
+
+def init_admin(app):
+    """Aggancia Flask-Admin all'app e registra le viste CRUD. Chiamata da
+    create_app(): il blueprint di /admin va registrato prima della prima
+    richiesta, quindi qui Flask-Admin si carica all'avvio dell'app web."""
+    admin.init_app(app)
     admin.add_view(UserAdminView(User, db.session, name="Users"))
+    admin.add_view(RuleThresholdsAdminView(RuleThresholds, db.session, name="Soglie"))
+    admin.add_view(AiBudgetAdminView(AiBudget, db.session, name="Budget AI"))
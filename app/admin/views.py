@@ -1,6 +1,9 @@
 from flask_admin.contrib.sqla import ModelView
+from wtforms.validators import ValidationError
 
 from app.extensions import AdminAuthMixin
+from app.models import RuleThresholds
+from app.rules import resolve
 
 
 class SecureModelView(AdminAuthMixin, ModelView):
@@ -17,3 +20,39 @@ class UserAdminView(SecureModelView):
     form_columns = ("name", "email", "is_admin")
     column_searchable_list = ("name", "email")
     column_default_sort = ("created_at", True)
+
+
+class RuleThresholdsAdminView(SecureModelView):
+    # Taratura delle soglie del rule engine: la riga senza sito è il default
+    # globale, i campi lasciati vuoti ereditano.
+    column_list = (
+        "site",
+        "min_clicks_best_month",
+        "min_pct_loss",
+        "min_abs_loss",
+        "window_months",
+        "persistence_months",
+        "site_relative_margin",
+    )
+    form_columns = column_list
+    column_searchable_list = ("site.site_url",)
+
+    def on_model_change(self, form, model, is_created):
+        # Gli stessi controlli di `resolve`, sulla riga combinata con il
+        # default globale: una soglia che il motore rifiuta renderebbe
+        # /gsc/api/alerts inutilizzabile per i siti che la ereditano.
+        layers = [model]
+        if model.site is not None:
+            layers.insert(0, RuleThresholds.query.filter_by(site_id=None).first())
+        try:
+            resolve(*layers)
+        except ValueError as e:
+            raise ValidationError(str(e)) from e
+
+
+class AiBudgetAdminView(SecureModelView):
+    # Budget dell'AI Analyzer per run: la riga senza sito è il default
+    # globale, i campi vuoti ereditano (fino a Config).
+    column_list = ("site", "max_pages", "max_tokens")
+    form_columns = column_list
+    column_searchable_list = ("site.site_url",)
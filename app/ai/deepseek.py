@@ -3,53 +3,267 @@
 Una sola funzione: manda system+user e pretende una risposta JSON
 (`response_format=json_object`), così il chiamante lavora su un dict, non su
 testo libero. Nessuna dipendenza nuova: usa `requests` (già nel progetto).
+
+Il trasporto è condiviso dal processo: una `requests.Session` con pool di
+connessioni limitato (keep-alive, niente handshake TLS a ogni analisi), retry
+con backoff esponenziale e jitter su 429/5xx ed errori di rete (rispettando
+`Retry-After`), e un semaforo che limita le chiamate contemporanee verso il
+provider a DEEPSEEK_MAX_CONCURRENCY per processo. `metrics()` espone i
+contatori (chiamate, retry, latenza) per il monitoraggio.
+
+`stream_json_items` è la variante in streaming: legge l'SSE dei token e
+restituisce ogni oggetto dell'array `pages` appena è completo, così il primo
+risultato arriva dopo la prima pagina generata e non a fine risposta.
 """
+import email.utils
 import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
 
 import requests
 from flask import current_app
+from requests.adapters import HTTPAdapter
+
+from app.metrics import timing
 
 
 class DeepSeekError(Exception):
     pass
 
 
-def chat_json(system: str, user: str, temperature: float = 0.2, max_tokens: int = 4000) -> dict:
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 1.0       # secondi, raddoppia a ogni tentativo
+BACKOFF_MAX = 20.0       # tetto del singolo sleep (anche per Retry-After)
+
+_session = None
+_semaphore = None
+_client_lock = threading.Lock()
+
+_metrics = {"calls": 0, "failures": 0, "retries": 0, "latency_seconds": 0.0}
+_metrics_lock = threading.Lock()
+
+
+def _client():
+    """(session, semaphore) del processo, creati al primo uso (dopo il fork)."""
+    global _session, _semaphore
+    if _session is None:
+        with _client_lock:
+            if _session is None:
+                concurrency = current_app.config["DEEPSEEK_MAX_CONCURRENCY"]
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+                session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+                _semaphore = threading.BoundedSemaphore(concurrency)
+                _session = session
+    return _session, _semaphore
+
+
+def _retry_after(resp):
+    """Secondi chiesti dal server con Retry-After (numero o data HTTP), o None."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt, resp=None):
+    wait = _retry_after(resp) if resp is not None else None
+    if wait is None:
+        wait = random.uniform(0, BACKOFF_BASE * 2 ** attempt)  # full jitter
+    return min(wait, BACKOFF_MAX)
+
+
+def _record(latency, retries, failed):
+    with _metrics_lock:
+        _metrics["calls"] += 1
+        _metrics["retries"] += retries
+        _metrics["latency_seconds"] += latency
+        if failed:
+            _metrics["failures"] += 1
+
+
+def metrics() -> dict:
+    """Contatori cumulativi del processo: chiamate, fallite, retry, latenza totale."""
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+@contextmanager
+def _response(payload, stats, stream=False):
+    """POST /chat/completions con retry; `stats["retries"]` conta i tentativi
+    ripetuti. Il semaforo resta preso mentre il chiamante legge la risposta
+    (anche in streaming), non durante il backoff. Solleva DeepSeekError se
+    anche l'ultimo tentativo fallisce per errore di rete."""
     api_key = current_app.config.get("DEEPSEEK_API")
     if not api_key:
         raise DeepSeekError("DeepSeek non è configurato (DEEPSEEK_API mancante).")
-
     base = current_app.config.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com").rstrip("/")
-    model = current_app.config.get("DEEPSEEK_MODEL", "deepseek-chat")
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+    session, semaphore = _client()
+    max_retries = current_app.config["DEEPSEEK_MAX_RETRIES"]
+    timeout = current_app.config["DEEPSEEK_TIMEOUT"]
+    attempt = 0
+    while True:
+        with semaphore:
+            try:
+                resp = session.post(
+                    f"{base}/chat/completions", headers=headers, json=payload, timeout=timeout, stream=stream
+                )
+            except requests.RequestException as e:
+                if attempt >= max_retries:
+                    raise DeepSeekError(f"Chiamata DeepSeek fallita: {e}") from e
+                resp = None
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt >= max_retries:
+                    with resp:
+                        yield resp
+                    return
+                resp.close()
+        time.sleep(_backoff(attempt, resp))
+        attempt += 1
+        stats["retries"] = attempt
+
 
+def _payload(system, user, temperature, max_tokens, stream):
+    return {
+        "model": current_app.config.get("DEEPSEEK_MODEL", "deepseek-chat"),
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": stream,
+    }
+
+
+@contextmanager
+def _measured(kind):
+    """Latenza e retry della chiamata nelle metriche e nel log."""
+    started = time.perf_counter()
+    stats = {"retries": 0, "failed": True}
     try:
-        resp = requests.post(
-            f"{base}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": system},
-                    {"role": "user", "content": user},
-                ],
-                "response_format": {"type": "json_object"},
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "stream": False,
-            },
-            timeout=90,
+        yield stats
+    finally:
+        latency = time.perf_counter() - started
+        _record(latency, stats["retries"], stats["failed"])
+        timing.record("deepseek", latency)
+        current_app.logger.info(
+            "DeepSeek %s: %.2fs, %d retry%s", kind, latency, stats["retries"], " (fallita)" if stats["failed"] else ""
         )
-    except requests.RequestException as e:
-        raise DeepSeekError(f"Chiamata DeepSeek fallita: {e}") from e
 
-    if resp.status_code != 200:
-        raise DeepSeekError(f"DeepSeek HTTP {resp.status_code}: {resp.text[:200]}")
 
-    try:
-        content = resp.json()["choices"][0]["message"]["content"]
-        return json.loads(content)
-    except (KeyError, IndexError, ValueError) as e:
-        raise DeepSeekError(f"Risposta DeepSeek non valida: {e}") from e
+def chat_json(system: str, user: str, temperature: float = 0.2, max_tokens: int = 4000) -> dict:
+    with _measured("chat") as stats:
+        with _response(_payload(system, user, temperature, max_tokens, False), stats) as resp:
+            if resp.status_code != 200:
+                raise DeepSeekError(f"DeepSeek HTTP {resp.status_code}: {resp.text[:200]}")
+
+            try:
+                content = resp.json()["choices"][0]["message"]["content"]
+                result = json.loads(content)
+            except (KeyError, IndexError, ValueError) as e:
+                raise DeepSeekError(f"Risposta DeepSeek non valida: {e}") from e
+        stats["failed"] = False
+        return result
+
+
+class _ArrayItems:
+    """Parser incrementale degli oggetti di un array JSON `"<key>": [ {...}, ... ]`
+    dentro un testo che arriva a pezzi: `feed` ritorna gli oggetti completati
+    con quel pezzo. Tiene conto di stringhe ed escape, così graffe dentro un
+    suggerimento non confondono la profondità."""
+
+    def __init__(self, key):
+        self._opening = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._buf = ""
+        self._pos = None      # indice di scansione nel buffer, None = array non ancora trovato
+        self._depth = 0
+        self._start = 0
+        self._in_string = False
+        self._escape = False
+        self.done = False
+
+    def feed(self, text):
+        self._buf += text
+        if self._pos is None:
+            match = self._opening.search(self._buf)
+            if match is None:
+                return []
+            self._buf = self._buf[match.end():]
+            self._pos = 0
+        items = []
+        buf = self._buf
+        i = self._pos
+        while i < len(buf) and not self.done:
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif c == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        items.append(json.loads(buf[self._start:i + 1]))
+                    except ValueError:
+                        pass  # oggetto malformato: si scarta, come un url sconosciuto
+            elif c == "]" and self._depth == 0:
+                self.done = True
+            i += 1
+        # Tieni solo l'oggetto in corso: il buffer non cresce con la risposta.
+        keep = self._start if self._depth > 0 else i
+        self._buf = buf[keep:]
+        self._start -= keep
+        self._pos = i - keep
+        return items
+
+
+def stream_json_items(system: str, user: str, key: str = "pages", temperature: float = 0.2,
+                      max_tokens: int = 4000):
+    """Come chat_json, ma in streaming (SSE): genera gli oggetti dell'array
+    `key` della risposta man mano che il modello li completa, invece di
+    aspettare tutta la generazione. Solleva DeepSeekError per errori HTTP o se
+    lo stream si interrompe (gli oggetti già generati restano validi)."""
+    with _measured("stream") as stats:
+        with _response(_payload(system, user, temperature, max_tokens, True), stats, stream=True) as resp:
+            if resp.status_code != 200:
+                raise DeepSeekError(f"DeepSeek HTTP {resp.status_code}: {resp.text[:200]}")
+
+            parser = _ArrayItems(key)
+            try:
+                for line in resp.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue  # righe vuote e keep-alive (": ...") dell'SSE
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    content = (chunk["choices"][0].get("delta") or {}).get("content") or ""
+                    yield from parser.feed(content)
+            except requests.RequestException as e:
+                raise DeepSeekError(f"Stream DeepSeek interrotto: {e}") from e
+            except (KeyError, IndexError, ValueError) as e:
+                raise DeepSeekError(f"Chunk DeepSeek non valido: {e}") from e
+        stats["failed"] = False
@@ -0,0 +1,232 @@
+"""Job di analisi AI, fuori dalla richiesta web.
+
+`/ai/analyze` eseguiva build_insights + la chiamata DeepSeek (fino a 90 s)
+dentro il thread della richiesta: pochi utenti insieme occupavano buona parte
+dei thread gthread. Ora la POST crea un AiAnalysisJob e risponde 202; il job
+gira in un piccolo pool di thread del processo (AI_JOB_WORKERS, non sono
+thread di richiesta) e la UI ne segue lo stato interrogando `/ai/jobs/<id>`.
+
+Chi prende un job ne tiene la lease (`lease_until`, LEASE_SECONDS) e la
+rinnova da un thread finché lavora. Se il processo muore (worker gunicorn
+riciclato o riavviato a metà job) la lease scade e il job torna prendibile.
+
+Lo scheduler (`python -m scheduler`) chiama `run_pending_jobs`: esegue i job
+rimasti in coda (es. worker riavviato prima di prenderli) e riprende quelli
+"running" con la lease scaduta; chiude come "timeout" quelli che l'hanno
+persa già MAX_ATTEMPTS volte o che girano da oltre JOB_TIMEOUT_MINUTES. La
+presa in carico è un UPDATE condizionato (in coda, o lease scaduta), quindi
+un job non gira mai in due processi insieme anche se web e scheduler lo
+vedono insieme.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, url_for
+from sqlalchemy import and_, or_
+
+from app.ai.deepseek import DeepSeekError
+from app.ai.service import analyze_site, site_budget
+from app.extensions import db
+from app.gsc.gsc import get_user_gsc_service
+from app.gsc.insights import build_insights
+from app.gsc.repository import save_if_refreshed
+from app.gsc.site_ids import get_site_id
+from app.models import AiAnalysisJob
+
+ACTIVE = ("queued", "running")
+JOB_TIMEOUT_MINUTES = 10  # oltre, un job "running" si chiude anche con la lease viva
+ORPHAN_SECONDS = 30       # job in coda da più di così: li prende lo scheduler
+LEASE_SECONDS = 60        # lease di un job "running", rinnovata ogni terzo
+MAX_ATTEMPTS = 3          # prese in carico prima di arrendersi ("timeout")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=current_app.config["AI_JOB_WORKERS"], thread_name_prefix="ai-job"
+                )
+    return _pool
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def job_as_dict(job):
+    if job is None:
+        return None
+    return {
+        "id": job.id,
+        "status": job.status,
+        "error": job.error,
+        "message": job.message,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "url": url_for("ai.job", job_id=job.id),
+    }
+
+
+def active_job(user_id, site_url):
+    """Job in coda o in corso per (utente, sito), se c'è."""
+    site_id = get_site_id(user_id, site_url)
+    if site_id is None:
+        return None
+    return (
+        AiAnalysisJob.query.filter(
+            AiAnalysisJob.site_id == site_id,
+            AiAnalysisJob.status.in_(ACTIVE),
+            AiAnalysisJob.created_at >= _utcnow() - MAX_ATTEMPTS * timedelta(minutes=JOB_TIMEOUT_MINUTES),
+        )
+        .order_by(AiAnalysisJob.id.desc())
+        .first()
+    )
+
+
+def enqueue_analysis(user_id, site_url):
+    """Crea il job (o ritorna quello già attivo per lo stesso sito) e lo
+    affida al pool del processo. Il sito deve essere registrato (vedi
+    app/ai/routes.py `_site_id`)."""
+    job = active_job(user_id, site_url)
+    if job is not None:
+        return job
+
+    job = AiAnalysisJob(site_id=get_site_id(user_id, site_url), status="queued", created_at=_utcnow())
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    _executor().submit(run_job, app, job.id)
+    return job
+
+
+def _expired(now):
+    """Job "running" la cui lease è scaduta: il processo che lo eseguiva è morto."""
+    return and_(AiAnalysisJob.status == "running", AiAnalysisJob.lease_until < now)
+
+
+def _claim(job_id):
+    now = _utcnow()
+    claimed = (
+        AiAnalysisJob.query.filter(
+            AiAnalysisJob.id == job_id,
+            AiAnalysisJob.attempts < MAX_ATTEMPTS,
+            or_(AiAnalysisJob.status == "queued", _expired(now)),
+        )
+        .update(
+            {
+                "status": "running",
+                "started_at": now,
+                "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+                "attempts": AiAnalysisJob.attempts + 1,
+            },
+            synchronize_session=False,
+        )
+    )
+    db.session.commit()
+    return bool(claimed)
+
+
+def _keep_lease(app, job_id, stop):
+    """Thread che rinnova la lease del job finché `stop` non è impostato."""
+    with app.app_context():
+        try:
+            while not stop.wait(LEASE_SECONDS / 3):
+                AiAnalysisJob.query.filter_by(id=job_id, status="running").update(
+                    {"lease_until": _utcnow() + timedelta(seconds=LEASE_SECONDS)}, synchronize_session=False
+                )
+                db.session.commit()
+        finally:
+            db.session.remove()
+
+
+def _finish(job, error=None, message=None):
+    job.status = "failed" if error else "done"
+    job.error = error
+    job.message = message
+    job.finished_at = _utcnow()
+    db.session.commit()
+
+
+def run_job(app, job_id):
+    """Esegue un job in coda, o ripreso con la lease scaduta (no-op se un
+    altro processo l'ha già preso)."""
+    stop = threading.Event()
+    with app.app_context():
+        try:
+            if not _claim(job_id):
+                return
+            threading.Thread(
+                target=_keep_lease, args=(app, job_id, stop), name=f"ai-job-{job_id}-lease", daemon=True
+            ).start()
+            job = db.session.get(AiAnalysisJob, job_id)
+            user_id, site_url = job.site.user_id, job.site.site_url
+
+            service, credentials, creds = get_user_gsc_service(user_id)
+            if service is None:
+                _finish(job, "not_connected")
+                return
+            try:
+                data = build_insights(
+                    service, site_url, days=28, user_id=user_id,
+                    max_pages=site_budget(user_id, site_url)[0],
+                )
+                analyze_site(user_id, site_url, data["pages"])
+            except DeepSeekError as e:
+                app.logger.warning("DeepSeek analyze failed: %s", e)
+                db.session.rollback()
+                _finish(job, "ai_failed", str(e))
+                return
+            except Exception as e:
+                app.logger.exception("AI analyze failed for %s", site_url)
+                db.session.rollback()
+                _finish(job, "query_failed", f"{type(e).__name__}: {e}")
+                return
+            save_if_refreshed(user_id, creds, credentials)
+            _finish(job)
+        finally:
+            stop.set()
+            db.session.remove()
+
+
+def run_pending_jobs():
+    """Giro dello scheduler: chiude i job bloccati, poi esegue quelli in coda
+    da più di ORPHAN_SECONDS e riprende quelli con la lease scaduta. Da
+    chiamare dentro un app context."""
+    now = _utcnow()
+    AiAnalysisJob.query.filter(
+        AiAnalysisJob.status == "running",
+        or_(
+            AiAnalysisJob.started_at < now - timedelta(minutes=JOB_TIMEOUT_MINUTES),
+            and_(_expired(now), AiAnalysisJob.attempts >= MAX_ATTEMPTS),
+        ),
+    ).update(
+        {"status": "failed", "error": "timeout", "finished_at": now}, synchronize_session=False
+    )
+    db.session.commit()
+
+    job_ids = [
+        job_id
+        for (job_id,) in db.session.query(AiAnalysisJob.id)
+        .filter(
+            or_(
+                and_(
+                    AiAnalysisJob.status == "queued",
+                    AiAnalysisJob.created_at < now - timedelta(seconds=ORPHAN_SECONDS),
+                ),
+                _expired(now),
+            )
+        )
+        .order_by(AiAnalysisJob.id)
+        .all()
+    ]
+    app = current_app._get_current_object()
+    for job_id in job_ids:
+        run_job(app, job_id)
+    return len(job_ids)
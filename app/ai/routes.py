@@ -1,30 +1,56 @@
 """Route AI Analyzer (JSON). CSRF: le POST richiedono l'header X-CSRFToken
-(Flask-WTF), che il frontend legge dal <meta name="csrf-token">."""
-from flask import Blueprint, current_app, jsonify, request
+(Flask-WTF), che il frontend legge dal <meta name="csrf-token">.
+
+L'analisi è asincrona: /analyze accoda un job (app/ai/jobs.py) e risponde
+202; /jobs/<id>?since=<cursore> ne dà lo stato e le pagine nuove."""
+from datetime import datetime, timedelta
+
+from flask import Blueprint, jsonify, request
 from flask_login import current_user, login_required
 
-from app.ai.deepseek import DeepSeekError
+from app.ai.jobs import active_job, enqueue_analysis, job_as_dict
 from app.ai.service import (
     _cooldown_remaining,
-    analyze_site,
+    analyses_since,
     get_or_create_config,
     get_status,
+    score_history,
     set_enabled,
 )
-from app.gsc.gsc import get_user_gsc_service
-from app.gsc.insights import build_insights
-from app.gsc.repository import credentials_to_dict, save_gsc_credentials
+from app.gsc.repository import load_gsc_credentials
+from app.gsc.site_ids import get_site_id
+from app.models import AiAnalysisJob, Site
 
 ai_bp = Blueprint("ai", __name__, url_prefix="/ai")
 
 
+def _site_id(site):
+    """Id del sito se l'utente ce l'ha nel registro (property verificata o
+    già sincronizzata). Le route che scrivono rifiutano gli altri: un `site`
+    qualsiasi non deve lasciare righe."""
+    return get_site_id(current_user.id, site)
+
+
 @ai_bp.route("/status")
 @login_required
 def status():
     site = request.args.get("site")
     if not site:
         return jsonify({"error": "missing_site"}), 400
-    return jsonify(get_status(current_user.id, site))
+    data = get_status(current_user.id, site)
+    data["job"] = job_as_dict(active_job(current_user.id, site))
+    return jsonify(data)
+
+
+@ai_bp.route("/history")
+@login_required
+def history():
+    """Trend settimanale dello score AI per pagina (?site=<siteUrl>&weeks=N)."""
+    site = request.args.get("site")
+    if not site:
+        return jsonify({"error": "missing_site"}), 400
+    weeks = min(max(request.args.get("weeks", 12, type=int), 1), 52)
+    return jsonify({"history": score_history(current_user.id, site, weeks)})
 
 
 @ai_bp.route("/toggle", methods=["POST"])
@@ -33,6 +59,8 @@ def toggle():
     site = request.form.get("site")
     if not site:
         return jsonify({"error": "missing_site"}), 400
+    if _site_id(site) is None:
+        return jsonify({"error": "unknown_site"}), 404
     enabled = request.form.get("enabled") == "true"
     set_enabled(current_user.id, site, enabled)
     return jsonify(get_status(current_user.id, site))
@@ -44,6 +72,8 @@ def analyze():
     site = request.form.get("site")
     if not site:
         return jsonify({"error": "missing_site"}), 400
+    if _site_id(site) is None:
+        return jsonify({"error": "unknown_site"}), 404
 
     cfg = get_or_create_config(current_user.id, site)
     if not cfg.enabled:
@@ -53,19 +83,43 @@ def analyze():
     if remaining > 0:
         return jsonify({"error": "cooldown", "days_left": remaining}), 429
 
-    service, credentials = get_user_gsc_service(current_user.id)
-    if service is None:
+    if not load_gsc_credentials(current_user.id):
         return jsonify({"error": "not_connected"}), 401
 
-    try:
-        data = build_insights(service, site, days=28)
-        analyze_site(current_user.id, site, data["pages"])
-    except DeepSeekError as e:
-        current_app.logger.warning("DeepSeek analyze failed: %s", e)
-        return jsonify({"error": "ai_failed", "message": str(e)}), 502
-    except Exception:
-        current_app.logger.exception("AI analyze failed for %s", site)
-        return jsonify({"error": "query_failed"}), 502
-
-    save_gsc_credentials(current_user.id, credentials_to_dict(credentials))
-    return jsonify(get_status(current_user.id, site))
+    # Se per il sito c'è già un job attivo, ritorna quello invece di accodarne un altro.
+    data = job_as_dict(enqueue_analysis(current_user.id, site))
+    return jsonify(data), 202, {"Location": data["url"]}
+
+
+# Le pagine si chiedono da un po' prima del cursore: uno shard può scrivere
+# con un created_at di poco precedente a quello di una pagina già letta
+# (calcolato prima, committato dopo). I doppioni li scarta il client per url.
+CURSOR_OVERLAP = timedelta(seconds=5)
+
+
+def _own_job(job_id):
+    return (
+        AiAnalysisJob.query.join(Site)
+        .filter(AiAnalysisJob.id == job_id, Site.user_id == current_user.id)
+        .first()
+    )
+
+
+@ai_bp.route("/jobs/<int:job_id>")
+@login_required
+def job(job_id):
+    """Stato del job e pagine già analizzate. La UI lo interroga ogni
+    JOB_POLL_MS finché il job è attivo, ripassando in `since` il `cursor`
+    della risposta precedente: ogni richiesta è una query breve, nessun
+    thread resta occupato ad aspettare il job."""
+    job = _own_job(job_id)
+    if job is None:
+        return jsonify({"error": "not_found"}), 404
+    since = job.created_at
+    if request.args.get("since"):
+        try:
+            since = datetime.fromisoformat(request.args["since"]) - CURSOR_OVERLAP
+        except ValueError:
+            return jsonify({"error": "bad_cursor"}), 400
+    pages, cursor = analyses_since(job.site.user_id, job.site.site_url, since)
+    return jsonify({**job_as_dict(job), "pages": pages, "cursor": cursor.isoformat()})
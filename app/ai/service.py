@@ -1,21 +1,67 @@
 """Orchestrazione dell'AI Analyzer.
 
-Strategia (per contenere il costo): UNA sola chiamata DeepSeek per sito, con un
-contesto compatto delle pagine più rilevanti, e una risposta JSON dettagliata
-per pagina (score 0-100 + max 5 suggerimenti). Cadenza settimanale, e solo se
-l'utente ha attivato lo switch. I risultati si salvano in AiPageAnalysis.
+Strategia (per contenere il costo): contesto compatto delle pagine più
+rilevanti e una risposta JSON dettagliata per pagina (score 0-100 + max 5
+suggerimenti). Cadenza settimanale, e solo se l'utente ha attivato lo switch.
+
+Il budget di un run (`site_budget`: pagine e token stimati) viene dalla riga
+AiBudget del sito, poi da quella globale, poi da Config. Sui siti grandi le
+pagine si dividono in shard dimensionati con una stima dei token
+(`_plan_shards`): input + output entro AI_SHARD_TOKENS, e output entro il
+max_tokens della singola chiamata. Gli shard partono in parallelo
+(AI_SHARD_WORKERS, e comunque sotto il semaforo del client DeepSeek) e ogni
+pagina si salva appena arriva: con DEEPSEEK_STREAM la risposta si legge in
+streaming, quindi la prima pagina è in DB (e nella UI, al poll successivo del
+job) dopo la sua generazione, non a fine shard; le successive si scrivono a
+blocchi (STREAM_FLUSH_PAGES pagine o STREAM_FLUSH_SECONDS secondi), con una
+transazione per blocco invece di tre per pagina. Uno shard fallito non butta
+gli altri. Le pagine oltre il budget di token restano al run successivo. I
+risultati si salvano in AiPageAnalysis (ultimo run) e in AiPageAnalysisWeek
+(storico per settimana, per i trend).
+
+Ogni pagina compattata ha un'impronta (`_fingerprint`: URL + metriche
+arrotondate a una tolleranza): se è già in AiResultCache, la pagina riusa
+score e suggerimenti salvati e non entra nel prompt. Su un sito stabile il run
+settimanale manda a DeepSeek solo le pagine cambiate (o nessuna).
 """
+import hashlib
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, datetime, timedelta, timezone
 
-from app.ai.deepseek import chat_json
+from flask import current_app
+from sqlalchemy import or_
+
+from app.ai.deepseek import DeepSeekError, chat_json, stream_json_items
 from app.extensions import db
-from app.models import AiAnalyzerConfig, AiPageAnalysis
+from app.gsc.history import bulk_upsert
+from app.gsc.site_ids import get_site_id
+from app.models import AiAnalyzerConfig, AiBudget, AiPageAnalysis, AiPageAnalysisWeek, AiResultCache
 
-MAX_PAGES = 25          # pagine inviate al prompt (limite costo/token)
 MAX_SUGGESTIONS = 5
 SUGGESTION_MAXLEN = 200
 RUN_COOLDOWN_DAYS = 7   # una vera analisi a settimana
 
+# Tolleranze dell'impronta: entro questi scarti la pagina è "la stessa".
+COUNT_TOLERANCE = 0.10  # click/impressioni: bucket logaritmici del 10%
+CTR_STEP = 0.5          # punti percentuali di CTR
+POSITION_STEP = 1.0     # posizione media
+CHANGE_STEP = 10.0      # punti percentuali di variazione click
+CACHE_MAX_AGE_DAYS = 90  # oltre, il consiglio si rigenera anche a metriche ferme
+
+# Stima dei token per dimensionare gli shard (nessun tokenizer: ~4 caratteri
+# per token sul testo inglese/JSON, e lo score + 5 suggerimenti di una pagina
+# in risposta stanno sotto OUTPUT_TOKENS_PER_PAGE).
+CHARS_PER_TOKEN = 4
+OUTPUT_TOKENS_PER_PAGE = 250
+MAX_OUTPUT_TOKENS = 4000  # max_tokens di ogni chiamata
+
+# Scrittura delle pagine in streaming: a blocchi, ma mai più vecchi di così.
+STREAM_FLUSH_PAGES = 4
+STREAM_FLUSH_SECONDS = 2.0
+
 SYSTEM_PROMPT = (
     "You are a senior technical SEO consultant. You receive Google Search Console "
     "metrics for a set of pages from one website and must return concrete, "
@@ -32,9 +78,13 @@ SYSTEM_PROMPT = (
 
 
 def get_or_create_config(user_id, site_url):
-    cfg = AiAnalyzerConfig.query.filter_by(user_id=user_id, site_url=site_url).first()
+    """Config AI del sito, creata spenta al primo accesso. Il sito deve essere
+    già registrato (property verificata o sincronizzata): le route lo
+    controllano prima, vedi app/ai/routes.py `_site_id`."""
+    site_id = get_site_id(user_id, site_url)
+    cfg = AiAnalyzerConfig.query.filter_by(site_id=site_id).first()
     if cfg is None:
-        cfg = AiAnalyzerConfig(user_id=user_id, site_url=site_url, enabled=False)
+        cfg = AiAnalyzerConfig(site_id=site_id, enabled=False)
         db.session.add(cfg)
         db.session.commit()
     return cfg
@@ -47,6 +97,18 @@ def set_enabled(user_id, site_url, enabled: bool):
     return cfg
 
 
+def site_budget(user_id, site_url):
+    """(pagine, token stimati) per un run sul sito: riga AiBudget del sito,
+    poi quella globale, poi AI_MAX_PAGES_PER_SITE / AI_MAX_TOKENS_PER_SITE."""
+    site_id = get_site_id(user_id, site_url)
+    rows = AiBudget.query.filter(or_(AiBudget.site_id.is_(None), AiBudget.site_id == site_id)).all()
+    rows.sort(key=lambda r: r.site_id is None)  # prima il sito, poi il default
+    config = current_app.config
+    max_pages = next((r.max_pages for r in rows if r.max_pages is not None), config["AI_MAX_PAGES_PER_SITE"])
+    max_tokens = next((r.max_tokens for r in rows if r.max_tokens is not None), config["AI_MAX_TOKENS_PER_SITE"])
+    return max_pages, max_tokens
+
+
 def _cooldown_remaining(cfg):
     """Giorni mancanti al prossimo run consentito (0 se disponibile ora)."""
     if not cfg.last_run_at:
@@ -60,9 +122,9 @@ def _week_start(d: date) -> date:
     return d - timedelta(days=d.weekday())
 
 
-def _compact_pages(pages):
+def _compact_pages(pages, limit):
     """Riduce le pagine al minimo informativo per il prompt (meno token)."""
-    subset = pages[:MAX_PAGES]
+    subset = pages[:limit]
     return [
         {
             "url": p["url"],
@@ -78,74 +140,311 @@ def _compact_pages(pages):
     ]
 
 
-def analyze_site(user_id, site_url, pages):
-    """Esegue l'analisi AI e salva i risultati. Ritorna la mappa url->risultato.
-    Solleva DeepSeekError se la chiamata fallisce o non è configurata."""
-    compact = _compact_pages(pages)
-    known_urls = {p["url"] for p in compact}
+_PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode()).hexdigest()[:16]
+
+
+def _count_bucket(n):
+    return int(math.log1p(max(0, n)) / math.log1p(COUNT_TOLERANCE))
+
+
+def _fingerprint(site_url, page):
+    """Impronta di una pagina compattata: cambia solo se le metriche escono
+    dalla tolleranza (o cambia il prompt di sistema)."""
+    change = page["clicks_change_pct"]
+    material = [
+        _PROMPT_VERSION,
+        site_url,
+        page["url"],
+        _count_bucket(page["clicks"]),
+        _count_bucket(page["impressions"]),
+        round(page["ctr_pct"] / CTR_STEP),
+        round(page["avg_position"] / POSITION_STEP),
+        None if change is None else round(change / CHANGE_STEP),
+    ]
+    return hashlib.sha256(json.dumps(material).encode()).hexdigest()
+
+
+def _cached_results(fingerprints):
+    """{impronta: (score, suggerimenti)} per le impronte già analizzate di recente."""
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=CACHE_MAX_AGE_DAYS)
+    rows = AiResultCache.query.filter(
+        AiResultCache.fingerprint.in_(fingerprints), AiResultCache.created_at >= since
+    ).all()
+    return {r.fingerprint: (r.score, r.suggestions or []) for r in rows}
 
-    user_prompt = (
+
+def _store_results(results):
+    """Salva {impronta: (score, suggerimenti)} appena ottenuti da DeepSeek.
+    Upsert: due utenti dello stesso sito possono produrre la stessa impronta.
+    Il commit lo fa il chiamante."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    bulk_upsert(
+        AiResultCache,
+        [
+            {"fingerprint": fp, "score": score, "suggestions": suggestions, "created_at": now}
+            for fp, (score, suggestions) in results.items()
+        ],
+        key=("fingerprint",),
+        compare=(),
+        commit=False,
+    )
+
+
+def _parse_item(item, known_urls):
+    """(url, (score, suggerimenti)) da un oggetto pagina DeepSeek validato, o
+    None se l'url non era nel prompt (allucinato) o l'oggetto non è valido."""
+    if not isinstance(item, dict):
+        return None
+    url = item.get("url")
+    if url not in known_urls:
+        return None
+
+    score = item.get("score", 0)
+    try:
+        score = max(0, min(100, int(score)))
+    except (TypeError, ValueError):
+        score = 0
+
+    suggestions = [
+        str(s).strip()[:SUGGESTION_MAXLEN]
+        for s in (item.get("suggestions") or [])
+        if str(s).strip()
+    ][:MAX_SUGGESTIONS]
+    return url, (score, suggestions)
+
+
+def _parse_result(result, known_urls):
+    """{url: (score, suggerimenti)} dalla risposta DeepSeek, validata."""
+    parsed = (_parse_item(item, known_urls) for item in result.get("pages", []))
+    return dict(p for p in parsed if p is not None)
+
+
+def _estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _user_prompt(site_url, pages):
+    return (
         f"Website: {site_url}\n"
         f"Pages (last 28 days vs previous 28 days):\n"
-        f"{compact}\n\n"
+        f"{pages}\n\n"
         "Return the JSON described in the system prompt."
     )
 
-    result = chat_json(SYSTEM_PROMPT, user_prompt)
 
-    week = _week_start(date.today())
-    stored = {}
-    for item in result.get("pages", []):
-        url = item.get("url")
-        if url not in known_urls:
-            continue  # ignora url che l'AI non ha ricevuto (allucinati)
+def _plan_shards(site_url, pages, shard_tokens, site_tokens):
+    """Divide le pagine (già in ordine di priorità) in shard: token stimati
+    (input + output) entro `shard_tokens`, al più MAX_OUTPUT_TOKENS di
+    risposta. Si ferma a `site_tokens` in totale. Ritorna (shard, pagine
+    escluse dal budget del sito)."""
+    overhead = _estimate_tokens(SYSTEM_PROMPT) + _estimate_tokens(_user_prompt(site_url, []))
+    per_shard_pages = max(1, MAX_OUTPUT_TOKENS // OUTPUT_TOKENS_PER_PAGE)
+    shards, current, current_tokens, spent = [], [], overhead, 0
+    for i, page in enumerate(pages):
+        cost = _estimate_tokens(repr(page)) + OUTPUT_TOKENS_PER_PAGE
+        if current and (current_tokens + cost > shard_tokens or len(current) >= per_shard_pages):
+            shards.append(current)
+            current, current_tokens = [], overhead
+        extra = cost + (0 if current else overhead)  # il primo dello shard paga anche il prompt
+        if spent + extra > site_tokens:
+            if current:
+                shards.append(current)
+            return shards, pages[i:]
+        spent += extra
+        current.append(page)
+        current_tokens += cost
+    if current:
+        shards.append(current)
+    return shards, []
+
 
-        score = item.get("score", 0)
+def _run_shard(app, user_id, site_url, shard, fingerprints, week):
+    """Analizza uno shard nel thread del pool, con app context (e sessione DB)
+    propri. In streaming (DEEPSEEK_STREAM) le pagine si salvano a blocchi man
+    mano che il modello le completa (la prima subito, da sola); altrimenti a
+    risposta finita. Ritorna (risultati, errore o None): le pagine già
+    arrivate si salvano anche se lo stream cade."""
+    with app.app_context():
+        known_urls = {p["url"] for p in shard}
+        prompt = _user_prompt(site_url, shard)
+        fresh, pending, flushed_at = {}, {}, None
         try:
-            score = max(0, min(100, int(score)))
-        except (TypeError, ValueError):
-            score = 0
-
-        suggestions = [
-            str(s).strip()[:SUGGESTION_MAXLEN]
-            for s in (item.get("suggestions") or [])
-            if str(s).strip()
-        ][:MAX_SUGGESTIONS]
-
-        row = AiPageAnalysis.query.filter_by(
-            user_id=user_id, site_url=site_url, page_url=url
-        ).first()
-        if row is None:
-            row = AiPageAnalysis(user_id=user_id, site_url=site_url, page_url=url)
-            db.session.add(row)
-        row.score = score
-        row.suggestions = suggestions
-        row.week_start = week
-
-        stored[url] = {"score": score, "suggestions": suggestions, "week_start": week.isoformat()}
+            if app.config["DEEPSEEK_STREAM"]:
+                for item in stream_json_items(SYSTEM_PROMPT, prompt, max_tokens=MAX_OUTPUT_TOKENS):
+                    parsed = _parse_item(item, known_urls)
+                    if parsed is None or parsed[0] in fresh:
+                        continue
+                    url, value = parsed
+                    fresh[url] = pending[url] = value
+                    if (
+                        flushed_at is None
+                        or len(pending) >= STREAM_FLUSH_PAGES
+                        or time.monotonic() - flushed_at >= STREAM_FLUSH_SECONDS
+                    ):
+                        _persist(user_id, site_url, pending, fingerprints, week)
+                        pending, flushed_at = {}, time.monotonic()
+            else:
+                result = chat_json(SYSTEM_PROMPT, prompt, max_tokens=MAX_OUTPUT_TOKENS)
+                fresh = pending = _parse_result(result, known_urls)
+        except DeepSeekError as e:
+            app.logger.warning("AI %s: shard fallito dopo %d pagine: %s", site_url, len(fresh), e)
+            _persist(user_id, site_url, pending, fingerprints, week)
+            return fresh, e
+        _persist(user_id, site_url, pending, fingerprints, week)
+        return fresh, None
 
-    cfg = get_or_create_config(user_id, site_url)
-    cfg.last_run_at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _persist(user_id, site_url, results, fingerprints, week):
+    """Salva un blocco di risultati (cache delle impronte e pagine) in una
+    transazione."""
+    if not results:
+        return
+    _store_results({fingerprints[url]: value for url, value in results.items()})
+    _save_pages(user_id, site_url, results, week, datetime.now(timezone.utc).replace(tzinfo=None))
     db.session.commit()
 
-    return stored
+
+def _save_pages(user_id, site_url, results, week, now):
+    """Scrive {url: (score, suggerimenti)}: un upsert per tabella, fotografia
+    corrente + storico della settimana. `suggestions` è JSON: si aggiorna
+    senza confronto. Il commit lo fa il chiamante."""
+    site_id = get_site_id(user_id, site_url)
+    rows = [
+        {
+            "site_id": site_id,
+            "page_url": url,
+            "week_start": week,
+            "score": score,
+            "suggestions": suggestions,
+            "created_at": now,
+        }
+        for url, (score, suggestions) in results.items()
+    ]
+    bulk_upsert(AiPageAnalysis, rows, key=("site_id", "page_url"), compare=(), commit=False)
+    bulk_upsert(AiPageAnalysisWeek, rows, key=("site_id", "page_url", "week_start"), compare=(), commit=False)
+
+
+def analyze_site(user_id, site_url, pages):
+    """Esegue l'analisi AI e salva i risultati. Ritorna la mappa url->risultato.
+    Le pagine con impronta già in cache non vanno a DeepSeek; le altre vanno a
+    shard in parallelo, salvati man mano. Solleva DeepSeekError se DeepSeek non
+    è configurato o se falliscono tutti gli shard; se ne fallisce solo una
+    parte, i risultati degli altri restano e il cooldown non scatta, così un
+    nuovo run rimanda solo le pagine mancanti."""
+    config = current_app.config
+    max_pages, max_tokens = site_budget(user_id, site_url)
+    compact = _compact_pages(pages, max_pages)
+    fingerprints = {p["url"]: _fingerprint(site_url, p) for p in compact}
+    cached = _cached_results(list(fingerprints.values()))
+
+    week = _week_start(date.today())
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    results = {url: cached[fp] for url, fp in fingerprints.items() if fp in cached}
+    cached_urls = set(results)
+    _save_pages(user_id, site_url, results, week, now)
+    db.session.commit()
+
+    changed = [p for p in compact if p["url"] not in results]
+    shards, over_budget = _plan_shards(
+        site_url, changed, config["AI_SHARD_TOKENS"], max_tokens
+    )
+    if over_budget:
+        current_app.logger.info(
+            "AI %s: %d pagine oltre il budget di token, rimandate al prossimo run", site_url, len(over_budget)
+        )
+
+    errors = []
+    if shards:
+        app = current_app._get_current_object()
+        workers = min(len(shards), config["AI_SHARD_WORKERS"])
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-shard") as pool:
+            futures = [
+                pool.submit(_run_shard, app, user_id, site_url, shard, fingerprints, week)
+                for shard in shards
+            ]
+            for future in as_completed(futures):
+                fresh, error = future.result()
+                results.update(fresh)
+                if error is not None:
+                    errors.append(error)
+        if len(errors) == len(shards) and len(results) == len(cached_urls):
+            raise errors[0]
+
+    if not errors:
+        cfg = get_or_create_config(user_id, site_url)
+        cfg.last_run_at = now
+        db.session.commit()
+
+    return {
+        url: {"score": score, "suggestions": suggestions, "week_start": week.isoformat()}
+        for url, (score, suggestions) in results.items()
+    }
+
+
+def _analysis_dict(score, suggestions, week_start):
+    return {
+        "score": score,
+        "suggestions": suggestions or [],
+        "week_start": week_start.isoformat() if week_start else None,
+    }
+
+
+def latest_analyses(user_id, site_url):
+    """Ultimo risultato per pagina: AiPageAnalysis ne tiene uno per pagina,
+    quindi è una sola query sull'indice (site_id, page_url), che
+    legge solo le colonne che servono (niente oggetti ORM)."""
+    rows = db.session.query(
+        AiPageAnalysis.page_url,
+        AiPageAnalysis.score,
+        AiPageAnalysis.suggestions,
+        AiPageAnalysis.week_start,
+    ).filter(AiPageAnalysis.site_id == get_site_id(user_id, site_url))
+    return {page_url: _analysis_dict(*values) for page_url, *values in rows}
+
+
+def analyses_since(user_id, site_url, since):
+    """Pagine scritte dopo `since` e il nuovo cursore: il created_at più
+    recente tra quelle lette (`since` se non ce ne sono). Lo usa il polling
+    del job (/ai/jobs/<id>?since=...), che chiede solo le pagine nuove."""
+    rows = db.session.query(
+        AiPageAnalysis.page_url,
+        AiPageAnalysis.score,
+        AiPageAnalysis.suggestions,
+        AiPageAnalysis.week_start,
+        AiPageAnalysis.created_at,
+    ).filter(AiPageAnalysis.site_id == get_site_id(user_id, site_url), AiPageAnalysis.created_at > since)
+    pages, cursor = {}, since
+    for page_url, score, suggestions, week_start, created_at in rows:
+        pages[page_url] = _analysis_dict(score, suggestions, week_start)
+        cursor = max(cursor, created_at)
+    return pages, cursor
+
+
+def score_history(user_id, site_url, weeks=12):
+    """Trend dello score per pagina sulle ultime `weeks` settimane:
+    {url: [{"week_start", "score"}, ...]} in ordine cronologico, da una query
+    sull'indice (site_id, week_start)."""
+    since = _week_start(date.today()) - timedelta(weeks=weeks - 1)
+    rows = (
+        db.session.query(AiPageAnalysisWeek.page_url, AiPageAnalysisWeek.week_start, AiPageAnalysisWeek.score)
+        .filter(
+            AiPageAnalysisWeek.site_id == get_site_id(user_id, site_url),
+            AiPageAnalysisWeek.week_start >= since,
+        )
+        .order_by(AiPageAnalysisWeek.week_start)
+    )
+    history = {}
+    for page_url, week_start, score in rows:
+        history.setdefault(page_url, []).append({"week_start": week_start.isoformat(), "score": score})
+    return history
 
 
 def get_status(user_id, site_url):
     """Stato AI per la UI: switch, ultimo run, cooldown, risultati salvati."""
-    cfg = AiAnalyzerConfig.query.filter_by(user_id=user_id, site_url=site_url).first()
-    rows = AiPageAnalysis.query.filter_by(user_id=user_id, site_url=site_url).all()
-    analyses = {
-        r.page_url: {
-            "score": r.score,
-            "suggestions": r.suggestions or [],
-            "week_start": r.week_start.isoformat() if r.week_start else None,
-        }
-        for r in rows
-    }
+    cfg = AiAnalyzerConfig.query.filter_by(site_id=get_site_id(user_id, site_url)).first()
     return {
         "enabled": bool(cfg and cfg.enabled),
         "last_run_at": cfg.last_run_at.isoformat() if cfg and cfg.last_run_at else None,
         "cooldown_days_left": _cooldown_remaining(cfg) if cfg else 0,
-        "analyses": analyses,
+        "analyses": latest_analyses(user_id, site_url),
     }
@@ -2,11 +2,11 @@
 
 Vengono create qui senza `app` e agganciate all'app con `.init_app(app)`
 dentro `create_app()` (app/__init__.py). Qualunque modulo può importare
-`db`, `login_manager`, `csrf` o `admin` da qui senza dipendere dalla factory.
+`db`, `login_manager` o `csrf` da qui senza dipendere dalla factory.
+Flask-Admin (e il suo `admin`) sta in app/admin/: lo carica solo l'app web,
+non chi importa `db` per lavorare sul DB.
 """
 from flask import redirect, url_for
-from flask_admin import Admin, AdminIndexView
-from flask_admin.theme import Bootstrap4Theme
 from flask_login import LoginManager, current_user
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import CSRFProtect
@@ -27,14 +27,3 @@ class AdminAuthMixin:
 
     def inaccessible_callback(self, name, **kwargs):
         return redirect(url_for("auth.login"))
-
-
-class SecureAdminIndexView(AdminAuthMixin, AdminIndexView):
-    pass
-
-
-admin = Admin(
-    name="LinkBayCMS",
-    theme=Bootstrap4Theme(swatch="flatly"),
-    index_view=SecureAdminIndexView(),
-)
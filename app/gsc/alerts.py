@@ -0,0 +1,27 @@
+"""Pagine in calo di un sito: rollup mensili per pagina (app/gsc/monthly.py)
+valutati dal rule engine (app/rules/) con le soglie del sito.
+
+Qui sta tutto quello che tocca il DB, così app/rules/ resta puro.
+"""
+from sqlalchemy import or_
+
+from app.gsc.monthly import get_page_series
+from app.gsc.site_ids import get_site_id
+from app.models import RuleThresholds
+from app.rules import evaluate_site, resolve
+
+
+def load_thresholds(user_id, site_url):
+    """Soglie effettive del sito: default del codice, riga globale, riga del sito."""
+    site_id = get_site_id(user_id, site_url)
+    rows = RuleThresholds.query.filter(
+        or_(RuleThresholds.site_id.is_(None), RuleThresholds.site_id == site_id)
+    ).all()
+    default = next((r for r in rows if r.site_id is None), None)
+    site = next((r for r in rows if r.site_id is not None), None)
+    return resolve(default, site)
+
+
+def evaluate_site_pages(user_id, site_url):
+    """Evaluation (app/rules/types.py) delle pagine del sito sugli ultimi mesi conclusi."""
+    return evaluate_site(get_page_series(user_id, site_url), load_thresholds(user_id, site_url))
@@ -0,0 +1,70 @@
+"""Cache delle risposte di /gsc/api/insights.
+
+Il payload per (utente, sito, giorni) cambia solo quando arrivano dati GSC
+nuovi — poche volte al giorno — ma ogni apertura e ogni cambio di periodo lo
+ricalcolava da capo. Qui si conserva già serializzato in un FileSystemCache
+(cachelib) su una cartella condivisa tra i worker, con soglia di voci e
+scadenza come politica di eviction.
+
+La versione dei dati è `GscSyncState.data_version`, che i sync incrementano
+solo quando scrivono righe nuove o cambiate: entra nell'ETag (così il browser
+riceve 304 senza che il server ricalcoli nulla) e nel controllo della voce in
+cache. `invalidate_insights` rimuove subito le voci di un sito quando un sync
+scrive, invece di lasciarle scadere.
+"""
+import hashlib
+import json
+import threading
+from datetime import date
+
+from cachelib import FileSystemCache
+from flask import current_app
+
+PERIODS = (7, 28, 90)  # gli stessi ALLOWED_PERIODS della route
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _cache():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = current_app.config
+                _backend = FileSystemCache(
+                    config["INSIGHTS_CACHE_DIR"],
+                    threshold=config["INSIGHTS_CACHE_THRESHOLD"],
+                    default_timeout=config["INSIGHTS_CACHE_TIMEOUT"],
+                )
+    return _backend
+
+
+def _key(user_id, site_url, days):
+    return f"insights:{user_id}:{hashlib.sha1(site_url.encode()).hexdigest()}:{days}"
+
+
+def insights_etag(user_id, site_url, days, data_version):
+    """ETag della risposta: cambia con la versione dei dati e con il giorno
+    (le finestre della vista scorrono a mezzanotte)."""
+    raw = f"{user_id}|{site_url}|{days}|{data_version}|{date.today().isoformat()}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def get_cached_insights(user_id, site_url, days, etag):
+    """Payload JSON già serializzato, se in cache per questa versione dei dati."""
+    entry = _cache().get(_key(user_id, site_url, days))
+    if entry is None or entry[0] != etag:
+        return None
+    return entry[1]
+
+
+def store_insights(user_id, site_url, days, etag, data):
+    """Serializza e salva il payload; ritorna il JSON, da usare come body."""
+    body = json.dumps(data, separators=(",", ":"))
+    _cache().set(_key(user_id, site_url, days), (etag, body))
+    return body
+
+
+def invalidate_insights(user_id, site_url):
+    _cache().delete_many(*(_key(user_id, site_url, days) for days in PERIODS))
@@ -0,0 +1,89 @@
+"""Client Search Console condiviso dal processo.
+
+`googleapiclient.discovery.build` a ogni richiesta rilegge e riparsa il
+documento di discovery (~40 KB di JSON) e crea un nuovo `httplib2.Http`, cioè
+una nuova connessione TLS verso Google. Qui il documento statico incluso nella
+libreria (nessun fetch di rete) si parsa una volta per worker; ogni richiesta
+aggancia solo le credenziali dell'utente a un trasporto riusato dal thread.
+
+Le librerie Google (~100 ms di import) si caricano al primo uso, non
+all'avvio: vedi `DEFERRED_IMPORTS` in app/__init__.py.
+"""
+import json
+import threading
+
+API_SERVICE_NAME = "searchconsole"
+API_VERSION = "v1"
+HTTP_TIMEOUT = 20  # secondi, timeout di socket per ogni chiamata a Google
+
+_document = None
+_document_lock = threading.Lock()
+_local = threading.local()
+
+
+def _warm_up(resource, desc):
+    # build_from_document completa il documento in place (parametri comuni)
+    # la prima volta che crea i metodi di ogni risorsa: istanziarle tutte ora,
+    # sotto lock, rende il dict di sola lettura per i thread che lo condividono.
+    for name, sub in desc.get("resources", {}).items():
+        _warm_up(getattr(resource, name)(), sub)
+
+
+def _discovery_document():
+    global _document
+    if _document is None:
+        import googleapiclient.discovery
+        import httplib2
+        from googleapiclient.discovery_cache import get_static_doc
+
+        with _document_lock:
+            if _document is None:
+                doc = json.loads(get_static_doc(API_SERVICE_NAME, API_VERSION))
+                _warm_up(googleapiclient.discovery.build_from_document(doc, http=httplib2.Http()), doc)
+                _document = doc
+    return _document
+
+
+def _transport():
+    """httplib2.Http del thread corrente: non è thread-safe, ma riusato dallo
+    stesso thread tiene viva la connessione keep-alive verso Google."""
+    http = getattr(_local, "http", None)
+    if http is None:
+        import httplib2
+
+        http = _local.http = httplib2.Http(timeout=HTTP_TIMEOUT)
+    return http
+
+
+def authorized_http(credentials):
+    """Trasporto autenticato per il thread corrente (refresh token incluso)."""
+    import google_auth_httplib2
+
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=_transport())
+
+
+def refresh_request():
+    """Richiesta google-auth per rinfrescare un token sul trasporto del thread."""
+    import google_auth_httplib2
+
+    return google_auth_httplib2.Request(_transport())
+
+
+def build_service(credentials):
+    """Service Search Console per le credenziali date. Da usare nel thread che
+    lo crea: per le chiamate da altri thread passare `http=authorized_http(...)`
+    a execute()."""
+    import googleapiclient.discovery
+
+    return googleapiclient.discovery.build_from_document(
+        _discovery_document(), http=authorized_http(credentials)
+    )
+
+
+def verified_sites(service):
+    """Property dell'account su cui l'utente ha permessi (non solo "unverified")."""
+    site_list = service.sites().list().execute()
+    return [
+        s for s in site_list.get("siteEntry", [])
+        if s["permissionLevel"] != "siteUnverifiedUser"
+    ]
@@ -1,8 +1,18 @@
 """Cifratura simmetrica (Fernet) per i token OAuth salvati in DB.
 
-Chiave letta da TOKEN_ENCRYPTION_KEY (config/.env). Non è mai hardcoded.
+Chiavi lette da config/.env, mai hardcoded: TOKEN_ENCRYPTION_KEY è la
+primaria (cifra tutto ciò che si salva), TOKEN_ENCRYPTION_OLD_KEYS le
+eventuali chiavi ritirate, separate da virgola, che servono ancora a
+decifrare i token salvati prima di una rotazione. Insieme formano un
+MultiFernet costruito una volta per processo.
+
+Rotazione: nuova chiave in TOKEN_ENCRYPTION_KEY, la vecchia in
+TOKEN_ENCRYPTION_OLD_KEYS, poi `flask rotate-token-key` ricifra i token a
+blocchi (app/gsc/repository.py); finito il giro, la vecchia si può togliere.
 """
-from cryptography.fernet import Fernet, InvalidToken
+from functools import lru_cache
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from flask import current_app
 
 
@@ -10,30 +20,54 @@ class MissingEncryptionKey(RuntimeError):
     pass
 
 
-def _fernet() -> Fernet:
-    key = current_app.config.get("TOKEN_ENCRYPTION_KEY")
+def _keyring() -> tuple[Fernet, MultiFernet]:
+    config = current_app.config
+    key = config.get("TOKEN_ENCRYPTION_KEY")
     if not key:
         raise MissingEncryptionKey(
             "TOKEN_ENCRYPTION_KEY non impostata. Generane una con: "
             'python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())" '
             "e mettila in .env."
         )
-    return Fernet(key.encode() if isinstance(key, str) else key)
+    return _keyring_for(key, config.get("TOKEN_ENCRYPTION_OLD_KEYS") or "")
+
+
+@lru_cache(maxsize=4)
+def _keyring_for(key: str | bytes, old_keys: str) -> tuple[Fernet, MultiFernet]:
+    # Un keyring per combinazione di chiavi e per processo, non uno a ogni
+    # encrypt/decrypt: la config si rilegge (un dict), i Fernet no.
+    primary = Fernet(key)
+    retired = [Fernet(k.strip()) for k in old_keys.split(",") if k.strip()]
+    return primary, MultiFernet([primary, *retired])
 
 
 def encrypt(value: str | None) -> str | None:
     if value is None:
         return None
-    return _fernet().encrypt(value.encode()).decode()
+    return _keyring()[1].encrypt(value.encode()).decode()
 
 
 def decrypt(value: str | None) -> str | None:
     if value is None:
         return None
     try:
-        return _fernet().decrypt(value.encode()).decode()
+        return _keyring()[1].decrypt(value.encode()).decode()
     except InvalidToken as exc:
         raise InvalidToken(
-            "Impossibile decifrare il token: TOKEN_ENCRYPTION_KEY è cambiata rispetto a quando "
-            "è stato salvato, oppure il dato è corrotto."
+            "Impossibile decifrare il token: nessuna chiave tra TOKEN_ENCRYPTION_KEY e "
+            "TOKEN_ENCRYPTION_OLD_KEYS è quella con cui è stato salvato, oppure il dato è corrotto."
         ) from exc
+
+
+def rotate(value: str | None) -> str | None:
+    """`value` ricifrato con la chiave primaria, o None se lo è già (niente
+    da riscrivere). Solleva InvalidToken se nessuna chiave lo decifra."""
+    if value is None:
+        return None
+    primary, keyring = _keyring()
+    token = value.encode()
+    try:
+        primary.decrypt(token)
+        return None
+    except InvalidToken:
+        return keyring.rotate(token).decode()
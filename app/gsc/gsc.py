@@ -4,30 +4,35 @@ Adattato dalla bozza originale: qui l'account collegato è lo `User` loggato
 (Flask-Login), non un "tenant" — questo progetto ha un solo modello,
 `User` (vedi README). Le credenziali sono salvate cifrate in DB via
 app/gsc/repository.py, non in sessione e non su file.
+
+Le librerie Google si importano dentro le funzioni che le usano, non
+all'avvio del worker (vedi `DEFERRED_IMPORTS` in app/__init__.py).
 """
 import os
+from dataclasses import asdict
 from datetime import date, timedelta
 
 from flask import Blueprint, current_app, flash, jsonify, redirect, request, session, url_for
 from flask_login import current_user, login_required
-import google.oauth2.credentials
-import google_auth_oauthlib.flow
-import googleapiclient.discovery
 
-from app.gsc.history import get_site_series, sync_site_daily
+from app.gsc.alerts import evaluate_site_pages
+from app.gsc.cache import get_cached_insights, insights_etag, store_insights
+from app.gsc.client import build_service
+from app.gsc.history import get_data_version, get_site_series, sync_site_daily
 from app.gsc.insights import build_insights
+from app.gsc.monthly import get_site_months, year_over_year
 from app.gsc.repository import (
     credentials_to_dict,
     delete_gsc_credentials,
     load_gsc_credentials,
     save_gsc_credentials,
+    save_if_refreshed,
 )
+from app.gsc.sites import cached_sites, delete_sites, refresh_sites
+from app.metrics.timing import span
 
 gsc_bp = Blueprint("gsc", __name__, url_prefix="/gsc")
 
-API_SERVICE_NAME = "searchconsole"
-API_VERSION = "v1"
-
 # Google richiede HTTPS per i redirect URI, tranne quando questa variabile è
 # impostata — necessaria in locale, dove si gira su http://localhost.
 if os.environ.get("APP_BASE_URL", "http://localhost:3000").startswith("http://"):
@@ -54,7 +59,9 @@ def _client_config():
     }
 
 
-def _credentials_from_dict(creds: dict) -> google.oauth2.credentials.Credentials:
+def _credentials_from_dict(creds: dict) -> "google.oauth2.credentials.Credentials":
+    import google.oauth2.credentials
+
     credentials = google.oauth2.credentials.Credentials(
         token=creds["token"],
         refresh_token=creds.get("refresh_token"),
@@ -69,19 +76,20 @@ def _credentials_from_dict(creds: dict) -> google.oauth2.credentials.Credentials
 
 
 def _build_service(credentials):
-    return googleapiclient.discovery.build(API_SERVICE_NAME, API_VERSION, credentials=credentials)
+    # Discovery parsato una volta per worker, trasporto riusato: vedi app/gsc/client.py.
+    return build_service(credentials)
 
 
 def get_user_gsc_service(user_id):
-    """(service, credentials) per l'utente, o (None, None) se non collegato.
-    Riutilizzabile fuori dalle route (es. AI Analyzer). Dopo l'uso il chiamante
-    deve ripersistere le credenziali con save_gsc_credentials, perché la
+    """(service, credentials, creds) per l'utente, o (None, None, None) se non
+    collegato. Riutilizzabile fuori dalle route (es. AI Analyzer). Dopo l'uso il
+    chiamante deve passare credentials e creds a save_if_refreshed, perché la
     libreria può averle aggiornate con un refresh trasparente."""
     creds = load_gsc_credentials(user_id)
     if not creds:
-        return None, None
+        return None, None, None
     credentials = _credentials_from_dict(creds)
-    return _build_service(credentials), credentials
+    return _build_service(credentials), credentials, creds
 
 
 @gsc_bp.route("/authorize")
@@ -91,6 +99,8 @@ def authorize():
         flash("Google Search Console is not configured on this server yet (missing GOOGLE_CLIENT_ID/SECRET).", "error")
         return redirect(url_for("dashboard.connect"))
 
+    import google_auth_oauthlib.flow
+
     flow = google_auth_oauthlib.flow.Flow.from_client_config(
         _client_config(), scopes=current_app.config["GSC_SCOPES"]
     )
@@ -125,6 +135,8 @@ def callback():
         flash("The connection request expired. Please try connecting again.", "error")
         return redirect(url_for("dashboard.connect"))
 
+    import google_auth_oauthlib.flow
+
     try:
         flow = google_auth_oauthlib.flow.Flow.from_client_config(
             _client_config(),
@@ -141,6 +153,13 @@ def callback():
 
     save_gsc_credentials(current_user.id, credentials_to_dict(flow.credentials))
 
+    # Salva subito l'elenco delle property: la prima apertura della dashboard
+    # lo legge dal DB. Se Google non risponde ora, lo rifarà la dashboard.
+    try:
+        refresh_sites(_build_service(flow.credentials), current_user.id)
+    except Exception:
+        current_app.logger.exception("GSC site list fetch after OAuth failed")
+
     flash("Google Search Console connected.", "success")
     return redirect(url_for("dashboard.connect"))
 
@@ -149,10 +168,24 @@ def callback():
 @login_required
 def disconnect():
     delete_gsc_credentials(current_user.id)
+    delete_sites(current_user.id)
     flash("Google Search Console disconnected.", "success")
     return redirect(url_for("dashboard.connect"))
 
 
+def _load_sites(creds, refresh=False):
+    """Property verificate dal DB (registro Site); chiama Google solo se l'elenco è
+    scaduto o se `refresh` lo chiede esplicitamente."""
+    sites = None if refresh else cached_sites(current_user.id)
+    if sites is None:
+        credentials = _credentials_from_dict(creds)
+        sites = refresh_sites(_build_service(credentials), current_user.id)
+        # Il token potrebbe essere stato aggiornato automaticamente dalla libreria
+        # (refresh trasparente): in quel caso, e solo allora, salva la nuova versione.
+        save_if_refreshed(current_user.id, creds, credentials)
+    return sites
+
+
 @gsc_bp.route("/sites")
 @login_required
 def sites():
@@ -160,20 +193,7 @@ def sites():
     if not creds:
         return redirect(url_for("gsc.authorize"))
 
-    credentials = _credentials_from_dict(creds)
-    service = _build_service(credentials)
-
-    site_list = service.sites().list().execute()
-    verified_sites = [
-        s for s in site_list.get("siteEntry", [])
-        if s["permissionLevel"] != "siteUnverifiedUser"
-    ]
-
-    # Il token potrebbe essere stato aggiornato automaticamente dalla libreria
-    # (refresh trasparente): salva la versione aggiornata.
-    save_gsc_credentials(current_user.id, credentials_to_dict(credentials))
-
-    return jsonify(verified_sites)
+    return jsonify(_load_sites(creds))
 
 
 @gsc_bp.route("/api/sites")
@@ -184,17 +204,22 @@ def api_sites():
     if not creds:
         return jsonify({"error": "not_connected"}), 401
 
-    credentials = _credentials_from_dict(creds)
-    service = _build_service(credentials)
+    return jsonify({"sites": _load_sites(creds)})
+
 
-    site_list = service.sites().list().execute()
-    sites = [
-        {"siteUrl": s["siteUrl"], "permissionLevel": s["permissionLevel"]}
-        for s in site_list.get("siteEntry", [])
-        if s["permissionLevel"] != "siteUnverifiedUser"
-    ]
+@gsc_bp.route("/api/sites/refresh", methods=["POST"])
+@login_required
+def api_sites_refresh():
+    """Come /api/sites, ma rilegge l'elenco da Google (es. property appena verificata)."""
+    creds = load_gsc_credentials(current_user.id)
+    if not creds:
+        return jsonify({"error": "not_connected"}), 401
 
-    save_gsc_credentials(current_user.id, credentials_to_dict(credentials))
+    try:
+        sites = _load_sites(creds, refresh=True)
+    except Exception:
+        current_app.logger.exception("GSC site list refresh failed")
+        return jsonify({"error": "query_failed"}), 502
     return jsonify({"sites": sites})
 
 
@@ -225,17 +250,70 @@ def api_insights():
     service = _build_service(credentials)
 
     try:
-        # Prima allinea lo storico su DB (backfill/refresh), poi calcola i
-        # numeri del periodo live e rileggi la serie dal DB per il grafico.
+        # Prima allinea lo storico su DB (backfill/refresh, saltato se il
+        # watermark è fresco): se scrive righe nuove, la versione dei dati
+        # cresce e la cache di questo sito viene invalidata.
         sync_site_daily(service, current_user.id, site_url, days)
-        data = build_insights(service, site_url, days=days)
-        data["series"] = get_site_series(current_user.id, site_url, days)
+        etag = insights_etag(current_user.id, site_url, days, get_data_version(current_user.id, site_url))
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            body = get_cached_insights(current_user.id, site_url, days, etag)
+            if body is None:
+                # Numeri del periodo (totali e pagine dal DB se coperti, query
+                # live) e serie dal DB per il grafico.
+                data = build_insights(service, site_url, days=days, user_id=current_user.id)
+                data["series"] = get_site_series(current_user.id, site_url, days)
+                if data["partial"]:
+                    # Una risposta parziale non va in cache né validata.
+                    save_if_refreshed(current_user.id, creds, credentials)
+                    return jsonify(data)
+                body = store_insights(current_user.id, site_url, days, etag, data)
+            response = current_app.response_class(body, mimetype="application/json")
     except Exception:
         current_app.logger.exception("GSC insights failed for %s", site_url)
         return jsonify({"error": "query_failed"}), 502
 
-    save_gsc_credentials(current_user.id, credentials_to_dict(credentials))
-    return jsonify(data)
+    save_if_refreshed(current_user.id, creds, credentials)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@gsc_bp.route("/api/monthly")
+@login_required
+def api_monthly():
+    """Ultimi 16 mesi del sito dal rollup mensile (grafici lunghi) e il
+    confronto anno su anno. Solo DB: lo storico lo tengono aggiornato i sync."""
+    site_url = request.args.get("site")
+    if not site_url:
+        return jsonify({"error": "missing_site"}), 400
+    months = get_site_months(current_user.id, site_url)
+    return jsonify({"months": months, "yoy": year_over_year(months)})
+
+
+@gsc_bp.route("/api/alerts")
+@login_required
+def api_alerts():
+    """Pagine che perdono traffico per conto loro (rule engine sui rollup
+    mensili), per priorità, con quante pagine ha scartato ogni filtro."""
+    site_url = request.args.get("site")
+    if not site_url:
+        return jsonify({"error": "missing_site"}), 400
+    try:
+        evaluation = evaluate_site_pages(current_user.id, site_url)
+    except ValueError as e:
+        # Soglie salvate che il motore rifiuta (vedi app/rules/thresholds.py).
+        return jsonify({"error": "invalid_thresholds", "message": str(e)}), 422
+    return jsonify(
+        {
+            "alerts": [asdict(c) for c in evaluation.candidates],
+            "pages": len(evaluation.urls),
+            "rejected": evaluation.rejected(),
+            "site_loss_pct": evaluation.site_loss_pct,
+            "yoy_applicable": evaluation.yoy_applicable,
+        }
+    )
 
 
 @gsc_bp.route("/analytics/<path:site_url>")
@@ -259,8 +337,9 @@ def analytics(site_url):
         "rowLimit": 100,
     }
 
-    response = service.searchanalytics().query(siteUrl=site_url, body=body).execute()
+    with span("gsc"):
+        response = service.searchanalytics().query(siteUrl=site_url, body=body).execute()
 
-    save_gsc_credentials(current_user.id, credentials_to_dict(credentials))
+    save_if_refreshed(current_user.id, creds, credentials)
 
     return jsonify(response.get("rows", []))
@@ -1,23 +1,46 @@
 """Storico giornaliero Search Console salvato su DB.
 
-Due responsabilità:
+Tre responsabilità:
   - `sync_site_daily`: scarica le metriche per-giorno (dimensions=["date"]) e le
     fa upsert in GscSiteDaily. Idempotente: rifare il sync aggiorna i giorni,
     non li duplica. Alla prima connessione fa backfill ampio (GSC conserva ~16
     mesi), poi rinfresca solo la coda recente (che GSC può ancora consolidare).
-  - `get_site_series`: rilegge dal DB la serie del periodo per il grafico.
-
-I totali/delta dell'overview restano calcolati live in app/gsc/insights.py
-(valori esatti dall'API); qui teniamo la serie storica e la persistenza.
+    Un watermark per sito, GscSyncState, evita di richiamare Google
+    finché il sync è recente e copre la finestra chiesta. La scrittura è un
+    INSERT ... ON CONFLICT multi-riga (`bulk_upsert`), non un INSERT/UPDATE
+    per giorno. Quando scrive righe nuove o cambiate incrementa
+    `data_version` e invalida la cache delle risposte (app/gsc/cache.py).
+    Dopo ogni sync ricalcola il rollup mensile dei mesi scaricati
+    (app/gsc/monthly.py) e, se GSC_PACKED_SERIES è attivo, gli anni
+    compatti (app/gsc/packed.py); se è spento e il sync ha cambiato righe,
+    cancella gli anni compatti toccati, che sarebbero ormai vecchi.
+  - `get_site_series`: rilegge dal DB la serie del periodo per il grafico,
+    dagli anni compatti se attivi, altrimenti dalle righe giornaliere.
+  - `get_period_totals`: totali del periodo e del precedente (per i delta
+    dell'overview) con un solo aggregato SQL, se il watermark copre entrambe
+    le finestre; altrimenti app/gsc/insights.py ripiega sulle query live.
 """
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import case, func, or_
+from sqlalchemy.dialects import postgresql, sqlite
 
 from app.extensions import db
-from app.models import GscSiteDaily
+from app.gsc.cache import invalidate_insights
+from app.gsc.monthly import refresh_site_months
+from app.gsc.packed import drop_site_years, pack_site_years, read_days
+from app.gsc.site_ids import ensure_site_id, get_site_id
+from app.metrics.timing import span
+from app.models import GscSiteDaily, GscSyncState, Site
 
 BACKFILL_DAYS = 480  # prima connessione: prendi più storico possibile
 FRESH_DAYS = 5       # sync successivi: rinfresca la coda recente non ancora consolidata
+SYNC_TTL_HOURS = 6   # GSC pubblica dati nuovi poche volte al giorno: prima non risincronizzare
 MAX_ROWS = 25000     # limite righe API (dimensions=["date"] resta ben sotto)
+GSC_LAG_DAYS = 3     # giorni finali che GSC può non avere ancora pubblicato
+
+_INSERT_BY_DIALECT = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
 
 
 def _query_daily(service, site_url, start, end):
@@ -27,64 +50,167 @@ def _query_daily(service, site_url, start, end):
         "dimensions": ["date"],
         "rowLimit": MAX_ROWS,
     }
-    return service.searchanalytics().query(siteUrl=site_url, body=body).execute().get("rows", [])
+    with span("gsc"):
+        return service.searchanalytics().query(siteUrl=site_url, body=body).execute().get("rows", [])
 
 
-def sync_site_daily(service, user_id, site_url, days):
-    """Allinea il DB allo storico GSC per il periodo che serve alla vista."""
-    end = date.today() - timedelta(days=1)  # GSC ha ~2-3 giorni di ritardo
-    has_history = (
-        db.session.query(GscSiteDaily.id)
-        .filter_by(user_id=user_id, site_url=site_url)
-        .first()
-        is not None
+def _is_fresh(state, need_start, end):
+    """True se il watermark è recente e copre già [need_start, end]."""
+    if state is None or state.last_synced_at is None or state.covered_start is None:
+        return False
+    age = _utcnow() - state.last_synced_at
+    return (
+        age < timedelta(hours=SYNC_TTL_HOURS)
+        and state.covered_start <= need_start
+        and state.covered_end >= end
     )
-    window = BACKFILL_DAYS if not has_history else max(days + FRESH_DAYS, days)
-    start = end - timedelta(days=window - 1)
+
+
+def sync_site_daily(service, user_id, site_url, days, force=False):
+    """Allinea il DB allo storico GSC per il periodo che serve alla vista.
+    Non chiama Google se il watermark (GscSyncState) è fresco e copre già il
+    periodo e il precedente; `force` lo ignora. Ritorna il numero di giorni
+    inseriti o cambiati."""
+    end = date.today() - timedelta(days=1)  # GSC ha ~2-3 giorni di ritardo
+    need_start = end - timedelta(days=2 * days - 1)  # periodo + precedente (delta overview)
+    site_id = get_site_id(user_id, site_url)
+    state = GscSyncState.query.filter_by(site_id=site_id).first() if site_id else None
+    if not force and _is_fresh(state, need_start, end):
+        return 0
+
+    oldest = end - timedelta(days=BACKFILL_DAYS - 1)
+    if state is not None and state.covered_end is not None:
+        # Incrementale: riparti dalla coda non ancora consolidata dell'ultimo
+        # sync, anche se è di settimane fa, così non restano buchi.
+        start = state.covered_end - timedelta(days=FRESH_DAYS - 1)
+        if state.covered_start > need_start:
+            start = need_start
+    elif site_id and db.session.query(GscSiteDaily.id).filter_by(site_id=site_id).first():
+        # Storico già presente ma salvato prima del watermark: riallinea la finestra richiesta.
+        start = min(need_start, end - timedelta(days=days + FRESH_DAYS - 1))
+    else:
+        start = oldest  # prima connessione: prendi più storico possibile
+    start = max(start, oldest)
 
     rows = _query_daily(service, site_url, start, end)
+    # Registra il sito solo ora: Google ha accettato la property, quindi un
+    # `?site=` qualsiasi non lascia righe nel registro.
+    site_id = site_id or ensure_site_id(user_id, site_url)
 
-    # Carica i giorni già presenti nel range per decidere update vs insert.
-    existing = {
-        r.date: r
-        for r in GscSiteDaily.query.filter(
-            GscSiteDaily.user_id == user_id,
-            GscSiteDaily.site_url == site_url,
-            GscSiteDaily.date >= start,
-            GscSiteDaily.date <= end,
-        ).all()
-    }
+    written = bulk_upsert(
+        GscSiteDaily,
+        [
+            {
+                "site_id": site_id,
+                "date": date.fromisoformat(r["keys"][0]),
+                "clicks": int(r.get("clicks", 0)),
+                "impressions": int(r.get("impressions", 0)),
+                "ctr": float(r.get("ctr", 0.0)),
+                "position": float(r.get("position", 0.0)),
+            }
+            for r in rows
+        ],
+        key=("site_id", "date"),
+    )
+    refresh_site_months(site_id, start, end)
+    if current_app.config["GSC_PACKED_SERIES"]:
+        pack_site_years(site_id, start, end)
+    elif written:
+        drop_site_years(site_id, start, end)
 
-    for r in rows:
-        day = date.fromisoformat(r["keys"][0])
-        clicks = int(r.get("clicks", 0))
-        impressions = int(r.get("impressions", 0))
-        ctr = float(r.get("ctr", 0.0))
-        position = float(r.get("position", 0.0))
-
-        row = existing.get(day)
-        if row is None:
-            db.session.add(GscSiteDaily(
-                user_id=user_id, site_url=site_url, date=day,
-                clicks=clicks, impressions=impressions, ctr=ctr, position=position,
-            ))
-        else:
-            row.clicks = clicks
-            row.impressions = impressions
-            row.ctr = ctr
-            row.position = position
+    state = state or _new_state(site_id)
+    if written:
+        data_changed(state)
+    state.last_synced_at = state.last_attempt_at = _utcnow()
+    state.last_error = None
+    state.covered_start = min(start, state.covered_start or start)
+    state.covered_end = max(end, state.covered_end or end)
+    db.session.commit()
+    return written
 
+
+def mark_sync_failed(user_id, site_url, error):
+    """Registra un sync fallito sul watermark, senza toccare l'intervallo coperto."""
+    db.session.rollback()
+    site_id = get_site_id(user_id, site_url)
+    if site_id is None:
+        return  # mai registrato: niente storico a cui legare l'errore
+    state = GscSyncState.query.filter_by(site_id=site_id).first() or _new_state(site_id)
+    state.last_attempt_at = _utcnow()
+    state.last_error = f"{type(error).__name__}: {error}"[:1000]
     db.session.commit()
 
 
+def data_changed(state):
+    """Segna che il sync ha scritto dati nuovi: nuova versione, cache invalidata."""
+    state.data_version = (state.data_version or 0) + 1
+    site = db.session.get(Site, state.site_id)  # `state.site` è vuoto finché non c'è un flush
+    invalidate_insights(site.user_id, site.site_url)
+
+
+def get_data_version(user_id, site_url):
+    """Versione corrente dei dati del sito (0 se mai sincronizzato)."""
+    site_id = get_site_id(user_id, site_url)
+    if site_id is None:
+        return 0
+    return db.session.query(GscSyncState.data_version).filter_by(site_id=site_id).scalar() or 0
+
+
+def _new_state(site_id):
+    state = GscSyncState(site_id=site_id)
+    db.session.add(state)
+    return state
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def bulk_upsert(model, rows, key, compare=None, commit=True):
+    """INSERT ... ON CONFLICT (key) DO UPDATE per tutte le righe in una sola
+    execute: SQLAlchemy 2.0 ("insertmanyvalues") lo spedisce come VALUES
+    multi-riga a blocchi, con lo statement compilato una volta e messo in cache.
+    L'UPDATE scatta solo se qualche valore è cambiato, così i giorni già
+    consolidati non generano scritture (né bloat su Postgres). Ritorna quante
+    righe sono state inserite o modificate. PostgreSQL in produzione, SQLite in
+    sviluppo/benchmark: entrambi supportano la sintassi.
+
+    `compare` restringe le colonne confrontate per decidere se aggiornare
+    (default: tutte le non-chiave); vuoto = aggiorna sempre. Serve per le
+    colonne JSON, che su Postgres non hanno l'operatore `!=`. Con
+    `commit=False` il commit lo fa il chiamante (più upsert in una transazione)."""
+    if not rows:
+        return 0
+    table = model.__table__
+    columns = [c for c in rows[0] if c not in key]
+    compare = columns if compare is None else compare
+    stmt = _INSERT_BY_DIALECT[db.engine.dialect.name](table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={c: stmt.excluded[c] for c in columns},
+        where=or_(*(table.c[c] != stmt.excluded[c] for c in compare)) if compare else None,
+    ).returning(table.c.id)
+    # RETURNING riporta solo le righe davvero scritte: è il conteggio.
+    written = len(db.session.connection().execute(stmt, rows).all())
+    if commit:
+        db.session.commit()
+    return written
+
+
 def get_site_series(user_id, site_url, days):
     """Serie giornaliera del periodo (per il grafico andamento click)."""
     end = date.today() - timedelta(days=1)
     start = end - timedelta(days=days - 1)
+    site_id = get_site_id(user_id, site_url)
+    if site_id is None:
+        return []
+    if current_app.config["GSC_PACKED_SERIES"]:
+        packed_days = read_days(site_id, start, end)
+        if packed_days is not None:
+            return [{"date": d.isoformat(), "clicks": c, "impressions": i} for d, c, i, _, _ in packed_days]
     rows = (
         GscSiteDaily.query.filter(
-            GscSiteDaily.user_id == user_id,
-            GscSiteDaily.site_url == site_url,
+            GscSiteDaily.site_id == site_id,
             GscSiteDaily.date >= start,
             GscSiteDaily.date <= end,
         )
@@ -99,3 +225,65 @@ def get_site_series(user_id, site_url, days):
         }
         for r in rows
     ]
+
+
+def _window_columns(start, end):
+    in_window = GscSiteDaily.date.between(start, end)
+    return [
+        func.coalesce(func.sum(case((in_window, GscSiteDaily.clicks), else_=0)), 0),
+        func.coalesce(func.sum(case((in_window, GscSiteDaily.impressions), else_=0)), 0),
+        func.coalesce(
+            func.sum(case((in_window, GscSiteDaily.position * GscSiteDaily.impressions), else_=0.0)), 0.0
+        ),
+    ]
+
+
+def _window_totals(clicks, impressions, weighted_position):
+    return {
+        "clicks": int(clicks),
+        "impressions": int(impressions),
+        # CTR e posizione del periodo pesati sulle impressioni, come li
+        # calcola Search Console sulla query aggregata.
+        "ctr": clicks / impressions if impressions else 0.0,
+        "position": weighted_position / impressions if impressions else 0.0,
+    }
+
+
+def get_period_totals(user_id, site_url, start, end, prev_start, prev_end):
+    """(totali periodo, totali periodo precedente) dallo storico su DB, con una
+    sola query sulle due finestre. None se il watermark (GscSyncState) non le
+    copre entrambe.
+
+    La copertura si legge dal watermark e non dalla continuità delle righe:
+    GSC non ritorna i giorni senza click né impressioni, quindi a un sito
+    piccolo mancano righe anche con lo storico completo. Gli ultimi
+    GSC_LAG_DAYS giorni possono non essere ancora pubblicati: le due finestre
+    si fermano allo stesso giorno relativo, l'ultimo con dati, così si
+    confrontano periodi della stessa lunghezza."""
+    site_id = get_site_id(user_id, site_url)
+    state = GscSyncState.query.filter_by(site_id=site_id).first() if site_id else None
+    if (
+        state is None
+        or state.covered_start is None
+        or state.covered_start > prev_start
+        or state.covered_end < end
+    ):
+        return None
+    lag_start = end - timedelta(days=GSC_LAG_DAYS - 1)
+    last = (
+        db.session.query(func.max(GscSiteDaily.date))
+        .filter(GscSiteDaily.site_id == site_id, GscSiteDaily.date.between(lag_start, end))
+        .scalar()
+    )
+    trim = end - (last or lag_start - timedelta(days=1))
+    end, prev_end = end - trim, prev_end - trim
+    row = (
+        db.session.query(*_window_columns(start, end), *_window_columns(prev_start, prev_end))
+        .filter(
+            GscSiteDaily.site_id == site_id,
+            GscSiteDaily.date >= prev_start,
+            GscSiteDaily.date <= end,
+        )
+        .one()
+    )
+    return _window_totals(*row[:3]), _window_totals(*row[3:])
@@ -0,0 +1,106 @@
+"""Ingestione in background dello storico Search Console.
+
+Gira fuori dai worker web (`flask ingest` o il processo `python -m scheduler`,
+vedi ARCHITECTURE.md): per ogni GscConnection rinfresca l'elenco salvato delle
+property verificate (app/gsc/sites.py) e fa il sync incrementale di ognuna
+(storico di sito e per pagina), così la dashboard trova lo storico già caldo
+invece di pagare il backfill alla prima apertura.
+
+Gli account sono elaborati in parallelo fino a `workers`, i siti di uno stesso
+account in sequenza (un solo refresh del token per account). Un lock
+cross-processo impedisce che due repliche dello scheduler girino insieme:
+advisory lock su PostgreSQL, lock su file in sviluppo (SQLite).
+"""
+import fcntl
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import text
+
+from app.extensions import db
+from app.gsc.gsc import get_user_gsc_service
+from app.gsc.history import mark_sync_failed, sync_site_daily
+from app.gsc.page_history import sync_page_daily
+from app.gsc.repository import save_if_refreshed
+from app.gsc.sites import refresh_sites
+from app.models import GscConnection
+
+INGEST_DAYS = 90     # periodo più lungo della dashboard: copre anche 7 e 28
+LOCK_KEY = 0x4C4221  # chiave dell'advisory lock Postgres, fissa per l'app
+
+
+@contextmanager
+def _ingest_lock():
+    """True se questo processo ha ottenuto il lock, False se un altro ce l'ha."""
+    if db.engine.dialect.name == "postgresql":
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": LOCK_KEY}).scalar()
+            try:
+                yield bool(acquired)
+            finally:
+                if acquired:
+                    conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
+        return
+
+    with open(os.path.join(tempfile.gettempdir(), "linkbay-ingest.lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _ingest_user(app, user_id):
+    """Sync di tutte le property di un account. Ritorna {site_url: esito}."""
+    with app.app_context():
+        try:
+            service, credentials, creds = get_user_gsc_service(user_id)
+            if service is None:
+                return {}
+            sites = refresh_sites(service, user_id)  # aggiorna anche l'elenco salvato
+        except Exception as e:
+            app.logger.warning("Ingest: account %s non raggiungibile: %s", user_id, e)
+            return {None: f"{type(e).__name__}: {e}"}
+
+        results = {}
+        for site in sites:
+            site_url = site["siteUrl"]
+            try:
+                # force: il TTL del watermark (SYNC_TTL_HOURS) serve a non far
+                # risincronizzare le richieste web; lo scheduler ha già la sua
+                # cadenza (INGEST_INTERVAL_HOURS) e altrimenti salterebbe un giro su due.
+                written = sync_site_daily(service, user_id, site_url, INGEST_DAYS, force=True)
+                page_rows = sync_page_daily(service, user_id, site_url)
+                results[site_url] = f"ok ({written} giorni, {page_rows} righe pagina scritte)"
+            except Exception as e:
+                app.logger.warning("Ingest: sync fallito per %s (utente %s): %s", site_url, user_id, e)
+                mark_sync_failed(user_id, site_url, e)
+                results[site_url] = f"{type(e).__name__}: {e}"
+
+        save_if_refreshed(user_id, creds, credentials)
+        return results
+
+
+def run_ingest(workers=None):
+    """Un giro completo su tutti gli account collegati. Da chiamare dentro un
+    app context; `workers` di default da INGEST_WORKERS (config). Ritorna
+    {user_id: {site_url: esito}}, o None se un'altra istanza sta già girando."""
+    app = current_app._get_current_object()
+    workers = workers or app.config["INGEST_WORKERS"]
+    with _ingest_lock() as acquired:
+        if not acquired:
+            app.logger.info("Ingest già in corso in un altro processo: salto questo giro.")
+            return None
+
+        user_ids = [uid for (uid,) in db.session.query(GscConnection.user_id).all()]
+        db.session.remove()  # ogni thread lavora nel proprio app context e sessione
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gsc-ingest") as pool:
+            outcomes = pool.map(lambda uid: _ingest_user(app, uid), user_ids)
+            return dict(zip(user_ids, outcomes))
@@ -4,13 +4,57 @@ Trasforma le righe grezze dell'API searchanalytics in una struttura pronta per
 la UI: totali di sito (con delta vs periodo precedente), dettaglio per pagina
 (con un rating di salute 1-5) e le query principali. Tenuto separato da
 app/gsc/gsc.py, che resta responsabile solo di OAuth e delle route.
+
+Le query verso Google sono indipendenti tra loro: `build_insights` le lancia in
+parallelo su un pool di thread limitato, così la latenza della vista è circa
+quella della query più lenta e non la somma dei round-trip. I totali
+dell'overview e la tabella pagine, quando lo storico su DB copre il periodo,
+non passano nemmeno da Google (vedi app/gsc/history.py::get_period_totals e
+app/gsc/page_history.py::get_page_totals).
 """
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
 
+from app.gsc.client import authorized_http, refresh_request
+from app.gsc.history import get_period_totals
+from app.gsc.page_history import get_page_totals
+from app.metrics.timing import bind, span
+
 DEFAULT_DAYS = 28
+QUERY_WORKERS = 8     # thread del pool condiviso dal processo (per worker gunicorn)
+QUERY_TIMEOUT = 20    # secondi, attesa massima dei risultati dell'intero fan-out
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    # Creato alla prima richiesta, non all'import: con preload_app il fork
+    # avviene dopo l'import e i thread non sopravvivono al fork.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="gsc-query")
+    return _pool
+
+
+def _credentials(service):
+    # None quando il service non ha credenziali google-auth (es. service finti).
+    return getattr(getattr(service, "_http", None), "credentials", None)
+
 
+def _refresh_if_needed(service):
+    # Un token scaduto verrebbe rinfrescato da ogni thread in parallelo:
+    # meglio farlo una volta sola prima di distribuire le query.
+    credentials = _credentials(service)
+    if credentials is not None and not credentials.valid and credentials.refresh_token:
+        credentials.refresh(refresh_request())
 
-def _query(service, site_url, start, end, dimensions, row_limit=1000):
+
+def _query(service, site_url, start, end, dimensions, row_limit=1000, http=None):
     body = {
         "startDate": start.isoformat(),
         "endDate": end.isoformat(),
@@ -18,7 +62,45 @@ def _query(service, site_url, start, end, dimensions, row_limit=1000):
     }
     if dimensions:
         body["dimensions"] = dimensions
-    return service.searchanalytics().query(siteUrl=site_url, body=body).execute().get("rows", [])
+    request = service.searchanalytics().query(siteUrl=site_url, body=body)
+    with span("gsc"):
+        return request.execute(http=http).get("rows", [])
+
+
+def _query_in_thread(service, site_url, **kwargs):
+    # httplib2.Http non è thread-safe: nel thread del pool la query usa il
+    # trasporto di quel thread, non quello del service creato dalla richiesta.
+    credentials = _credentials(service)
+    http = authorized_http(credentials) if credentials is not None else None
+    return _query(service, site_url, http=http, **kwargs)
+
+
+def _fetch_all(service, site_url, specs, fail_if_all=True):
+    """Esegue in parallelo le query descritte da `specs` ({nome: kwargs di
+    _query}). Ritorna ({nome: righe}, [nomi falliti]): una query che fallisce o
+    supera QUERY_TIMEOUT non fa perdere le altre, il suo risultato è []. Se
+    falliscono tutte rilancia il primo errore, salvo `fail_if_all=False` (il
+    chiamante ha comunque dati dal DB da mostrare)."""
+    _refresh_if_needed(service)
+    pool = _executor()
+    futures = {
+        name: pool.submit(bind(_query_in_thread), service, site_url, **kwargs)
+        for name, kwargs in specs.items()
+    }
+
+    deadline = time.monotonic() + QUERY_TIMEOUT
+    results, failed, first_error = {}, [], None
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:  # include il TimeoutError del future
+            future.cancel()
+            results[name], first_error = [], first_error or e
+            failed.append(name)
+
+    if fail_if_all and failed and len(failed) == len(specs):
+        raise first_error  # niente di utilizzabile: lo gestisce la route (502)
+    return results, failed
 
 
 def _totals(rows):
@@ -58,7 +140,11 @@ def _health_stars(clicks_delta_pct):
     return 1
 
 
-def build_insights(service, site_url, days=DEFAULT_DAYS):
+def build_insights(service, site_url, days=DEFAULT_DAYS, user_id=None, max_pages=100):
+    """Dati della vista Insights. Con `user_id` i totali dell'overview e le
+    pagine si leggono dallo storico su DB (GscSiteDaily, GscPageDaily); le
+    query live corrispondenti partono solo se lo storico ha buchi. `max_pages`
+    limita le pagine restituite (la tabella della vista ne mostra 100)."""
     today = date.today()
     # Search Console ha ~2-3 giorni di ritardo: chiudiamo la finestra a ieri
     # per non confrontare periodi con dati ancora incompleti.
@@ -67,8 +153,27 @@ def build_insights(service, site_url, days=DEFAULT_DAYS):
     prev_end = start - timedelta(days=1)
     prev_start = prev_end - timedelta(days=days - 1)
 
-    cur = _totals(_query(service, site_url, start, end, []))
-    prev = _totals(_query(service, site_url, prev_start, prev_end, []))
+    stored = get_period_totals(user_id, site_url, start, end, prev_start, prev_end) if user_id else None
+    stored_pages = (
+        get_page_totals(user_id, site_url, start, end, prev_start, prev_end, limit=max_pages) if user_id else None
+    )
+
+    specs = {"queries": {"start": start, "end": end, "dimensions": ["query"], "row_limit": 50}}
+    if stored is None:
+        specs["totals"] = {"start": start, "end": end, "dimensions": []}
+        specs["totals_prev"] = {"start": prev_start, "end": prev_end, "dimensions": []}
+    if stored_pages is None:
+        specs["pages"] = {"start": start, "end": end, "dimensions": ["page"]}
+        specs["pages_prev"] = {"start": prev_start, "end": prev_end, "dimensions": ["page"]}
+    rows, failed = _fetch_all(
+        service, site_url, specs, fail_if_all=stored is None and stored_pages is None
+    )
+
+    if stored is not None:
+        cur, prev = stored
+    else:
+        cur = _totals(rows["totals"])
+        prev = _totals(rows["totals_prev"])
 
     overview = {
         "range": {"start": start.isoformat(), "end": end.isoformat(), "days": days},
@@ -79,24 +184,26 @@ def build_insights(service, site_url, days=DEFAULT_DAYS):
         "position": {"value": cur["position"], "delta_pct": _pct_delta(cur["position"], prev["position"])},
     }
 
-    cur_pages = {r["keys"][0]: r for r in _query(service, site_url, start, end, ["page"])}
-    prev_pages = {r["keys"][0]: r for r in _query(service, site_url, prev_start, prev_end, ["page"])}
+    if stored_pages is None:
+        prev_pages = {r["keys"][0]: r for r in rows["pages_prev"]}
+        stored_pages = [
+            {
+                "url": r["keys"][0],
+                "clicks": r.get("clicks", 0),
+                "impressions": r.get("impressions", 0),
+                "ctr": r.get("ctr", 0.0),
+                "position": r.get("position", 0.0),
+                "clicks_prev": prev_pages.get(r["keys"][0], {}).get("clicks", 0),
+            }
+            for r in rows["pages"]
+        ]
 
     pages = []
-    for url, r in cur_pages.items():
-        prev_clicks = prev_pages.get(url, {}).get("clicks", 0)
-        delta_pct = _pct_delta(r.get("clicks", 0), prev_clicks)
-        pages.append({
-            "url": url,
-            "clicks": r.get("clicks", 0),
-            "impressions": r.get("impressions", 0),
-            "ctr": r.get("ctr", 0.0),
-            "position": r.get("position", 0.0),
-            "clicks_prev": prev_clicks,
-            "clicks_delta_pct": delta_pct,
-            "stars": _health_stars(delta_pct),
-        })
-    # Le pagine più in sofferenza (calo maggiore) per prime.
+    for p in stored_pages:
+        delta_pct = _pct_delta(p["clicks"], p["clicks_prev"])
+        pages.append({**p, "clicks_delta_pct": delta_pct, "stars": _health_stars(delta_pct)})
+    # Le pagine più in sofferenza (calo maggiore) per prime. Dal DB arrivano
+    # già così, e solo le prime max_pages; da Google vanno ordinate qui.
     pages.sort(key=lambda p: (p["clicks_delta_pct"] if p["clicks_delta_pct"] is not None else 0))
 
     queries = [
@@ -107,7 +214,9 @@ def build_insights(service, site_url, days=DEFAULT_DAYS):
             "ctr": r.get("ctr", 0.0),
             "position": r.get("position", 0.0),
         }
-        for r in _query(service, site_url, start, end, ["query"], row_limit=50)
+        for r in rows["queries"]
     ]
 
-    return {"overview": overview, "pages": pages[:100], "queries": queries}
+    # `partial`: blocchi non arrivati da Google (errore o timeout), così la UI
+    # può distinguere "nessun dato" da "dato mancante".
+    return {"overview": overview, "pages": pages[:max_pages], "queries": queries, "partial": failed}
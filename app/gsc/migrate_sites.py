@@ -0,0 +1,236 @@
+"""Migrazione una tantum: dalle chiavi (user_id, site_url) a `site_id`.
+
+`create_all()` non altera tabelle esistenti (vedi README, "Database"), quindi
+su un DB creato prima del registro `sites` le tabelle dello storico, dei
+risultati AI, dei watermark, dei job, delle soglie e dei budget hanno ancora
+user_id + site_url, e l'elenco delle property sta in una tabella a parte
+(`gsc_sites`). `flask migrate-sites`:
+
+  1. aggiunge a `sites` le colonne dell'elenco (permission_level,
+     fetched_at) se mancano, ci fonde `gsc_sites` e la elimina;
+  2. registra in `sites` ogni (user_id, site_url) presente nelle tabelle;
+  3. per ogni tabella diversa dal modello (ha ancora site_url, o le manca
+     una colonna): toglie i suoi indici con nome (lo schema nuovo riusa gli
+     stessi nomi), la rinomina in `<nome>_legacy`, crea la tabella nuova dal
+     modello e ci copia le colonne in comune (site_id dal join su `sites`;
+     le righe globali di soglie e budget restano con site_id NULL), poi
+     elimina la vecchia;
+  4. lascia una sola riga globale (la più vecchia) nelle tabelle di
+     GLOBAL_ROWS e crea il loro indice unique parziale, che create_all()
+     non aggiunge a una tabella esistente;
+  5. su PostgreSQL ordina fisicamente lo storico giornaliero sull'indice
+     (site_id, date) (CLUSTER) e aggiorna le statistiche.
+
+Funziona su PostgreSQL e SQLite (rinomina + copia; l'unico ALTER aggiunge
+colonne nullable a `sites`). Idempotente: le tabelle già migrate si
+saltano. Va lanciata a app ferma (o almeno a scheduler fermo): la copia
+avviene in una transazione per tabella.
+"""
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex, DropIndex
+
+from app.extensions import db
+from app.models import (
+    AiAnalysisJob,
+    AiAnalyzerConfig,
+    AiBudget,
+    AiPageAnalysis,
+    AiPageAnalysisWeek,
+    GscPageDaily,
+    GscPageMonthly,
+    GscSiteDaily,
+    GscSiteMonthly,
+    GscSyncState,
+    RuleThresholds,
+    Site,
+)
+
+MIGRATED = (
+    GscSiteDaily,
+    GscPageDaily,
+    GscSiteMonthly,
+    GscPageMonthly,
+    AiAnalyzerConfig,
+    AiPageAnalysis,
+    AiPageAnalysisWeek,
+    GscSyncState,
+    AiAnalysisJob,
+    AiBudget,
+    RuleThresholds,
+)
+# Colonne dell'elenco delle property, arrivate in `sites` da gsc_sites.
+SITE_COLUMNS = ("permission_level", "fetched_at")
+# Tabelle con una riga globale (site_id NULL), unica per indice parziale.
+GLOBAL_ROWS = (RuleThresholds, AiBudget)
+
+
+def _columns(inspector, name):
+    return {c["name"] for c in inspector.get_columns(name)}
+
+
+def legacy_tables():
+    """Tabelle diverse dal modello: con colonne che il modello non ha più
+    (site_url, user_id) o senza una colonna che il modello ha."""
+    inspector = inspect(db.engine)
+    existing = set(inspector.get_table_names())
+    legacy = []
+    for model in MIGRATED:
+        if model.__tablename__ not in existing:
+            continue
+        columns = _columns(inspector, model.__tablename__)
+        wanted = {c.name for c in model.__table__.columns}
+        if (columns - wanted) & {"site_url", "user_id"} or wanted - columns:
+            legacy.append(model)
+    return legacy
+
+
+def pending_migration():
+    """Nomi delle tabelle che aspettano `flask migrate-sites` (vuoto se
+    nessuna): quelle di `legacy_tables`, più `sites` senza le colonne
+    dell'elenco, `gsc_sites` ancora da fondere e le tabelle di GLOBAL_ROWS
+    con più righe globali. Nelle altre crea l'indice della riga globale se
+    manca: su un DB già migrato non serve altro."""
+    inspector = inspect(db.engine)
+    existing = set(inspector.get_table_names())
+    legacy = [m.__tablename__ for m in legacy_tables()]
+    pending = list(legacy)
+    if "sites" in existing and not set(SITE_COLUMNS) <= _columns(inspector, "sites"):
+        pending.append("sites")
+    if "gsc_sites" in existing:
+        pending.append("gsc_sites")
+    for model in GLOBAL_ROWS:
+        name = model.__tablename__
+        if name not in existing or name in legacy:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                _create_indexes(conn, model)
+        except IntegrityError:
+            pending.append(name)
+    return pending
+
+
+def _create_indexes(conn, model):
+    # Con IF NOT EXISTS: SQLite non riflette gli indici su espressioni, quindi
+    # l'inspector non direbbe se c'è già.
+    for index in model.__table__.indexes:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _drop_duplicate_globals(conn, name, where):
+    """Tiene solo la riga globale più vecchia (id più basso): prima
+    dell'indice parziale ne potevano esistere più d'una, e quale valesse
+    dipendeva dall'ordine della query."""
+    result = conn.execute(
+        text(f"DELETE FROM {name} WHERE {where} AND id > (SELECT MIN(id) FROM {name} WHERE {where})")
+    )
+    if result.rowcount:
+        current_app.logger.warning("%s: eliminate %d righe globali doppie.", name, result.rowcount)
+
+
+def _merge_site_list(conn):
+    """Passo 1: `sites` diventa anche l'elenco delle property verificate."""
+    inspector = inspect(conn)
+    missing = [c for c in SITE_COLUMNS if c not in _columns(inspector, "sites")]
+    for name in missing:
+        column = Site.__table__.c[name]
+        conn.execute(text(f"ALTER TABLE sites ADD COLUMN {name} {column.type.compile(conn.dialect)}"))
+    if "gsc_sites" in inspector.get_table_names():
+        conn.execute(
+            text(
+                "INSERT INTO sites (user_id, site_url, created_at, permission_level, fetched_at) "
+                "SELECT user_id, site_url, fetched_at, permission_level, fetched_at FROM gsc_sites WHERE true "
+                "ON CONFLICT (user_id, site_url) DO UPDATE "
+                "SET permission_level = excluded.permission_level, fetched_at = excluded.fetched_at"
+            )
+        )
+        conn.execute(text("DROP TABLE gsc_sites"))
+
+
+def _free_names(conn, inspector, name, legacy):
+    """Libera i nomi che la tabella nuova riusa: indici e vincoli unique con
+    nome (su SQLite i vincoli sono interni alla tabella) e, su Postgres,
+    chiave primaria e sequenza dell'id, rinominate col suffisso _legacy."""
+    postgres = conn.dialect.name == "postgresql"
+    if postgres:
+        for constraint in inspector.get_unique_constraints(name):
+            conn.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint["name"]}"'))
+    for index in inspector.get_indexes(name):
+        if index.get("duplicates_constraint"):
+            continue  # già eliminato con il vincolo
+        conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+    if postgres:
+        pk = inspector.get_pk_constraint(name)["name"]
+        conn.execute(text(f'ALTER INDEX "{pk}" RENAME TO "{legacy}_pkey"'))
+        conn.execute(text(f'ALTER SEQUENCE IF EXISTS "{name}_id_seq" RENAME TO "{legacy}_id_seq"'))
+
+
+def migrate_to_site_ids():
+    """Esegue la migrazione. Ritorna {tabella: righe copiate}."""
+    Site.__table__.create(db.engine, checkfirst=True)
+    with db.engine.begin() as conn:
+        _merge_site_list(conn)
+    models = legacy_tables()
+
+    inspector = inspect(db.engine)
+    old_columns = {m.__tablename__: _columns(inspector, m.__tablename__) for m in models}
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with db.engine.begin() as conn:
+        for model in models:
+            if "site_url" not in old_columns[model.__tablename__]:
+                continue
+            conn.execute(
+                text(
+                    f"INSERT INTO sites (user_id, site_url, created_at) "
+                    f"SELECT DISTINCT user_id, site_url, :now FROM {model.__tablename__} "
+                    f"WHERE user_id IS NOT NULL AND site_url IS NOT NULL "
+                    f"ON CONFLICT (user_id, site_url) DO NOTHING"
+                ),
+                {"now": now},
+            )
+
+    copied = {}
+    for model in models:
+        name = model.__tablename__
+        legacy = f"{name}_legacy"
+        old = old_columns[name]
+        columns = [c.name for c in model.__table__.columns if c.name not in ("id", "site_id") and c.name in old]
+        if "site_url" in old:
+            # Chiave vecchia: site_id dal registro. Soglie e budget hanno la
+            # riga globale (site_url NULL), che resta con site_id NULL.
+            join = "LEFT JOIN" if model.__table__.c.site_id.nullable else "JOIN"
+            source = (
+                f"SELECT s.id, {', '.join('o.' + c for c in columns)} FROM {legacy} o "
+                f"{join} sites s ON s.user_id = o.user_id AND s.site_url = o.site_url "
+                f"WHERE s.id IS NOT NULL OR (o.user_id IS NULL AND o.site_url IS NULL)"
+            )
+        else:
+            source = f"SELECT site_id, {', '.join(columns)} FROM {legacy}"
+        with db.engine.begin() as conn:
+            _free_names(conn, inspect(conn), name, legacy)
+            for index in model.__table__.indexes:
+                conn.execute(DropIndex(index, if_exists=True))  # quelli che l'inspector non vede
+            conn.execute(text(f"ALTER TABLE {name} RENAME TO {legacy}"))
+            if model in GLOBAL_ROWS:
+                where = "user_id IS NULL AND site_url IS NULL" if "site_url" in old else "site_id IS NULL"
+                _drop_duplicate_globals(conn, legacy, where)
+            model.__table__.create(conn)
+            result = conn.execute(text(f"INSERT INTO {name} (site_id, {', '.join(columns)}) {source}"))
+            copied[name] = result.rowcount
+            conn.execute(text(f"DROP TABLE {legacy}"))
+
+    for model in GLOBAL_ROWS:
+        with db.engine.begin() as conn:
+            _drop_duplicate_globals(conn, model.__tablename__, "site_id IS NULL")
+            _create_indexes(conn, model)
+
+    if copied and db.engine.dialect.name == "postgresql":
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("CLUSTER gsc_site_daily USING uq_site_daily"))
+            for name in copied:
+                conn.execute(text(f"ANALYZE {name}"))
+    return copied
@@ -0,0 +1,227 @@
+"""Rollup mensili dello storico (GscSiteMonthly, GscPageMonthly).
+
+  - `refresh_site_months` / `refresh_page_months`: ricalcolano i mesi che
+    contengono [start, end] con un solo INSERT ... SELECT ... GROUP BY mese
+    ... ON CONFLICT DO UPDATE: l'aggregato non esce dal DB e l'UPDATE scatta
+    solo per i mesi cambiati. Li chiamano i sync (history.py,
+    page_history.py) con i giorni appena scaricati, quindi un sync
+    incrementale ricalcola uno o due mesi, non lo storico. Se il sito non ha
+    ancora rollup (storico salvato prima di queste tabelle) li costruiscono
+    tutti una volta.
+  - `get_site_months` / `year_over_year`: ultimi mesi del sito per i grafici
+    lunghi e il confronto con lo stesso mese dell'anno prima.
+  - `get_page_series`: serie mensili di tutte le pagine di un sito, nel
+    formato del rule engine (app/rules/, SiteSeries).
+"""
+import calendar
+from array import array
+from datetime import date, timedelta
+
+from sqlalchemy import Date, Float, case, cast, func, literal_column, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.gsc.site_ids import get_site_id
+from app.models import GscPageDaily, GscPageMonthly, GscSiteDaily, GscSiteMonthly, GscSyncState
+from app.rules import SERIES_MONTHS, SiteSeries
+
+_INSERT_BY_DIALECT = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+_VALUES = ("clicks", "impressions", "ctr", "position", "days")
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_end(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def _month_of(column):
+    # Unità come letterale, non parametro: su Postgres il GROUP BY deve
+    # ripetere esattamente l'espressione della SELECT.
+    if db.engine.dialect.name == "postgresql":
+        return cast(func.date_trunc(literal_column("'month'"), column), Date)
+    return func.date(column, literal_column("'start of month'"))
+
+
+def _refresh(daily, monthly, group, site_id, start, end):
+    """Ricalcola in `monthly` i mesi di `daily` tra start ed end (tutti se il
+    sito non ha ancora rollup). Ritorna le righe mensili scritte."""
+    has_rollup = db.session.query(monthly.id).filter_by(site_id=site_id).first()
+    month = _month_of(daily.date)
+    clicks = func.sum(daily.clicks)
+    impressions = func.sum(daily.impressions)
+    query = select(
+        daily.site_id,
+        *(getattr(daily, c) for c in group),
+        month,
+        clicks,
+        impressions,
+        # CTR e posizione pesati sulle impressioni, come li calcola GSC.
+        case((impressions > 0, cast(clicks, Float) / impressions), else_=0.0),
+        case((impressions > 0, func.sum(daily.position * daily.impressions) / impressions), else_=0.0),
+        func.count(),
+    ).where(daily.site_id == site_id)
+    if has_rollup:
+        query = query.where(daily.date >= month_start(start), daily.date <= _month_end(end))
+    query = query.group_by(daily.site_id, *(getattr(daily, c) for c in group), month)
+
+    table = monthly.__table__
+    key = ["site_id", *group, "month"]
+    stmt = _INSERT_BY_DIALECT[db.engine.dialect.name](table).from_select(key + list(_VALUES), query)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key,
+        set_={c: stmt.excluded[c] for c in _VALUES},
+        where=or_(*(table.c[c] != stmt.excluded[c] for c in _VALUES)),
+    )
+    written = db.session.execute(stmt).rowcount
+    db.session.commit()
+    return written
+
+
+def refresh_site_months(site_id, start, end):
+    """Rollup mensile del sito per i mesi che contengono [start, end]."""
+    return _refresh(GscSiteDaily, GscSiteMonthly, (), site_id, start, end)
+
+
+def refresh_page_months(site_id, start, end):
+    """Rollup mensile per pagina per i mesi che contengono [start, end]."""
+    return _refresh(GscPageDaily, GscPageMonthly, ("page_url",), site_id, start, end)
+
+
+def get_site_months(user_id, site_url, months=SERIES_MONTHS):
+    """Ultimi `months` mesi del sito, dal più vecchio. `complete` dice se il
+    mese è tutto dentro lo storico scaricato (watermark GscSyncState, meno i
+    GSC_LAG_DAYS non ancora pubblicati): non si decide da `days`, perché GSC
+    non ritorna i giorni senza traffico e su un sito piccolo un mese intero
+    può avere meno righe che giorni."""
+    from app.gsc.history import GSC_LAG_DAYS  # history importa questo modulo
+
+    site_id = get_site_id(user_id, site_url)
+    state = (
+        db.session.query(GscSyncState.covered_start, GscSyncState.covered_end)
+        .filter_by(site_id=site_id)
+        .first()
+    )
+    covered_start, covered_end = state or (None, None)
+    if covered_end is not None:
+        covered_end -= timedelta(days=GSC_LAG_DAYS)
+    rows = (
+        GscSiteMonthly.query.filter_by(site_id=site_id)
+        .order_by(GscSiteMonthly.month.desc())
+        .limit(months)
+        .all()
+    )
+    return [
+        {
+            "month": r.month.isoformat(),
+            "clicks": r.clicks,
+            "impressions": r.impressions,
+            "ctr": r.ctr,
+            "position": r.position,
+            "days": r.days,
+            "complete": covered_start is not None
+            and covered_start <= r.month
+            and _month_end(r.month) <= covered_end,
+        }
+        for r in reversed(rows)
+    ]
+
+
+def year_over_year(months):
+    """Ultimo mese completo di `months` (get_site_months) contro lo stesso
+    mese dell'anno prima. None se uno dei due manca o è parziale."""
+    by_month = {m["month"]: m for m in months}
+    for m in reversed(months):
+        if not m["complete"]:
+            continue
+        day = date.fromisoformat(m["month"])
+        before = by_month.get(add_months(day, -12).isoformat())
+        if before is None or not before["complete"]:
+            return None
+        previous = before["clicks"]
+        return {
+            "month": m["month"],
+            "clicks": m["clicks"],
+            "clicks_year_ago": previous,
+            "clicks_delta_pct": (m["clicks"] - previous) / previous * 100.0 if previous else None,
+        }
+    return None
+
+
+def _history_months(covered_start, last):
+    """Mesi interi di storico da `covered_start` (primo giorno scaricato) al
+    mese `last` compreso: un primo mese iniziato a metà non conta."""
+    if covered_start is None:
+        return 0
+    first = month_start(covered_start)
+    if covered_start != first:
+        first = add_months(first, 1)
+    return max(0, (last.year - first.year) * 12 + last.month - first.month + 1)
+
+
+def get_page_series(user_id, site_url, months=SERIES_MONTHS, last=None):
+    """SiteSeries (app/rules/) dei `months` mesi che finiscono con `last`
+    (default: l'ultimo mese concluso). I mesi senza righe valgono zero; le
+    pagine senza click né impression nel periodo non ci sono.
+
+    `history_months` viene dallo storico per pagina (watermark
+    `pages_covered_start`, PAGE_HISTORY_DAYS), non da quello del sito che è
+    più lungo: il filtro stagionalità confronta le pagine con l'anno prima, e
+    senza righe per pagina di quell'anno non ha niente da confermare."""
+    last = last or month_start(month_start(date.today()) - timedelta(days=1))
+    first = add_months(last, -(months - 1))
+    index = {add_months(first, i): i for i in range(months)}
+    site_id = get_site_id(user_id, site_url)
+
+    site_clicks = [0] * months
+    for month, clicks in (
+        db.session.query(GscSiteMonthly.month, GscSiteMonthly.clicks)
+        .filter(GscSiteMonthly.site_id == site_id)
+        .filter(GscSiteMonthly.month >= first, GscSiteMonthly.month <= last)
+    ):
+        site_clicks[index[month]] = clicks
+
+    covered_start = (
+        db.session.query(GscSyncState.pages_covered_start).filter_by(site_id=site_id).scalar()
+    )
+    series = SiteSeries(urls=[], months=months, site_clicks=array("d", site_clicks))
+    series.history_months = _history_months(covered_start, last)
+    rows = (
+        db.session.query(
+            GscPageMonthly.page_url,
+            GscPageMonthly.month,
+            GscPageMonthly.clicks,
+            GscPageMonthly.impressions,
+            GscPageMonthly.position,
+        )
+        .filter(
+            GscPageMonthly.site_id == site_id,
+            GscPageMonthly.month >= first,
+            GscPageMonthly.month <= last,
+        )
+        .order_by(GscPageMonthly.page_url, GscPageMonthly.month)
+        .yield_per(5000)
+    )
+    zeros = [0] * months
+    current = None
+    for url, month, clicks, impressions, position in rows:
+        if url != current:
+            # Nuova pagina: una riga di zeri in coda, riempita mese per mese.
+            current = url
+            offset = len(series.urls) * months
+            series.urls.append(url)
+            series.clicks.extend(zeros)
+            series.impressions.extend(zeros)
+            series.positions.extend(zeros)
+        i = offset + index[month]
+        series.clicks[i] = clicks
+        series.impressions[i] = impressions
+        series.positions[i] = position
+    return series
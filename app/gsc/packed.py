@@ -0,0 +1,174 @@
+"""Serie giornaliere compatte (GscSiteYear): un anno di un sito in una riga.
+
+Formato: per ogni anno un array per metrica, con un valore per giorno
+dell'anno (indice = giorni dal 1° gennaio, 365 o 366 posti): clicks e
+impressions uint32, ctr e position float32 (~7 cifre significative, più
+che sufficienti per grafici e medie), più `present`, un byte per giorno
+(1 = GSC ha dati per quel giorno). Sono array della stdlib salvati
+little-endian: niente dipendenze, e decodificare è una copia di memoria
+invece di un oggetto ORM per giorno.
+
+  - `encode` / `decode`: YearSeries <-> colonne della riga;
+  - `pack_site_years`: ricostruisce da GscSiteDaily gli anni che contengono
+    [start, end] (lo chiamano i sync se GSC_PACKED_SERIES è attivo);
+  - `drop_site_years`: cancella gli anni che contengono [start, end] (i
+    sync con l'opzione spenta, se cambiano righe: così riattivandola non si
+    leggono anni vecchi, si ripiega sulle righe finché non si reimpacchetta);
+  - `pack_all_sites`: tutti gli anni di tutti i siti (`flask pack-series`,
+    da lanciare quando si attiva l'opzione su uno storico esistente);
+  - `read_days`: i giorni con dati tra start ed end, dai blob. None se manca
+    uno degli anni: chi legge (history.get_site_series) ripiega sulle righe
+    giornaliere.
+"""
+import calendar
+import sys
+from array import array
+from dataclasses import dataclass
+from datetime import date, timedelta
+from itertools import compress
+
+from sqlalchemy import func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.models import GscSiteDaily, GscSiteYear
+
+METRICS = (("clicks", "I"), ("impressions", "I"), ("ctr", "f"), ("position", "f"))
+COLUMNS = ("present",) + tuple(name for name, _ in METRICS)
+
+_SWAP = sys.byteorder == "big"  # su disco sempre little-endian
+_INSERT_BY_DIALECT = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+@dataclass
+class YearSeries:
+    """Un anno di metriche giornaliere, una colonna per metrica."""
+
+    year: int
+    present: bytearray
+    clicks: array
+    impressions: array
+    ctr: array
+    position: array
+
+    @classmethod
+    def empty(cls, year):
+        n = 366 if calendar.isleap(year) else 365
+        return cls(year, bytearray(n), *(array(code, bytes(4 * n)) for _, code in METRICS))
+
+    def set(self, day, clicks, impressions, ctr, position):
+        i = (day - date(self.year, 1, 1)).days
+        self.present[i] = 1
+        self.clicks[i] = clicks
+        self.impressions[i] = impressions
+        self.ctr[i] = ctr
+        self.position[i] = position
+
+    def days(self, start=None, end=None):
+        """(data, clicks, impressions, ctr, position) dei giorni con dati
+        tra start ed end inclusi (default: tutto l'anno)."""
+        first = date(self.year, 1, 1)
+        lo = max(0, (start - first).days) if start else 0
+        hi = min(len(self.present), (end - first).days + 1) if end else len(self.present)
+        for i in compress(range(lo, hi), self.present[lo:hi]):
+            yield first + timedelta(days=i), self.clicks[i], self.impressions[i], self.ctr[i], self.position[i]
+
+
+def _pack(values):
+    if _SWAP:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(code, blob):
+    values = array(code, blob)
+    if _SWAP:
+        values.byteswap()
+    return values
+
+
+def encode(series):
+    """Colonne di GscSiteYear (senza site_id) per una YearSeries."""
+    row = {"year": series.year, "present": bytes(series.present)}
+    for name, _ in METRICS:
+        row[name] = _pack(getattr(series, name))
+    return row
+
+
+def decode(row):
+    """YearSeries da una riga GscSiteYear (o qualunque oggetto con le stesse colonne)."""
+    return YearSeries(
+        row.year, bytearray(row.present), *(_unpack(code, getattr(row, name)) for name, code in METRICS)
+    )
+
+
+def pack_site_years(site_id, start, end):
+    """Riscrive gli anni che contengono [start, end] dalle righe giornaliere
+    (anche quelli senza dati, così la lettura non ripiega sulle righe).
+    L'UPDATE scatta solo per gli anni cambiati. Ritorna gli anni scritti."""
+    years = {y: YearSeries.empty(y) for y in range(start.year, end.year + 1)}
+    rows = db.session.query(
+        GscSiteDaily.date,
+        GscSiteDaily.clicks,
+        GscSiteDaily.impressions,
+        GscSiteDaily.ctr,
+        GscSiteDaily.position,
+    ).filter(
+        GscSiteDaily.site_id == site_id,
+        GscSiteDaily.date >= date(start.year, 1, 1),
+        GscSiteDaily.date <= date(end.year, 12, 31),
+    )
+    for day, *values in rows:
+        years[day.year].set(day, *values)
+
+    table = GscSiteYear.__table__
+    stmt = _INSERT_BY_DIALECT[db.engine.dialect.name](table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["site_id", "year"],
+        set_={c: stmt.excluded[c] for c in COLUMNS},
+        where=or_(*(table.c[c] != stmt.excluded[c] for c in COLUMNS)),
+    )
+    db.session.execute(stmt, [{"site_id": site_id, **encode(s)} for s in years.values()])
+    db.session.commit()
+    return len(years)
+
+
+def drop_site_years(site_id, start, end):
+    """Cancella gli anni impacchettati che contengono [start, end]. Ritorna
+    quanti ne ha cancellati."""
+    deleted = GscSiteYear.query.filter(
+        GscSiteYear.site_id == site_id,
+        GscSiteYear.year >= start.year,
+        GscSiteYear.year <= end.year,
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def pack_all_sites():
+    """Impacchetta l'intero storico di ogni sito. Ritorna {site_id: anni}."""
+    spans = db.session.query(
+        GscSiteDaily.site_id, func.min(GscSiteDaily.date), func.max(GscSiteDaily.date)
+    ).group_by(GscSiteDaily.site_id).all()
+    return {site_id: pack_site_years(site_id, first, last) for site_id, first, last in spans}
+
+
+def read_days(site_id, start, end):
+    """Giorni con dati tra start ed end, in ordine, come tuple (data, clicks,
+    impressions, ctr, position). None se qualche anno non è impacchettato."""
+    rows = (
+        GscSiteYear.query.filter(
+            GscSiteYear.site_id == site_id,
+            GscSiteYear.year >= start.year,
+            GscSiteYear.year <= end.year,
+        )
+        .order_by(GscSiteYear.year)
+        .all()
+    )
+    if len(rows) != end.year - start.year + 1:
+        return None
+    days = []
+    for row in rows:
+        days.extend(decode(row).days(start, end))
+    return days
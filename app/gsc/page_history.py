@@ -0,0 +1,172 @@
+"""Storico giornaliero per pagina (GscPageDaily).
+
+  - `sync_page_daily`: scarica dimensions=["page"] un giorno alla volta,
+    paginando con startRow finché l'API ha righe (niente tetto a 25.000), e
+    scrive ogni blocco con `bulk_upsert` appena arriva: in memoria c'è al più
+    una pagina di risposta. Dopo ogni giorno completo avanza il watermark
+    `GscSyncState.pages_synced_through`, così un job interrotto riprende dal
+    giorno successivo. A ogni mese completato ne ricalcola il rollup mensile
+    (GscPageMonthly, app/gsc/monthly.py). Lo lancia lo scheduler
+    (app/gsc/ingest.py), non la richiesta web: il backfill sono
+    PAGE_HISTORY_DAYS chiamate.
+  - `get_page_totals`: righe della tabella pagine della vista Insights
+    (periodo + click del precedente) con un solo GROUP BY, se lo storico per
+    pagina copre le due finestre; altrimenti None e insights.py va live.
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import case, func
+
+from app.extensions import db
+from app.gsc.history import FRESH_DAYS, GSC_LAG_DAYS, bulk_upsert, data_changed
+from app.gsc.monthly import month_start, refresh_page_months
+from app.gsc.site_ids import get_site_id
+from app.metrics.timing import span
+from app.models import GscPageDaily, GscSyncState
+
+PAGE_HISTORY_DAYS = 180  # periodo più lungo della dashboard (90) + il precedente
+PAGE_ROWS = 25000        # righe per chiamata: il massimo consentito dall'API
+
+
+def _iter_page_rows(service, site_url, day):
+    """Blocchi di righe (dimensions=["page"]) per un giorno, finché l'API ne ha."""
+    start_row = 0
+    while True:
+        body = {
+            "startDate": day.isoformat(),
+            "endDate": day.isoformat(),
+            "dimensions": ["page"],
+            "rowLimit": PAGE_ROWS,
+            "startRow": start_row,
+        }
+        with span("gsc"):
+            rows = service.searchanalytics().query(siteUrl=site_url, body=body).execute().get("rows", [])
+        if rows:
+            yield rows
+        if len(rows) < PAGE_ROWS:
+            return
+        start_row += len(rows)
+
+
+def sync_page_daily(service, user_id, site_url):
+    """Porta GscPageDaily fino a ieri, riprendendo dall'ultimo giorno completo
+    (più la coda FRESH_DAYS che GSC può ancora correggere). Ritorna le righe
+    inserite o cambiate. Gira dopo `sync_site_daily`, che registra il sito:
+    se non è registrato Google non l'ha mai accettato, e non c'è niente da
+    scaricare."""
+    site_id = get_site_id(user_id, site_url)
+    if site_id is None:
+        return 0
+    end = date.today() - timedelta(days=1)
+    oldest = end - timedelta(days=PAGE_HISTORY_DAYS - 1)
+    state = GscSyncState.query.filter_by(site_id=site_id).first()
+    if state is None:
+        state = GscSyncState(site_id=site_id)
+        db.session.add(state)
+
+    if state.pages_synced_through is None:
+        start = oldest
+    else:
+        start = max(oldest, state.pages_synced_through - timedelta(days=FRESH_DAYS - 1))
+
+    written = 0
+    day = start
+    while day <= end:
+        day_written = 0
+        for rows in _iter_page_rows(service, site_url, day):
+            day_written += bulk_upsert(
+                GscPageDaily,
+                [
+                    {
+                        "site_id": site_id,
+                        "page_url": r["keys"][0],
+                        "date": day,
+                        "clicks": int(r.get("clicks", 0)),
+                        "impressions": int(r.get("impressions", 0)),
+                        "ctr": float(r.get("ctr", 0.0)),
+                        "position": float(r.get("position", 0.0)),
+                    }
+                    for r in rows
+                ],
+                key=("site_id", "page_url", "date"),
+            )
+        if day_written:
+            data_changed(state)
+        written += day_written
+        if state.pages_covered_start is None or day < state.pages_covered_start:
+            state.pages_covered_start = day
+        state.pages_synced_through = max(day, state.pages_synced_through or day)
+        db.session.commit()  # watermark per giorno: è il punto di ripresa
+        next_day = day + timedelta(days=1)
+        if next_day > end or next_day.day == 1:
+            # Mese completato (o fine giro): rollup solo di questo mese, così
+            # un job interrotto lascia i mesi già chiusi aggiornati.
+            refresh_page_months(site_id, max(start, month_start(day)), day)
+        day = next_day
+    return written
+
+
+def _pages_covered(state, start, end):
+    return (
+        state is not None
+        and state.pages_covered_start is not None
+        and state.pages_covered_start <= start
+        and state.pages_synced_through >= end - timedelta(days=GSC_LAG_DAYS)
+    )
+
+
+def get_page_totals(user_id, site_url, start, end, prev_start, prev_end, limit=None):
+    """Pagine con impressioni nel periodo, con i totali del periodo e i click
+    del precedente. None se lo storico per pagina non copre le due finestre.
+    Ordinate come la tabella della vista (calo di click maggiore per primo,
+    come insights._pct_delta, a parità per url): con `limit` il DB ritorna
+    solo le prime, invece di tutte le pagine del sito."""
+    site_id = get_site_id(user_id, site_url)
+    state = GscSyncState.query.filter_by(site_id=site_id).first() if site_id else None
+    if not _pages_covered(state, prev_start, end):
+        return None
+
+    # Somme per pagina in una subquery e delta/filtro/ordine fuori: ripetuti
+    # nella stessa SELECT, i SUM con parametri legati sarebbero espressioni
+    # distinte e il DB li calcolerebbe due volte.
+    cur = GscPageDaily.date >= start
+    totals = (
+        db.session.query(
+            GscPageDaily.page_url.label("url"),
+            func.sum(case((cur, GscPageDaily.clicks), else_=0)).label("clicks"),
+            func.sum(case((cur, GscPageDaily.impressions), else_=0)).label("impressions"),
+            func.sum(case((cur, GscPageDaily.position * GscPageDaily.impressions), else_=0.0)).label("weighted"),
+            func.sum(case((cur, 0), else_=GscPageDaily.clicks)).label("prev_clicks"),
+        )
+        .filter(
+            GscPageDaily.site_id == site_id,
+            GscPageDaily.date >= prev_start,
+            GscPageDaily.date <= end,
+        )
+        .group_by(GscPageDaily.page_url)
+        .subquery()
+    )
+    t = totals.c
+    delta_pct = case(
+        (t.prev_clicks == 0, case((t.clicks == 0, 0.0), else_=100.0)),
+        else_=(t.clicks - t.prev_clicks) * 100.0 / t.prev_clicks,
+    )
+    rows = (
+        db.session.query(t.url, t.clicks, t.impressions, t.weighted, t.prev_clicks)
+        .filter(t.impressions > 0)
+        .order_by(delta_pct, t.url)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "url": url,
+            "clicks": int(clicks),
+            "impressions": int(impr),
+            # Pesati sulle impressioni, come le metriche aggregate di GSC.
+            "ctr": clicks / impr,
+            "position": weighted_position / impr,
+            "clicks_prev": int(prev_clicks),
+        }
+        for url, clicks, impr, weighted_position, prev_clicks in rows
+    ]
@@ -2,13 +2,40 @@
 
 Fa da ponte tra google.oauth2.credentials.Credentials (oggetto della libreria
 Google) e GscConnection (riga DB, con i token cifrati).
+
+Le credenziali decifrate restano in una cache di processo per
+CREDENTIALS_TTL secondi: quasi ogni richiesta della dashboard le rilegge, e
+senza cache ognuna costerebbe una SELECT e due decrypt. Alla fine della
+richiesta `save_if_refreshed` riscrive su DB solo se google-auth ha davvero
+rinfrescato il token. La cache si invalida a ogni salvataggio (callback OAuth,
+refresh) e alla disconnessione.
+
+`rotate_token_encryption` ricifra i token con la chiave primaria dopo un
+cambio di TOKEN_ENCRYPTION_KEY (`flask rotate-token-key`).
 """
+import threading
+import time
+
+from cryptography.fernet import InvalidToken
 from flask import current_app
+from sqlalchemy import bindparam, update
 
 from app.extensions import db
-from app.gsc.crypto import decrypt, encrypt
+from app.gsc.crypto import decrypt, encrypt, rotate
+from app.metrics.timing import span
 from app.models import GscConnection
 
+CREDENTIALS_TTL = 60  # secondi; corto: gli altri worker vedono una disconnessione entro questo tempo
+ROTATION_BATCH = 500  # connessioni lette e riscritte per transazione
+
+_cache = {}  # user_id -> (letto_alle, creds)
+_cache_lock = threading.Lock()
+
+
+def _invalidate(user_id: int) -> None:
+    with _cache_lock:
+        _cache.pop(user_id, None)
+
 
 def credentials_to_dict(credentials) -> dict:
     return {
@@ -21,39 +48,61 @@ def credentials_to_dict(credentials) -> dict:
 
 
 def save_gsc_credentials(user_id: int, creds: dict) -> GscConnection:
-    connection = GscConnection.query.filter_by(user_id=user_id).first()
-    if connection is None:
-        connection = GscConnection(user_id=user_id)
-        db.session.add(connection)
-
-    connection.access_token = encrypt(creds["token"])
-    # Google manda il refresh_token solo al primo consenso: se una chiamata
-    # successiva non lo restituisce, non sovrascrivere quello già salvato.
-    if creds.get("refresh_token"):
-        connection.refresh_token = encrypt(creds["refresh_token"])
-    connection.token_uri = creds["token_uri"]
-    scopes = creds.get("scopes") or []
-    connection.scopes = ",".join(scopes) if isinstance(scopes, (list, tuple)) else scopes
-    connection.expiry = creds.get("expiry")
+    with span("credentials"):
+        connection = GscConnection.query.filter_by(user_id=user_id).first()
+        if connection is None:
+            connection = GscConnection(user_id=user_id)
+            db.session.add(connection)
 
-    db.session.commit()
-    return connection
+        connection.access_token = encrypt(creds["token"])
+        # Google manda il refresh_token solo al primo consenso: se una chiamata
+        # successiva non lo restituisce, non sovrascrivere quello già salvato.
+        if creds.get("refresh_token"):
+            connection.refresh_token = encrypt(creds["refresh_token"])
+        connection.token_uri = creds["token_uri"]
+        scopes = creds.get("scopes") or []
+        connection.scopes = ",".join(scopes) if isinstance(scopes, (list, tuple)) else scopes
+        connection.expiry = creds.get("expiry")
+
+        db.session.commit()
+        _invalidate(user_id)
+        return connection
+
+
+def save_if_refreshed(user_id: int, creds: dict, credentials) -> bool:
+    """Ripersiste le credenziali solo se google-auth le ha rinfrescate durante
+    la richiesta. `creds` è il dict letto con load_gsc_credentials all'inizio:
+    il confronto è con quello, non con la cache, che un'altra richiesta
+    concorrente può aver già aggiornato con un token più recente."""
+    if credentials.token == creds["token"] and credentials.expiry == creds["expiry"]:
+        return False
+    save_gsc_credentials(user_id, credentials_to_dict(credentials))
+    return True
 
 
 def load_gsc_credentials(user_id: int) -> dict | None:
-    connection = GscConnection.query.filter_by(user_id=user_id).first()
-    if connection is None:
-        return None
+    with _cache_lock:
+        cached = _cache.get(user_id)
+    if cached is not None and time.monotonic() - cached[0] < CREDENTIALS_TTL:
+        return dict(cached[1])
 
-    return {
-        "token": decrypt(connection.access_token),
-        "refresh_token": decrypt(connection.refresh_token) if connection.refresh_token else None,
-        "token_uri": connection.token_uri,
-        "client_id": current_app.config["GOOGLE_CLIENT_ID"],
-        "client_secret": current_app.config["GOOGLE_CLIENT_SECRET"],
-        "scopes": connection.scopes.split(",") if connection.scopes else [],
-        "expiry": connection.expiry,
-    }
+    with span("credentials"):
+        connection = GscConnection.query.filter_by(user_id=user_id).first()
+        if connection is None:
+            return None
+
+        creds = {
+            "token": decrypt(connection.access_token),
+            "refresh_token": decrypt(connection.refresh_token) if connection.refresh_token else None,
+            "token_uri": connection.token_uri,
+            "client_id": current_app.config["GOOGLE_CLIENT_ID"],
+            "client_secret": current_app.config["GOOGLE_CLIENT_SECRET"],
+            "scopes": connection.scopes.split(",") if connection.scopes else [],
+            "expiry": connection.expiry,
+        }
+    with _cache_lock:
+        _cache[user_id] = (time.monotonic(), creds)
+    return dict(creds)
 
 
 def delete_gsc_credentials(user_id: int) -> bool:
@@ -62,4 +111,62 @@ def delete_gsc_credentials(user_id: int) -> bool:
         return False
     db.session.delete(connection)
     db.session.commit()
+    _invalidate(user_id)
     return True
+
+
+def rotate_token_encryption(batch_size=ROTATION_BATCH):
+    """Ricifra con la chiave primaria i token salvati con una chiave ritirata.
+    Scorre gsc_connections per id a blocchi di `batch_size` (mai tutta la
+    tabella in memoria) e fa commit a ogni blocco, così le transazioni sono
+    brevi e il traffico web non resta in attesa. L'UPDATE è condizionato
+    al token letto: se nel frattempo una richiesta ha salvato un token nuovo
+    (già cifrato con la primaria), vince quello. Il testo in chiaro non
+    cambia, quindi la cache delle credenziali resta valida. Una connessione
+    che nessuna chiave decifra si salta (con un warning e il suo id), non
+    ferma la rotazione delle altre.
+    Ritorna (connessioni lette, connessioni ricifrate, connessioni saltate)."""
+    table = GscConnection.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("row_id"), table.c.access_token == bindparam("old_access"))
+        .values(access_token=bindparam("new_access"), refresh_token=bindparam("new_refresh"))
+    )
+    # Con executemany non tutti i driver sommano il rowcount (psycopg2 no):
+    # lì una UPDATE per riga, altrimenti il conteggio non sarebbe vero.
+    multi_rowcount = db.engine.dialect.supports_sane_multi_rowcount
+    last_id, seen, rotated, failed = 0, 0, 0, 0
+    while True:
+        rows = (
+            db.session.query(table.c.id, table.c.access_token, table.c.refresh_token)
+            .filter(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        changes = []
+        for row_id, access, refresh in rows:
+            try:
+                new_access, new_refresh = rotate(access), rotate(refresh)
+            except InvalidToken:
+                current_app.logger.warning("Token della connessione %d non decifrabile: non ricifrato.", row_id)
+                failed += 1
+                continue
+            if new_access or new_refresh:
+                changes.append({
+                    "row_id": row_id,
+                    "old_access": access,
+                    "new_access": new_access or access,
+                    "new_refresh": new_refresh or refresh,
+                })
+        conn = db.session.connection()
+        if changes and multi_rowcount:
+            rotated += conn.execute(stmt, changes).rowcount
+        else:
+            rotated += sum(conn.execute(stmt, change).rowcount for change in changes)
+        db.session.commit()
+        seen += len(rows)
+        last_id = rows[-1].id
+    return seen, rotated, failed
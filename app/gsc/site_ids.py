@@ -0,0 +1,45 @@
+"""Id interi dei siti (registro `sites`, modello Site).
+
+Le API del progetto ragionano per (user_id, site_url); le tabelle dello
+storico e dei risultati AI per `site_id`. Qui la traduzione:
+  - `get_site_id`: l'id se il sito è già registrato, altrimenti None (chi
+    legge non ha niente da leggere);
+  - `ensure_site_id`: lo registra se manca (chi scrive), senza gare tra
+    processi grazie a INSERT ... ON CONFLICT DO NOTHING. Solo per property
+    che Google ha accettato: il sync la chiama dopo la prima query riuscita.
+Gli id non cambiano mai: una volta trovati restano in una mappa di processo,
+così la traduzione non costa una query a ogni richiesta.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.models import Site
+
+_INSERT_BY_DIALECT = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+# (user_id, site_url) -> id, per processo e senza limite: una voce per sito
+# registrato, poche decine di byte l'una, quindi non serve sfrattare.
+_ids = {}
+
+
+def get_site_id(user_id, site_url):
+    key = (user_id, site_url)
+    site_id = _ids.get(key)
+    if site_id is None:
+        site_id = db.session.query(Site.id).filter_by(user_id=user_id, site_url=site_url).scalar()
+        if site_id is not None:
+            _ids[key] = site_id
+    return site_id
+
+
+def ensure_site_id(user_id, site_url):
+    site_id = get_site_id(user_id, site_url)
+    if site_id is None:
+        stmt = _INSERT_BY_DIALECT[db.engine.dialect.name](Site.__table__).values(
+            user_id=user_id, site_url=site_url, created_at=datetime.now(timezone.utc).replace(tzinfo=None)
+        )
+        db.session.execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "site_url"]))
+        db.session.commit()
+        site_id = get_site_id(user_id, site_url)
+    return site_id
@@ -0,0 +1,71 @@
+"""Elenco delle property verificate per utente, salvato su DB (registro Site).
+
+`/gsc/api/sites` e `/gsc/sites` chiamavano `sites().list()` a ogni apertura
+della dashboard, ma le property di un account cambiano di rado. Qui:
+  - `refresh_sites`: chiede l'elenco a Google e sostituisce quello salvato.
+    La chiamano il callback OAuth, lo scheduler (app/gsc/ingest.py) e il
+    "refresh" esplicito dalla dashboard. Le property sparite non si
+    cancellano (lo storico è legato al loro `site_id`): perdono solo
+    `permission_level`.
+  - `cached_sites`: l'elenco dal DB se aggiornato entro SITES_TTL_HOURS,
+    altrimenti None (e la route ripiega su `refresh_sites`).
+"""
+from datetime import datetime, timedelta, timezone
+
+from app.extensions import db
+from app.gsc.client import verified_sites
+from app.models import Site
+
+SITES_TTL_HOURS = 24
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _as_dict(site):
+    return {"siteUrl": site.site_url, "permissionLevel": site.permission_level}
+
+
+def cached_sites(user_id):
+    """Property salvate per l'utente, o None se mancano o sono scadute.
+
+    Un account senza property non lascia righe: risulta sempre da
+    rinfrescare, che è il comportamento voluto (appena ne verifica una, la
+    dashboard la vede)."""
+    rows = (
+        Site.query.filter(Site.user_id == user_id, Site.permission_level.isnot(None))
+        .order_by(Site.site_url)
+        .all()
+    )
+    if not rows or min(r.fetched_at for r in rows) < _utcnow() - timedelta(hours=SITES_TTL_HOURS):
+        return None
+    return [_as_dict(r) for r in rows]
+
+
+def refresh_sites(service, user_id):
+    """Rilegge le property verificate da Google e le salva. Ritorna l'elenco
+    nello stesso formato di `cached_sites`."""
+    fresh = {s["siteUrl"]: s["permissionLevel"] for s in verified_sites(service)}
+    now = _utcnow()
+
+    existing = {s.site_url: s for s in Site.query.filter_by(user_id=user_id).all()}
+    for site_url, site in existing.items():
+        if site_url not in fresh:
+            site.permission_level = None
+    for site_url, permission_level in fresh.items():
+        site = existing.get(site_url)
+        if site is None:
+            site = Site(user_id=user_id, site_url=site_url)
+            db.session.add(site)
+        site.permission_level = permission_level
+        site.fetched_at = now
+    db.session.commit()
+
+    return [{"siteUrl": url, "permissionLevel": fresh[url]} for url in sorted(fresh)]
+
+
+def delete_sites(user_id):
+    """Disconnessione: l'elenco si svuota, i siti (e il loro storico) restano."""
+    Site.query.filter_by(user_id=user_id).update({"permission_level": None, "fetched_at": None})
+    db.session.commit()
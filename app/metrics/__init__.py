@@ -0,0 +1,2 @@
+"""Strumentazione: span di tempo per richiesta (header Server-Timing) e
+istogrammi di processo esposti su /metrics. Vedi timing.py."""
@@ -0,0 +1,48 @@
+"""/metrics: istogrammi degli span (app/metrics/timing.py) e contatori
+DeepSeek nel formato testo di Prometheus. Solo per il team (`is_admin`),
+come /admin: a chi non lo è risponde 403, senza redirect al login, perché
+chi lo legge è uno scraper, non un browser."""
+from flask import Blueprint, Response, abort
+from flask_login import current_user
+
+from app.ai import deepseek
+from app.metrics.timing import BUCKETS, histograms
+
+metrics_bp = Blueprint("metrics", __name__)
+
+_HISTOGRAMS = (
+    ("span", "linkbay_span_seconds", "span", "Durata degli span (gsc, deepseek, credentials, db)."),
+    ("request", "linkbay_request_seconds", "endpoint", "Durata delle richieste per endpoint."),
+)
+
+
+def _histogram_lines(name, label, help_text, series):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for value, (cumulative, count, total) in sorted(series.items()):
+        for bound, n in zip(BUCKETS, cumulative):
+            lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {n}')
+        lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{{label}="{value}"}} {total:.6f}')
+        lines.append(f'{name}_count{{{label}="{value}"}} {count}')
+    return lines
+
+
+def render():
+    """Testo Prometheus con gli istogrammi e i contatori del processo."""
+    snapshot = histograms()
+    lines = []
+    for metric, name, label, help_text in _HISTOGRAMS:
+        series = {value: data for (kind, value), data in snapshot.items() if kind == metric}
+        lines.extend(_histogram_lines(name, label, help_text, series))
+    for key, value in sorted(deepseek.metrics().items()):
+        name = f"linkbay_deepseek_{key}_total"
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+@metrics_bp.route("/metrics")
+def metrics():
+    if not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+    return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,179 @@
+"""Span di tempo, header Server-Timing e istogrammi di processo.
+
+  - `span(name)`: context manager intorno a un'operazione lenta (query a
+    Search Console, chiamate DeepSeek, cifratura, lettura/scrittura delle
+    credenziali). Le query SQL sono misurate da listener sugli engine
+    (span "db"), senza toccare il codice che le esegue.
+  - Ogni span finisce in due posti: l'istogramma di processo del suo nome
+    (letto da /metrics, app/metrics/routes.py) e, se c'è una richiesta in
+    corso, i totali della richiesta, che `after_request` scrive
+    nell'header Server-Timing (`gsc;dur=312.4;desc="5x"`, più `total`).
+  - I thread dei pool (fan-out delle query GSC) non vedono la richiesta:
+    `bind(fn)` ci aggancia la funzione che gli si passa.
+
+Spenta (TIMING_ENABLED=false, il default) `span` ritorna un context
+manager vuoto condiviso, i listener SQL non sono registrati e gli hook
+della richiesta escono subito: il costo è una lettura di variabile.
+I numeri sono per processo: con più worker gunicorn ognuno ha i suoi, e
+/metrics risponde con quelli del worker che serve la richiesta.
+"""
+import threading
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+from time import perf_counter
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # secondi
+
+_enabled = False
+_noop = nullcontext()
+_current = ContextVar("timing_spans", default=None)
+_histograms = {}  # (metrica, etichetta) -> [conteggi per bucket..., +Inf, somma]
+_lock = threading.Lock()
+
+
+class _Spans:
+    """Totali degli span di una richiesta: nome -> [secondi, conteggio]."""
+
+    def __init__(self):
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            total = self.totals.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, perf_counter() - self.started)
+
+
+def _observe(metric, label, seconds):
+    with _lock:
+        counts = _histograms.get((metric, label))
+        if counts is None:
+            counts = _histograms[(metric, label)] = [0] * (len(BUCKETS) + 2)
+        counts[bisect_left(BUCKETS, seconds)] += 1
+        counts[-1] += seconds
+
+
+def record(name, seconds):
+    """Registra uno span già misurato (nell'istogramma e nella richiesta)."""
+    if not _enabled:
+        return
+    _observe("span", name, seconds)
+    spans = _current.get()
+    if spans is not None:
+        spans.add(name, seconds)
+
+
+def span(name):
+    return _Span(name) if _enabled else _noop
+
+
+def bind(fn):
+    """`fn` che, eseguita in un altro thread, conta i suoi span nella
+    richiesta corrente. Invariata se la strumentazione è spenta."""
+    spans = _current.get() if _enabled else None
+    if spans is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        token = _current.set(spans)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return bound
+
+
+def histograms():
+    """Copia degli istogrammi: {(metrica, etichetta): (bucket cumulativi, conteggio, somma)}."""
+    with _lock:
+        items = [(key, list(counts)) for key, counts in _histograms.items()]
+    result = {}
+    for key, counts in items:
+        cumulative, running = [], 0
+        for n in counts[:-1]:
+            running += n
+            cumulative.append(running)
+        result[key] = (cumulative[:-1], running, counts[-1])
+    return result
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("timing_started", []).append(perf_counter())
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    record("db", perf_counter() - conn.info["timing_started"].pop())
+
+
+def _on_error(exception_context):
+    started = exception_context.connection.info.get("timing_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def enable(on):
+    """Accende o spegne la strumentazione nel processo."""
+    global _enabled
+    listeners = (
+        ("before_cursor_execute", _before_cursor),
+        ("after_cursor_execute", _after_cursor),
+        ("handle_error", _on_error),
+    )
+    for name, fn in listeners:
+        registered = event.contains(Engine, name, fn)
+        if on and not registered:
+            event.listen(Engine, name, fn)
+        elif not on and registered:
+            event.remove(Engine, name, fn)
+    _enabled = on
+
+
+def _start_request():
+    if _enabled:
+        g.timing_started = perf_counter()
+        g.timing_token = _current.set(_Spans())
+
+
+def _finish_request(response):
+    token = g.pop("timing_token", None)
+    if token is None:
+        return response
+    spans = token.var.get()
+    _current.reset(token)
+    elapsed = perf_counter() - g.pop("timing_started")
+    _observe("request", request.endpoint or "404", elapsed)
+    entries = [
+        f'{name};dur={seconds * 1000:.1f};desc="{count}x"'
+        for name, (seconds, count) in sorted(spans.totals.items())
+    ]
+    entries.append(f"total;dur={elapsed * 1000:.1f}")
+    response.headers["Server-Timing"] = ", ".join(entries)
+    return response
+
+
+def init_timing(app):
+    """Hook della richiesta e stato iniziale da TIMING_ENABLED. Chiamata da create_app()."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    enable(app.config["TIMING_ENABLED"])
@@ -1,12 +1,38 @@
-from app.models.ai_analysis import AiAnalyzerConfig, AiPageAnalysis
+from app.models.ai_analysis import (
+    AiAnalysisJob,
+    AiAnalyzerConfig,
+    AiPageAnalysis,
+    AiPageAnalysisWeek,
+    AiResultCache,
+)
+from app.models.ai_budget import AiBudget
 from app.models.gsc_connection import GscConnection
-from app.models.gsc_daily import GscSiteDaily
+from app.models.gsc_daily import GscPageDaily, GscSiteDaily
+from app.models.gsc_monthly import GscPageMonthly, GscSiteMonthly
+from app.models.gsc_sync_state import GscSyncState
+from app.models.gsc_yearly import GscSiteYear
+from app.models.rule_thresholds import RuleThresholds
+from app.models.schema_version import SCHEMA_VERSION, SchemaVersion
+from app.models.site import Site
 from app.models.user import User
 
 __all__ = [
     "User",
     "GscConnection",
+    "Site",
     "GscSiteDaily",
+    "GscPageDaily",
+    "GscSiteMonthly",
+    "GscPageMonthly",
+    "GscSiteYear",
+    "GscSyncState",
     "AiAnalyzerConfig",
     "AiPageAnalysis",
+    "AiPageAnalysisWeek",
+    "AiAnalysisJob",
+    "AiResultCache",
+    "AiBudget",
+    "RuleThresholds",
+    "SchemaVersion",
+    "SCHEMA_VERSION",
 ]
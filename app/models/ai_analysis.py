@@ -4,38 +4,36 @@ from app.extensions import db
 
 
 class AiAnalyzerConfig(db.Model):
-    """Stato dell'AI Analyzer per (utente, sito). L'analisi AI parte solo se
+    """Stato dell'AI Analyzer per sito (Site). L'analisi AI parte solo se
     `enabled` è True (switch in UI). `last_run_at` serve a rispettare la cadenza
     settimanale ed evitare chiamate DeepSeek inutili (costo)."""
 
     __tablename__ = "ai_analyzer_config"
     __table_args__ = (
-        db.UniqueConstraint("user_id", "site_url", name="uq_ai_config"),
+        db.UniqueConstraint("site_id", name="uq_ai_config"),
     )
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
-    site_url = db.Column(db.String(500), nullable=False)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=False)
     enabled = db.Column(db.Boolean, nullable=False, default=False)
     last_run_at = db.Column(db.DateTime, nullable=True)
 
     def __repr__(self):
-        return f"<AiAnalyzerConfig {self.site_url} enabled={self.enabled}>"
+        return f"<AiAnalyzerConfig site={self.site_id} enabled={self.enabled}>"
 
 
 class AiPageAnalysis(db.Model):
     """Risultato AI per singola pagina: uno score 0-100 (usato dalla
     radial-progress) e fino a 5 suggerimenti concreti (mostrati nello stack).
-    Una riga per (utente, sito, pagina), aggiornata a ogni run settimanale."""
+    Una riga per (sito, pagina), aggiornata a ogni run settimanale."""
 
     __tablename__ = "ai_page_analysis"
     __table_args__ = (
-        db.UniqueConstraint("user_id", "site_url", "page_url", name="uq_ai_page"),
+        db.UniqueConstraint("site_id", "page_url", name="uq_ai_page"),
     )
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
-    site_url = db.Column(db.String(500), nullable=False)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=False)
     page_url = db.Column(db.String(2048), nullable=False)
 
     score = db.Column(db.Integer, nullable=False, default=0)
@@ -47,3 +45,81 @@ class AiPageAnalysis(db.Model):
 
     def __repr__(self):
         return f"<AiPageAnalysis {self.page_url} score={self.score}>"
+
+
+class AiPageAnalysisWeek(db.Model):
+    """Storico settimanale dei risultati AI: una riga per (sito, pagina,
+    settimana), mai sovrascritta dalle settimane successive (un nuovo
+    run nella stessa settimana aggiorna la sua). AiPageAnalysis resta la
+    fotografia dell'ultimo run; da qui si leggono i trend dello score."""
+
+    __tablename__ = "ai_page_analysis_history"
+    __table_args__ = (
+        db.UniqueConstraint("site_id", "page_url", "week_start", name="uq_ai_page_week"),
+        db.Index("ix_ai_history_site_week", "site_id", "week_start"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=False)
+    page_url = db.Column(db.String(2048), nullable=False)
+    week_start = db.Column(db.Date, nullable=False)
+
+    score = db.Column(db.Integer, nullable=False, default=0)
+    suggestions = db.Column(db.JSON, nullable=False, default=list)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<AiPageAnalysisWeek {self.page_url} {self.week_start} score={self.score}>"
+
+
+class AiAnalysisJob(db.Model):
+    """Analisi AI di un sito richiesta dal suo utente (`site.user_id`),
+    eseguita fuori dalla richiesta web (app/ai/jobs.py). Ciclo di vita di
+    `status`: queued -> running -> done | failed. Se fallisce, `error` è un
+    codice per la UI ("ai_failed", "query_failed", "not_connected",
+    "timeout") e `message` il dettaglio.
+
+    Un job "running" è di chi lo esegue finché `lease_until` è nel futuro
+    (il worker la rinnova mentre lavora); scaduta, il processo è morto e il
+    job si può riprendere. `attempts` conta le prese in carico."""
+
+    __tablename__ = "ai_analysis_jobs"
+    __table_args__ = (
+        db.Index("ix_ai_job_site_status", "site_id", "status"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=False)
+    site = db.relationship("Site")
+
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)
+    error = db.Column(db.String(50), nullable=True)
+    message = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    lease_until = db.Column(db.DateTime, nullable=True)
+    # server_default: la migrazione copia le righe con un INSERT ... SELECT.
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    def __repr__(self):
+        return f"<AiAnalysisJob {self.id} site={self.site_id} {self.status}>"
+
+
+class AiResultCache(db.Model):
+    """Risultato AI per una pagina indirizzato per contenuto: `fingerprint` è
+    l'hash di URL + metriche arrotondate (app/ai/service.py). Se al run
+    successivo la pagina ha la stessa impronta, score e suggerimenti si
+    riprendono da qui e la pagina non va nel prompt DeepSeek."""
+
+    __tablename__ = "ai_result_cache"
+
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False, unique=True)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    suggestions = db.Column(db.JSON, nullable=False, default=list)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<AiResultCache {self.fingerprint[:12]} score={self.score}>"
@@ -0,0 +1,32 @@
+from app.extensions import db
+
+
+class AiBudget(db.Model):
+    """Budget dell'AI Analyzer: pagine e token stimati per run. Come per
+    RuleThresholds, la riga con `site_id` NULL è il default globale e una
+    riga per sito lo sovrascrive nei campi valorizzati; NULL eredita, fino ai
+    default di Config (AI_MAX_PAGES_PER_SITE, AI_MAX_TOKENS_PER_SITE). Si
+    tara dall'admin; app/ai/service.py `site_budget` combina i livelli."""
+
+    __tablename__ = "ai_budget"
+    __table_args__ = (
+        db.UniqueConstraint("site_id", name="uq_ai_budget"),
+        # Una sola riga globale: vedi RuleThresholds.
+        db.Index(
+            "uq_ai_budget_global",
+            db.text("(site_id IS NULL)"),
+            unique=True,
+            postgresql_where=db.text("site_id IS NULL"),
+            sqlite_where=db.text("site_id IS NULL"),
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=True)
+    site = db.relationship("Site")
+
+    max_pages = db.Column(db.Integer, nullable=True)
+    max_tokens = db.Column(db.Integer, nullable=True)
+
+    def __repr__(self):
+        return f"<AiBudget {self.site_id or 'default'}>"
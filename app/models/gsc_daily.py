@@ -7,19 +7,21 @@ class GscSiteDaily(db.Model):
     totali/delta di un periodo in modo preciso e ripetibile (senza rifare la
     query live ogni volta), e a conservare lo storico oltre i 16 mesi di GSC.
 
-    Una riga per (utente, sito, giorno). L'ingest è idempotente: rifare il sync
-    di un giorno già presente lo aggiorna, non lo duplica (vincolo unique).
+    Una riga per (sito, giorno). L'ingest è idempotente: rifare il sync di un
+    giorno già presente lo aggiorna, non lo duplica (vincolo unique). Il
+    vincolo (site_id, date) è anche l'unico indice: serve esattamente le
+    range query per periodo, e su Postgres la tabella si può ordinare su di
+    esso (CLUSTER, vedi app/gsc/migrate_sites.py).
     """
 
     __tablename__ = "gsc_site_daily"
     __table_args__ = (
-        db.UniqueConstraint("user_id", "site_url", "date", name="uq_site_daily"),
+        db.UniqueConstraint("site_id", "date", name="uq_site_daily"),
     )
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
-    site_url = db.Column(db.String(500), nullable=False, index=True)
-    date = db.Column(db.Date, nullable=False, index=True)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=False)
+    date = db.Column(db.Date, nullable=False)
 
     clicks = db.Column(db.Integer, nullable=False, default=0)
     impressions = db.Column(db.Integer, nullable=False, default=0)
@@ -27,4 +29,34 @@ class GscSiteDaily(db.Model):
     position = db.Column(db.Float, nullable=False, default=0.0)
 
     def __repr__(self):
-        return f"<GscSiteDaily {self.site_url} {self.date} clicks={self.clicks}>"
+        return f"<GscSiteDaily site={self.site_id} {self.date} clicks={self.clicks}>"
+
+
+class GscPageDaily(db.Model):
+    """Metriche giornaliere per pagina (dimensions=["page"], un giorno per
+    query). Riempita dallo scheduler (app/gsc/page_history.py), paginando
+    l'API oltre le 25.000 righe: la tabella pagine della vista Insights si
+    legge da qui, senza il tetto di 1000 righe della query live.
+
+    Una riga per (sito, pagina, giorno); ingest idempotente come per
+    GscSiteDaily.
+    """
+
+    __tablename__ = "gsc_page_daily"
+    __table_args__ = (
+        db.UniqueConstraint("site_id", "page_url", "date", name="uq_page_daily"),
+        db.Index("ix_page_daily_site_date", "site_id", "date"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=False)
+    page_url = db.Column(db.String(2048), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    impressions = db.Column(db.Integer, nullable=False, default=0)
+    ctr = db.Column(db.Float, nullable=False, default=0.0)
+    position = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f"<GscPageDaily {self.page_url} {self.date} clicks={self.clicks}>"
@@ -0,0 +1,55 @@
+from app.extensions import db
+
+
+class GscSiteMonthly(db.Model):
+    """Rollup mensile di GscSiteDaily (site_monthly_metrics in ARCHITECTURE.md):
+    una riga per (sito, mese), con `month` al primo del mese. CTR e
+    posizione sono pesati sulle impressioni, come le metriche aggregate di
+    GSC. La mantiene app/gsc/monthly.py dopo ogni sync, ricalcolando solo i
+    mesi toccati: grafici lunghi e confronti anno su anno leggono 16 righe
+    invece di 480. `days` conta i giorni aggregati (mese parziale se < giorni
+    del mese)."""
+
+    __tablename__ = "site_monthly_metrics"
+    __table_args__ = (
+        db.UniqueConstraint("site_id", "month", name="uq_site_monthly"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=False)
+    month = db.Column(db.Date, nullable=False)
+
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    impressions = db.Column(db.Integer, nullable=False, default=0)
+    ctr = db.Column(db.Float, nullable=False, default=0.0)
+    position = db.Column(db.Float, nullable=False, default=0.0)
+    days = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<GscSiteMonthly site={self.site_id} {self.month} clicks={self.clicks}>"
+
+
+class GscPageMonthly(db.Model):
+    """Rollup mensile di GscPageDaily (page_monthly_metrics): una riga per
+    (sito, pagina, mese). È l'ingresso del rule engine (app/rules/):
+    le serie mensili di tutte le pagine di un sito."""
+
+    __tablename__ = "page_monthly_metrics"
+    __table_args__ = (
+        db.UniqueConstraint("site_id", "page_url", "month", name="uq_page_monthly"),
+        db.Index("ix_page_monthly_site_month", "site_id", "month"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=False)
+    page_url = db.Column(db.String(2048), nullable=False)
+    month = db.Column(db.Date, nullable=False)
+
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    impressions = db.Column(db.Integer, nullable=False, default=0)
+    ctr = db.Column(db.Float, nullable=False, default=0.0)
+    position = db.Column(db.Float, nullable=False, default=0.0)
+    days = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<GscPageMonthly {self.page_url} {self.month} clicks={self.clicks}>"
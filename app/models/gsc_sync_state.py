@@ -0,0 +1,45 @@
+from app.extensions import db
+
+
+class GscSyncState(db.Model):
+    """Watermark del sync dello storico per sito (Site): quando è stato
+    fatto l'ultimo sync e quale intervallo di giorni copre GscSiteDaily.
+
+    Serve a non rifare la chiamata a Search Console a ogni apertura della
+    dashboard: i dati GSC cambiano poche volte al giorno, quindi finché il
+    watermark è fresco e copre la finestra richiesta la vista legge solo dal DB.
+
+    `pages_covered_start`/`pages_synced_through` fanno lo stesso per lo
+    storico per pagina (GscPageDaily), che si scarica un giorno alla volta:
+    `pages_synced_through` è l'ultimo giorno completato, da cui riprendere.
+
+    `data_version` cresce a ogni sync che scrive righe nuove o cambiate: è la
+    versione dei dati su cui si basa la cache di /gsc/api/insights.
+
+    `last_attempt_at`/`last_error` registrano l'esito dell'ultimo tentativo
+    (anche dello scheduler, vedi app/gsc/ingest.py): `last_error` è None se è
+    andato a buon fine.
+    """
+
+    __tablename__ = "gsc_sync_state"
+    __table_args__ = (
+        db.UniqueConstraint("site_id", name="uq_sync_state"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=False)
+    site = db.relationship("Site")
+
+    last_synced_at = db.Column(db.DateTime, nullable=True)
+    covered_start = db.Column(db.Date, nullable=True)
+    covered_end = db.Column(db.Date, nullable=True)
+
+    pages_covered_start = db.Column(db.Date, nullable=True)
+    pages_synced_through = db.Column(db.Date, nullable=True)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+
+    last_attempt_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    def __repr__(self):
+        return f"<GscSyncState site={self.site_id} {self.covered_start}..{self.covered_end}>"
@@ -0,0 +1,28 @@
+from app.extensions import db
+
+
+class GscSiteYear(db.Model):
+    """Un anno di GscSiteDaily in formato compatto: una riga per (sito, anno)
+    invece di 365, con le quattro metriche in array impacchettati (un valore
+    per giorno dell'anno, little-endian) e `present` che segna i giorni con
+    dati (un byte per giorno). Formato e lettura in app/gsc/packed.py; la
+    scrivono i sync se GSC_PACKED_SERIES è attivo, o `flask pack-series`.
+    """
+
+    __tablename__ = "site_yearly_series"
+    __table_args__ = (
+        db.UniqueConstraint("site_id", "year", name="uq_site_yearly"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+
+    present = db.Column(db.LargeBinary, nullable=False)
+    clicks = db.Column(db.LargeBinary, nullable=False)       # uint32
+    impressions = db.Column(db.LargeBinary, nullable=False)  # uint32
+    ctr = db.Column(db.LargeBinary, nullable=False)          # float32
+    position = db.Column(db.LargeBinary, nullable=False)     # float32
+
+    def __repr__(self):
+        return f"<GscSiteYear site={self.site_id} {self.year} days={self.present.count(1)}>"
@@ -0,0 +1,36 @@
+from app.extensions import db
+
+
+class RuleThresholds(db.Model):
+    """Soglie del rule engine (app/rules/). La riga con `site_id` NULL è il
+    default globale; una riga per sito (Site) lo sovrascrive solo nei campi
+    valorizzati (NULL = eredita). Si tarano dall'admin, senza deploy;
+    app/rules/thresholds.py `resolve` le combina con i default."""
+
+    __tablename__ = "rule_thresholds"
+    __table_args__ = (
+        db.UniqueConstraint("site_id", name="uq_rule_thresholds"),
+        # Il vincolo sopra non vale per le righe globali (NULL è diverso da
+        # NULL): è questo indice parziale a tenerne una sola.
+        db.Index(
+            "uq_rule_thresholds_global",
+            db.text("(site_id IS NULL)"),
+            unique=True,
+            postgresql_where=db.text("site_id IS NULL"),
+            sqlite_where=db.text("site_id IS NULL"),
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey("sites.id"), nullable=True)
+    site = db.relationship("Site")
+
+    min_clicks_best_month = db.Column(db.Integer, nullable=True)
+    min_pct_loss = db.Column(db.Float, nullable=True)
+    min_abs_loss = db.Column(db.Float, nullable=True)
+    window_months = db.Column(db.Integer, nullable=True)
+    persistence_months = db.Column(db.Integer, nullable=True)
+    site_relative_margin = db.Column(db.Float, nullable=True)
+
+    def __repr__(self):
+        return f"<RuleThresholds {self.site_id or 'default'}>"
@@ -0,0 +1,22 @@
+from app.extensions import db
+
+# Versione dello schema che questo codice si aspetta. Va incrementata a ogni
+# modifica ai modelli (tabella o indice nuovi, migrazione come
+# `flask migrate-sites`): all'avvio un DB con versione più bassa passa da
+# create_all() e dai controlli, poi viene marcato con la versione nuova.
+SCHEMA_VERSION = 6
+
+
+class SchemaVersion(db.Model):
+    """Versione dello schema del DB, una sola riga. All'avvio l'app legge
+    questa riga invece di ispezionare ogni tabella (`_ensure_tables` in
+    app/__init__.py)."""
+
+    __tablename__ = "schema_version"
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<SchemaVersion {self.version}>"
@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+
+from app.extensions import db
+
+
+class Site(db.Model):
+    """Registro dei siti: un id intero per ogni (utente, property GSC).
+
+    Le tabelle legate a un sito (storico, rollup, watermark dei sync, job e
+    risultati AI, soglie e budget per sito) tengono solo `site_id` invece di
+    ripetere `site_url` (fino a 500 caratteri) e `user_id` su ogni riga: righe
+    e indici più stretti, range query su (site_id, date). Una riga non si
+    cancella alla disconnessione: lo storico resta legato al sito.
+
+    È anche l'elenco delle property verificate dell'utente (app/gsc/sites.py):
+    `permission_level` e `fetched_at` vengono dall'ultimo `sites().list()` di
+    Google; `permission_level` NULL = non più (o non ancora) verificata. Le
+    righe nascono da quell'elenco o al primo sync riuscito (app/gsc/history.py,
+    dopo che Google ha accettato la property): un `site_url` arrivato da una
+    richiesta non basta a registrarlo.
+    """
+
+    __tablename__ = "sites"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "site_url", name="uq_site"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    site_url = db.Column(db.String(500), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+
+    permission_level = db.Column(db.String(50), nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=True)
+
+    def __str__(self):
+        # Etichetta nelle select di Flask-Admin (soglie e budget per sito).
+        return f"{self.site_url} (utente {self.user_id})"
+
+    def __repr__(self):
+        return f"<Site {self.id} {self.site_url}>"
@@ -0,0 +1,21 @@
+"""Rule engine: quali pagine di un sito stanno perdendo traffico per conto loro.
+
+Modulo puro: non importa nulla di Flask né di SQLAlchemy. Riceve le serie
+mensili di tutte le pagine (SiteSeries) e le soglie (Thresholds), restituisce
+l'esito per pagina e i candidati alla lista (Evaluation).
+"""
+from app.rules.engine import evaluate_site
+from app.rules.thresholds import DEFAULT, SERIES_MONTHS, Thresholds, resolve
+from app.rules.types import REASONS, AlertCandidate, Evaluation, SiteSeries
+
+__all__ = [
+    "evaluate_site",
+    "Thresholds",
+    "DEFAULT",
+    "SERIES_MONTHS",
+    "resolve",
+    "SiteSeries",
+    "Evaluation",
+    "AlertCandidate",
+    "REASONS",
+]
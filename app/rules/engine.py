@@ -0,0 +1,82 @@
+"""Applica i filtri in sequenza a tutte le pagine di un sito e prepara la lista.
+
+Ogni filtro gira sulle colonne di tutte le pagine ancora in gara; appena un
+filtro ne scarta almeno metà le colonne si restringono alle sopravvissute,
+così i filtri successivi lavorano su poche pagine. Il codice di scarto di
+ogni pagina è il primo filtro fallito. Solo le pagine in lista diventano
+AlertCandidate, con posizione, trend delle impression e priorità.
+"""
+from itertools import compress, repeat
+from operator import gt, mul
+
+from app.rules.filters import FILTERS, pct_change, window_metrics
+from app.rules.scoring import priority
+from app.rules.thresholds import DEFAULT
+from app.rules.types import AlertCandidate, Evaluation
+
+
+def _weighted_position(positions, impressions):
+    weight = sum(impressions)
+    if not weight:
+        return None
+    return round(sum(map(mul, positions, impressions)) / weight, 1)
+
+
+def _candidate(series, m, t, page):
+    w = t.window_months
+    positions = series.row(series.positions, page)
+    impressions = series.row(series.impressions, page)
+    trend = None
+    if impressions:
+        before, after = sum(impressions[-2 * w:-w]), sum(impressions[-w:])
+        trend = round(pct_change(after, before), 1) if before else None
+    return AlertCandidate(
+        url=series.urls[page],
+        best_month_clicks=m.best[page],
+        click_loss_abs=round(m.loss_abs[page], 1),
+        click_loss_pct=round(m.loss_pct[page], 1),
+        position_before=_weighted_position(positions[-2 * w:-w], impressions[-2 * w:-w]) if impressions else None,
+        position_after=_weighted_position(positions[-w:], impressions[-w:]) if impressions else None,
+        impressions_trend_pct=trend,
+        site_relative_drop_pct=round(m.site_loss_pct - m.loss_pct[page], 1),
+        yoy_confirmed=True if m.yoy_applicable else None,
+    )
+
+
+def evaluate_site(series, thresholds=DEFAULT) -> Evaluation:
+    """Esito dei sei filtri per ogni pagina di `series` (SiteSeries) e i
+    candidati in lista, ordinati per priorità decrescente."""
+    t = thresholds
+    full = m = window_metrics(series, t)
+    reasons = bytearray(len(series.urls))
+    pages = range(len(series.urls))   # posizione nelle colonne di m -> pagina
+    alive = bytes(repeat(1, len(pages)))
+    for code, passes in enumerate(FILTERS, 1):
+        ok = passes(m, t)
+        for pos in compress(range(len(ok)), map(gt, alive, ok)):
+            reasons[pages[pos]] = code
+        alive = bytes(map(mul, alive, ok))
+        survivors = alive.count(1)
+        # Restringere costa un passaggio sulle colonne: conviene quando il
+        # filtro ne ha scartate almeno metà (di solito già il secondo).
+        if survivors * 2 <= len(alive):
+            keep = list(compress(range(len(alive)), alive))
+            m = m.take(keep)
+            pages = [pages[pos] for pos in keep]
+            alive = bytes(repeat(1, survivors))
+
+    evaluation = Evaluation(
+        urls=series.urls,
+        reasons=bytes(reasons),
+        best_month_clicks=full.best,
+        click_loss_abs=full.loss_abs,
+        click_loss_pct=full.loss_pct,
+        site_loss_pct=round(full.site_loss_pct, 1),
+        yoy_applicable=full.yoy_applicable,
+    )
+    for page in evaluation.passed():
+        candidate = _candidate(series, full, t, page)
+        candidate.priority_score = priority(candidate)
+        evaluation.candidates.append(candidate)
+    evaluation.candidates.sort(key=lambda c: c.priority_score, reverse=True)
+    return evaluation
@@ -0,0 +1,137 @@
+"""I sei filtri della sezione 4, applicati a tutte le pagine insieme.
+
+Invece di un ciclo Python per pagina, ogni grandezza è una colonna (`array`)
+con un valore per pagina, e ogni passo è un `map` di funzioni di `operator`
+su colonne intere: il ciclo per elemento gira in C, come un'operazione
+vettoriale, senza dipendenze. `window_metrics` calcola una volta le colonne
+che servono a più filtri; ogni filtro ha la stessa firma
+`(WindowMetrics, Thresholds) -> bytes` e ritorna 1/0 per pagina (passa/no),
+così ognuno si prova da solo su serie sintetiche. `WindowMetrics.take`
+restringe le colonne alle pagine sopravvissute, per i filtri successivi.
+"""
+from array import array
+from dataclasses import dataclass
+from itertools import repeat
+from operator import add, ge, le, mul, not_, or_, sub, truediv
+
+YEAR = 12
+
+
+def _sum(columns):
+    total = columns[0]
+    for col in columns[1:]:
+        total = map(add, total, col)  # catena pigra: un solo array alla fine
+    return array("q", total)
+
+
+def _pct(diff, base):
+    """Variazione % colonna per colonna; base 0 trattata come 1 (niente
+    divisioni per zero: una pagina che partiva da zero non è in calo)."""
+    return array("d", map(truediv, map(mul, diff, repeat(100.0)), map(max, base, repeat(1.0))))
+
+
+def pct_change(recent, previous):
+    """Come `_pct`, per un solo valore."""
+    return (recent - previous) * 100.0 / max(previous, 1.0)
+
+
+@dataclass
+class WindowMetrics:
+    columns: list          # un array per mese, ciascuno con un valore per pagina
+    best: array            # click del mese migliore
+    recent: array          # somma click della finestra recente
+    previous: array        # somma click della finestra precedente
+    loss_abs: array        # click/mese persi (negativo = calo)
+    loss_pct: array
+    yoy_applicable: bool    # storico abbastanza lungo per il filtro 5
+    site_loss_pct: float
+
+    def take(self, pages):
+        """Le stesse colonne ristrette alle posizioni `pages` (crescenti)."""
+        def pick(values):
+            return array(values.typecode, map(values.__getitem__, pages))
+        return WindowMetrics(
+            columns=[pick(col) for col in self.columns],
+            best=pick(self.best),
+            recent=pick(self.recent),
+            previous=pick(self.previous),
+            loss_abs=pick(self.loss_abs),
+            loss_pct=pick(self.loss_pct),
+            yoy_applicable=self.yoy_applicable,
+            site_loss_pct=self.site_loss_pct,
+        )
+
+
+def window_metrics(series, t):
+    n, w = series.months, t.window_months
+    if n < 2 * w:
+        raise ValueError(f"Servono almeno {2 * w} mesi di serie, ricevuti {n}.")
+    columns = [series.column(series.clicks, m) for m in range(n)]
+    recent = _sum(columns[n - w:])
+    previous = _sum(columns[n - 2 * w:n - w])
+    diff = array("q", map(sub, recent, previous))
+    site = series.site_clicks
+    return WindowMetrics(
+        columns=columns,
+        best=array("I", map(max, *columns)),
+        recent=recent,
+        previous=previous,
+        loss_abs=array("d", map(truediv, diff, repeat(float(w)))),
+        loss_pct=_pct(diff, previous),
+        yoy_applicable=n >= w + YEAR and series.history_months >= w + YEAR,
+        site_loss_pct=pct_change(sum(site[n - w:]), sum(site[n - 2 * w:n - w])),
+    )
+
+
+def passes_relevance(m, t):
+    """1. Il mese migliore ha almeno `min_clicks_best_month` click."""
+    return bytes(map(ge, m.best, repeat(t.min_clicks_best_month)))
+
+
+def passes_pct_loss(m, t):
+    """2. Ultimi `window_months` mesi vs i precedenti: calo di almeno `min_pct_loss`."""
+    return bytes(map(le, m.loss_pct, repeat(t.min_pct_loss)))
+
+
+def passes_abs_loss(m, t):
+    """3. Il calo vale almeno `min_abs_loss` click al mese."""
+    return bytes(map(le, m.loss_abs, repeat(t.min_abs_loss)))
+
+
+def passes_persistence(m, t):
+    """4. Gli ultimi `persistence_months` mesi sono tutti sotto la media della
+    finestra precedente ridotta di `min_pct_loss`: non è un mese storto."""
+    factor = (1 + t.min_pct_loss / 100.0) / t.window_months
+    limit = array("d", map(mul, m.previous, repeat(factor)))
+    ok = bytes(map(le, m.columns[-1], limit))
+    for col in m.columns[-t.persistence_months:-1]:
+        ok = bytes(map(mul, ok, map(le, col, limit)))
+    return ok
+
+
+def passes_seasonality(m, t):
+    """5. Il calo si conferma anche contro la stessa finestra dell'anno prima.
+    Con meno di un anno di storico oltre la finestra non si applica (passano
+    tutte); una pagina che un anno fa non aveva click non è stagionale."""
+    if not m.yoy_applicable:
+        return bytes(repeat(1, len(m.best)))
+    w = t.window_months
+    year_before = _sum(m.columns[-w - YEAR:-YEAR])
+    yoy_pct = _pct(map(sub, m.recent, year_before), year_before)
+    return bytes(map(or_, map(le, yoy_pct, repeat(t.min_pct_loss)), map(not_, year_before)))
+
+
+def passes_site_relative(m, t):
+    """6. La pagina scende almeno `site_relative_margin` punti più del sito."""
+    return bytes(map(le, m.loss_pct, repeat(m.site_loss_pct - t.site_relative_margin)))
+
+
+# In ordine: la posizione + 1 è il codice di scarto (types.REASONS).
+FILTERS = (
+    passes_relevance,
+    passes_pct_loss,
+    passes_abs_loss,
+    passes_persistence,
+    passes_seasonality,
+    passes_site_relative,
+)
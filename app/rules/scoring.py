@@ -0,0 +1,49 @@
+"""Sez. 5: punteggio di priorità 0-100 delle pagine in lista.
+
+Pesi e curve sono di partenza, da tarare come le soglie. Gira solo sui
+candidati (poche decine), quindi è un normale calcolo per pagina.
+"""
+import math
+
+WEIGHTS = {"value": 0.35, "severity": 0.25, "recoverability": 0.20, "demand": 0.20}
+VALUE_CEILING = 10000      # click nel mese migliore che valgono il massimo
+LAST_USEFUL_POSITION = 50  # oltre, recuperare richiede un'altra pagina
+
+
+def _clamp(value):
+    return max(0.0, min(100.0, value))
+
+
+def value_score(c):
+    """Quanto valeva: scala logaritmica sui click del mese migliore."""
+    return _clamp(100.0 * math.log10(max(c.best_month_clicks, 1)) / math.log10(VALUE_CEILING))
+
+
+def severity_score(c):
+    """Quanto sta perdendo, in percentuale."""
+    return _clamp(-c.click_loss_pct)
+
+
+def recoverability_score(c):
+    """Posizione attuale: 11 è recuperabile, 60 no."""
+    if not c.position_after:
+        return 50.0
+    return _clamp(100.0 * (LAST_USEFUL_POSITION - c.position_after) / (LAST_USEFUL_POSITION - 1))
+
+
+def demand_score(c):
+    """Impression tenute = problema di posizione (intervenire serve);
+    impression crollate = domanda finita."""
+    if c.impressions_trend_pct is None:
+        return 50.0
+    return _clamp(100.0 + min(c.impressions_trend_pct, 0.0))
+
+
+def priority(c):
+    return round(
+        value_score(c) * WEIGHTS["value"]
+        + severity_score(c) * WEIGHTS["severity"]
+        + recoverability_score(c) * WEIGHTS["recoverability"]
+        + demand_score(c) * WEIGHTS["demand"],
+        1,
+    )
@@ -0,0 +1,45 @@
+"""Soglie del rule engine: default del codice, override globali e per sito.
+
+Le soglie vivono su tabella (RuleThresholds, riga con sito NULL = default
+globale) ma questo modulo non la importa: `resolve` riceve le righe già lette
+(o dict) e le sovrappone ai default, così il motore si tara anche senza app.
+"""
+from dataclasses import dataclass, fields, replace
+
+
+@dataclass(frozen=True)
+class Thresholds:
+    min_clicks_best_month: int = 50   # filtro 1: rilevanza
+    min_pct_loss: float = -30.0       # filtro 2: calo % finestra recente vs precedente
+    min_abs_loss: float = -20.0       # filtro 3: calo in click/mese
+    window_months: int = 3            # ampiezza delle due finestre confrontate
+    persistence_months: int = 2       # filtro 4: mesi consecutivi sotto soglia
+    site_relative_margin: float = 10.0  # filtro 6: punti % in più del sito intero
+
+
+SERIES_MONTHS = 16  # mesi della serie del motore: GSC ne conserva ~16
+DEFAULT = Thresholds()
+FIELDS = tuple(f.name for f in fields(Thresholds))
+
+
+def resolve(*layers) -> Thresholds:
+    """Soglie effettive: i default, poi ogni livello nell'ordine (tipicamente
+    la riga globale e quella del sito). Un valore None lascia quello del
+    livello precedente. I livelli sono dict o oggetti con gli attributi.
+    Solleva ValueError se le due finestre non stanno nella serie
+    (2 * window_months <= SERIES_MONTHS) o la persistenza non sta nella
+    finestra."""
+    values = {}
+    for layer in layers:
+        if layer is None:
+            continue
+        for name in FIELDS:
+            value = layer.get(name) if isinstance(layer, dict) else getattr(layer, name, None)
+            if value is not None:
+                values[name] = value
+    t = replace(DEFAULT, **values)
+    if not 1 <= t.window_months <= SERIES_MONTHS // 2 or not 1 <= t.persistence_months <= t.window_months:
+        raise ValueError(
+            f"Soglie non valide: window_months={t.window_months}, persistence_months={t.persistence_months}"
+        )
+    return t
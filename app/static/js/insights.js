@@ -8,6 +8,7 @@
   if (!select) return; // account non collegato: la pagina mostra il connettore
 
   const SITES_URL = select.dataset.sitesUrl;
+  const SITES_REFRESH_URL = select.dataset.sitesRefreshUrl;
   const INSIGHTS_URL = select.dataset.insightsUrl;
   const AI_STATUS_URL = select.dataset.aiStatusUrl;
   const AI_TOGGLE_URL = select.dataset.aiToggleUrl;
@@ -336,21 +337,97 @@
     }
   });
 
+  // L'analisi gira come job sul server: la POST risponde 202 con il job, poi
+  // lo interroghiamo ogni JOB_POLL_MS passando il cursore dell'ultima
+  // risposta, così arrivano solo le pagine nuove.
+  const JOB_POLL_MS = 1500;
+  let jobTimer = null;
+  let jobWatch = 0; // cambia a ogni stop: una risposta in volo di un job abbandonato si ignora
+
+  function stopWatchingJob() {
+    if (jobTimer) clearTimeout(jobTimer);
+    jobTimer = null;
+    jobWatch += 1;
+  }
+
+  function jobFailedText(job) {
+    if (job.error === "ai_failed") return "AI provider error (check DEEPSEEK_API on the server).";
+    if (job.error === "not_connected") return "Search Console is not connected anymore. Please reconnect.";
+    return "Analysis failed. Try again later.";
+  }
+
+  async function onJobDone(job, site) {
+    stopWatchingJob();
+    if (site !== select.value) return; // nel frattempo l'utente ha cambiato sito
+    if (job.status === "failed") {
+      aiStatusText.textContent = jobFailedText(job);
+      updateRunButton({ enabled: aiToggle.checked, cooldown_days_left: 0, last_run_at: true });
+      return;
+    }
+    try {
+      const res = await fetch(AI_STATUS_URL + "?site=" + encodeURIComponent(site), {
+        headers: { Accept: "application/json" },
+      });
+      applyAiStatus(await res.json());
+      renderPages(lastPages); // ridisegna con gli score aggiornati
+      aiStatusText.textContent = "Analysis complete — open the AI column for suggestions.";
+    } catch (e) {
+      aiStatusText.textContent = "Analysis complete. Reload the page to see the results.";
+    }
+  }
+
+  function watchJob(job, site) {
+    stopWatchingJob();
+    aiRun.disabled = true;
+    aiStatusText.textContent = "Analyzing your pages with AI…";
+    // Ogni pagina arriva appena il modello la completa: mostra subito lo score.
+    const ready = new Set(); // il server rimanda le pagine a cavallo del cursore
+    let cursor = null;
+    const watch = jobWatch;
+
+    async function poll() {
+      jobTimer = null;
+      let current;
+      try {
+        const res = await fetch(job.url + (cursor ? "?since=" + encodeURIComponent(cursor) : ""), {
+          headers: { Accept: "application/json" },
+        });
+        if (!res.ok) throw new Error("HTTP " + res.status);
+        current = await res.json();
+      } catch (e) {
+        if (watch === jobWatch) jobTimer = setTimeout(poll, JOB_POLL_MS); // errore di rete: riprova al giro dopo
+        return;
+      }
+      if (watch !== jobWatch) return;
+      cursor = current.cursor;
+      const fresh = Object.entries(current.pages).filter(([url]) => !ready.has(url));
+      if (fresh.length && site === select.value) {
+        for (const [url, page] of fresh) {
+          ready.add(url);
+          aiAnalyses[url] = { score: page.score, suggestions: page.suggestions, week_start: page.week_start };
+        }
+        renderPages(lastPages);
+        aiStatusText.textContent = `Analyzing your pages with AI… ${ready.size} page(s) ready.`;
+      }
+      if (current.status === "done" || current.status === "failed") onJobDone(current, site);
+      else jobTimer = setTimeout(poll, JOB_POLL_MS);
+    }
+    poll();
+  }
+
   aiRun.addEventListener("click", async () => {
     const site = select.value;
     aiRun.disabled = true;
-    aiStatusText.textContent = "Analyzing your pages with AI…";
+    aiStatusText.textContent = "Starting the AI analysis…";
     try {
       const res = await postForm(AI_ANALYZE_URL, { site });
       const data = await res.json();
-      if (res.ok) {
-        applyAiStatus(data);
-        renderPages(lastPages); // ridisegna con gli score aggiornati
-        aiStatusText.textContent = "Analysis complete — open the AI column for suggestions.";
-      } else if (res.status === 429) {
+      if (res.status === 202) {
+        watchJob(data, site);
+        return;
+      }
+      if (res.status === 429) {
         aiStatusText.textContent = `Already run recently. Next run in ${data.days_left} day(s).`;
-      } else if (data.error === "ai_failed") {
-        aiStatusText.textContent = "AI provider error (check DEEPSEEK_API on the server).";
       } else if (data.error === "disabled") {
         aiStatusText.textContent = "Enable the AI analyzer first.";
       } else {
@@ -358,9 +435,8 @@
       }
     } catch (e) {
       aiStatusText.textContent = "Analysis failed. Try again later.";
-    } finally {
-      updateRunButton({ enabled: aiToggle.checked, cooldown_days_left: 0, last_run_at: true });
     }
+    updateRunButton({ enabled: aiToggle.checked, cooldown_days_left: 0, last_run_at: true });
   });
 
   // --- Data flow -------------------------------------------------------------
@@ -379,7 +455,12 @@
       ]);
       if (!insRes.ok) throw new Error("HTTP " + insRes.status);
       const data = await insRes.json();
-      if (aiRes.ok) applyAiStatus(await aiRes.json());
+      stopWatchingJob();
+      if (aiRes.ok) {
+        const st = await aiRes.json();
+        applyAiStatus(st);
+        if (st.job) watchJob(st.job, siteUrl); // analisi già in corso (es. pagina ricaricata)
+      }
 
       lastPages = data.pages;
       renderChart(data.series);
@@ -401,21 +482,47 @@
     if (select.value) loadSite(select.value);
   });
 
+  function fillSites(sites) {
+    const previous = select.value;
+    if (!sites || !sites.length) {
+      select.innerHTML = "<option>No sites</option>";
+      select.disabled = true;
+      show("empty");
+      return;
+    }
+    select.innerHTML = sites.map((s) => `<option value="${esc(s.siteUrl)}">${esc(s.siteUrl)}</option>`).join("");
+    select.disabled = false;
+    const keep = sites.some((s) => s.siteUrl === previous);
+    if (keep) select.value = previous;
+    loadSite(keep ? previous : sites[0].siteUrl);
+  }
+
+  select.addEventListener("change", () => loadSite(select.value));
+
+  // Refresh esplicito dell'elenco siti (di norma arriva dal DB, vedi app/gsc/sites.py)
+  const refreshBtn = document.getElementById("sites-refresh");
+  refreshBtn.addEventListener("click", async () => {
+    refreshBtn.disabled = true;
+    try {
+      const res = await fetch(SITES_REFRESH_URL, {
+        method: "POST",
+        headers: { "X-CSRFToken": CSRF, Accept: "application/json" },
+      });
+      if (!res.ok) throw new Error("HTTP " + res.status);
+      fillSites((await res.json()).sites);
+    } catch (e) {
+      showError("Couldn't refresh your Search Console sites. Please try again.");
+    } finally {
+      refreshBtn.disabled = false;
+    }
+  });
+
   async function init() {
     show("loading");
     try {
       const res = await fetch(SITES_URL, { headers: { Accept: "application/json" } });
       if (!res.ok) throw new Error("HTTP " + res.status);
-      const { sites } = await res.json();
-      if (!sites || !sites.length) {
-        select.innerHTML = "<option>No sites</option>";
-        show("empty");
-        return;
-      }
-      select.innerHTML = sites.map((s) => `<option value="${esc(s.siteUrl)}">${esc(s.siteUrl)}</option>`).join("");
-      select.disabled = false;
-      select.addEventListener("change", () => loadSite(select.value));
-      loadSite(sites[0].siteUrl);
+      fillSites((await res.json()).sites);
     } catch (e) {
       showError("Couldn't load your Search Console sites. Please reconnect and try again.");
     }
@@ -0,0 +1,9 @@
+"""Benchmark dei percorsi caldi, eseguibili senza Google né DeepSeek.
+
+Ogni modulo si lancia da solo dalla root del repo, es.:
+
+    python -m benchmarks.bench_insights
+
+`python -m benchmarks.suite` li riassume in un solo run, con risultati in
+JSON (benchmarks/results/) da confrontare tra commit con `--compare`.
+"""
@@ -0,0 +1,86 @@
+"""Avvio di un processo web: import e `create_app`, ognuno in un interprete
+nuovo (come un worker gunicorn senza preload, o un comando `flask`).
+
+  - tempo di avvio e query al DB con un DB nuovo (create_all e controlli
+    dello schema) e con un DB già alla versione corrente (una query);
+  - costo delle librerie Google rimandate al primo uso (DEFERRED_IMPORTS),
+    e verifica che all'avvio non siano caricate;
+  - i moduli più lenti da importare, dal report di `python -X importtime`.
+
+Gira su SQLite in una cartella temporanea.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RUNS = 5
+TOP = 12
+
+_CHILD = """
+import os, sys, time
+t0 = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, "before_cursor_execute", lambda *args: statements.append(1))
+from app import DEFERRED_IMPORTS, create_app, import_deferred
+from config import Config
+
+class BootConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ["BOOT_DATABASE_URL"]
+
+create_app(BootConfig)
+boot = time.perf_counter() - t0
+loaded = sum(name in sys.modules for name in DEFERRED_IMPORTS)
+t0 = time.perf_counter()
+import_deferred()
+print(boot, len(statements), loaded, time.perf_counter() - t0)
+"""
+
+
+def _run(url, importtime=False):
+    command = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", _CHILD]
+    env = dict(os.environ, BOOT_DATABASE_URL=url, PYTHONPATH=os.getcwd())
+    done = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    boot, statements, loaded, deferred = done.stdout.split()
+    return float(boot), int(statements), int(loaded), float(deferred), done.stderr
+
+
+def _slowest(report):
+    """(ms cumulativi, modulo) dei moduli importati al massimo due livelli
+    sotto il primo, dai più lenti."""
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 2:
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:TOP]
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    current = f"sqlite:///{os.path.join(workdir, 'current.db')}"
+    _run(current)  # primo avvio: porta il DB alla versione corrente
+
+    fresh = [_run(f"sqlite:///{os.path.join(workdir, f'fresh-{i}.db')}") for i in range(RUNS)]
+    warm = [_run(current) for _ in range(RUNS)]
+    print(f"avvio (import + create_app), mediana di {RUNS} processi:")
+    for label, runs in (("DB nuovo (create_all + controlli)", fresh), ("DB alla versione corrente", warm)):
+        boot = statistics.median(r[0] for r in runs) * 1000
+        print(f"  {label:<36} {boot:>7.0f}ms {runs[0][1]:>4} query")
+    deferred = statistics.median(r[3] for r in warm) * 1000
+    print(f"librerie Google caricate all'avvio: {warm[0][2]}; al primo uso costano {deferred:.0f}ms")
+
+    report = _run(current, importtime=True)[4]
+    print("moduli più lenti all'avvio (-X importtime, ms cumulativi; con -X importtime tutto rallenta):")
+    for ms, name in _slowest(report):
+        print(f"  {ms:>8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
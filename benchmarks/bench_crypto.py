@@ -0,0 +1,104 @@
+"""Rotazione della chiave dei token OAuth (app/gsc/crypto.py): CONNECTIONS
+connessioni da una chiave ritirata alla nuova, a blocchi
+(`rotate_token_encryption`) vs tutta la tabella caricata come oggetti ORM e
+un solo commit (riferimento). Tempo e picco di memoria; a parte, il costo di
+decifrare un token con la primaria e con una chiave ritirata (MultiFernet le
+prova in ordine), cioè il prezzo di una richiesta durante la rotazione.
+
+Gira su SQLite in un file temporaneo.
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+
+from cryptography.fernet import Fernet
+
+from app import create_app
+from app.extensions import db
+from app.gsc.crypto import decrypt, encrypt, rotate
+from app.gsc.repository import rotate_token_encryption
+from app.models import GscConnection, User
+from config import Config
+
+ROUNDS = 5000
+CONNECTIONS = 10_000
+OLD_KEY, NEW_KEY = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+
+
+def _per_call(fn):
+    t0 = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn()
+    return (time.perf_counter() - t0) / ROUNDS * 1e6
+
+
+def _seed(app):
+    """CONNECTIONS connessioni cifrate con la chiave vecchia."""
+    app.config.update(TOKEN_ENCRYPTION_KEY=OLD_KEY, TOKEN_ENCRYPTION_OLD_KEYS="")
+    db.session.execute(db.delete(GscConnection))
+    db.session.execute(db.delete(User))
+    db.session.execute(
+        db.insert(User),
+        [{"id": i, "name": f"u{i}", "email": f"u{i}@example.com", "password_hash": "-"} for i in range(1, CONNECTIONS + 1)],
+    )
+    access, refresh = encrypt("ya29." + "a" * 160), encrypt("1//" + "r" * 100)
+    db.session.execute(
+        db.insert(GscConnection),
+        [
+            {"user_id": i, "access_token": access, "refresh_token": refresh, "token_uri": "https://oauth2.googleapis.com/token", "scopes": "s"}
+            for i in range(1, CONNECTIONS + 1)
+        ],
+    )
+    db.session.commit()
+    app.config.update(TOKEN_ENCRYPTION_KEY=NEW_KEY, TOKEN_ENCRYPTION_OLD_KEYS=OLD_KEY)
+
+
+def _whole_table():
+    # Riferimento: tutte le righe come oggetti ORM, un commit unico.
+    for connection in GscConnection.query.all():
+        connection.access_token = rotate(connection.access_token) or connection.access_token
+        connection.refresh_token = rotate(connection.refresh_token) or connection.refresh_token
+    db.session.commit()
+
+
+def _measure(app, fn):
+    _seed(app)
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    _seed(app)
+    db.session.remove()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+        TOKEN_ENCRYPTION_KEY = NEW_KEY
+        TOKEN_ENCRYPTION_OLD_KEYS = OLD_KEY
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        current = encrypt("ya29.token")
+        retired = Fernet(OLD_KEY).encrypt(b"ya29.token").decode()
+        print(f"decrypt con la chiave primaria:  {_per_call(lambda: decrypt(current)):6.1f} µs")
+        print(f"decrypt con una chiave ritirata: {_per_call(lambda: decrypt(retired)):6.1f} µs")
+
+        print(f"rotazione di {CONNECTIONS} connessioni:")
+        for label, fn in (("a blocchi di 500", rotate_token_encryption), ("tutta la tabella", _whole_table)):
+            elapsed, peak = _measure(app, fn)
+            print(f"  {label:<18} {elapsed:6.2f}s  picco {peak:6.1f}MB")
+        sample = GscConnection.query.first()
+        app.config["TOKEN_ENCRYPTION_OLD_KEYS"] = ""
+        decrypt(sample.access_token)  # solleva se la rotazione non ha ricifrato
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Client DeepSeek contro il finto server locale (benchmarks/fake_deepseek.py):
+
+  - keep-alive: `requests.post` senza sessione (versione precedente) vs il
+    client condiviso, in chiamate sequenziali — connessioni aperte e ms per
+    chiamata (qui è solo TCP in locale; verso l'API vera ogni connessione
+    nuova costa anche l'handshake TLS);
+  - retry: i primi tentativi ricevono 429 + Retry-After e la chiamata riesce;
+  - concorrenza: molti thread insieme, il server non vede mai più di
+    DEEPSEEK_MAX_CONCURRENCY richieste in volo;
+  - streaming: tempo al primo risultato di pagina con `stream_json_items`
+    vs la risposta unica di `chat_json`, a generazione simulata token per token.
+
+Oltre ai numeri verifica il comportamento (esce con AssertionError se
+cambia): una sola connessione per le chiamate sequenziali, tanti retry
+quanti 429 e attesa di almeno Retry-After, mai più di
+DEEPSEEK_MAX_CONCURRENCY richieste in volo, tutte le pagine dallo stream.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from app import create_app
+from app.ai import deepseek
+from app.ai.service import SYSTEM_PROMPT, _compact_pages, _user_prompt
+from benchmarks.fake_deepseek import FakeDeepSeek
+from config import Config
+
+CALLS = 50
+THREADS = 16
+STREAM_PAGES = 16
+
+
+def _old_chat(url):
+    # Copia del percorso precedente: requests.post, nuova connessione ogni volta.
+    resp = requests.post(
+        f"{url}/chat/completions",
+        headers={"Authorization": "Bearer bench", "Content-Type": "application/json"},
+        json={"model": "deepseek-chat", "messages": [], "stream": False},
+        timeout=90,
+    )
+    return resp.json()
+
+
+def _check(condition, message):
+    # Non `assert`: deve fallire anche con python -O.
+    if not condition:
+        raise AssertionError(message)
+
+
+def _timed(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) * 1000 / n
+
+
+def main():
+    with FakeDeepSeek(latency=0.002) as fake:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = "sqlite://"
+            DEEPSEEK_API = "bench"
+            DEEPSEEK_BASE_URL = fake.url
+
+        app = create_app(BenchConfig)
+        app.logger.setLevel("WARNING")
+        with app.app_context():
+            fake.reset()
+            old = _timed(lambda: _old_chat(fake.url), CALLS)
+            old_conns = fake.connections
+            fake.reset()
+            new = _timed(lambda: deepseek.chat_json("system", "user"), CALLS)
+            print(f"{CALLS} chiamate sequenziali   {'ms/chiamata':>12} {'connessioni':>12}")
+            print(f"  requests.post            {old:>10.2f}ms {old_conns:>12}")
+            print(f"  client condiviso         {new:>10.2f}ms {fake.connections:>12}")
+            _check(fake.connections == 1, f"keep-alive: {fake.connections} connessioni per {CALLS} chiamate")
+
+            fake.reset(fail_first=2)
+            before = deepseek.metrics()
+            t0 = time.perf_counter()
+            deepseek.chat_json("system", "user")
+            elapsed = time.perf_counter() - t0
+            after = deepseek.metrics()
+            retries = after["retries"] - before["retries"]
+            print(
+                f"retry: 2 risposte 429 (Retry-After {fake.retry_after}s) -> ok in "
+                f"{elapsed * 1000:.0f}ms, {retries} retry, {fake.requests} richieste"
+            )
+            _check(retries == 2 and fake.requests == 3, f"retry: {retries} retry, {fake.requests} richieste")
+            _check(elapsed >= 2 * float(fake.retry_after), f"retry: Retry-After ignorato ({elapsed:.3f}s)")
+
+            fake.reset()
+            fake.latency = 0.05
+            with ThreadPoolExecutor(THREADS) as pool:
+                def call(_):
+                    with app.app_context():
+                        return deepseek.chat_json("system", "user")
+                list(pool.map(call, range(THREADS * 2)))
+            print(
+                f"concorrenza: {THREADS} thread, max in volo sul server {fake.max_in_flight} "
+                f"(limite {app.config['DEEPSEEK_MAX_CONCURRENCY']}), connessioni {fake.connections}"
+            )
+            _check(
+                fake.max_in_flight <= app.config["DEEPSEEK_MAX_CONCURRENCY"],
+                f"concorrenza: {fake.max_in_flight} richieste in volo",
+            )
+
+            fake.reset()
+            fake.latency, fake.token_delay = 0.2, 0.004  # "primo token" e ritmo di generazione
+            pages = [
+                {"url": f"https://example.com/blog/post-{i}", "clicks": 100 + i, "impressions": 4000,
+                 "ctr": 0.025, "position": 9.5, "clicks_delta_pct": -20.0}
+                for i in range(STREAM_PAGES)
+            ]
+            prompt = _user_prompt("https://example.com/", _compact_pages(pages, STREAM_PAGES))
+            t0 = time.perf_counter()
+            whole = deepseek.chat_json(SYSTEM_PROMPT, prompt)
+            blocking = time.perf_counter() - t0
+            t0, first, count = time.perf_counter(), None, 0
+            for _ in deepseek.stream_json_items(SYSTEM_PROMPT, prompt):
+                count += 1
+                first = first or time.perf_counter() - t0
+            streamed = time.perf_counter() - t0
+            print(f"streaming, {STREAM_PAGES} pagine:")
+            print(f"  chat_json: {len(whole['pages'])} pagine tutte dopo {blocking * 1000:.0f}ms")
+            print(f"  stream:    prima pagina dopo {first * 1000:.0f}ms, {count} pagine in {streamed * 1000:.0f}ms")
+            _check(len(whole["pages"]) == count == STREAM_PAGES, f"streaming: {count} pagine su {STREAM_PAGES}")
+            print(f"metriche: {deepseek.metrics()}")
+
+
+if __name__ == "__main__":
+    main()
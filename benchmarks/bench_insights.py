@@ -0,0 +1,47 @@
+"""build_insights: query in sequenza vs fan-out concorrente.
+
+Con latenza L per chiamata, il sequenziale costa ~5L; il concorrente deve
+restare vicino a L (la query più lenta).
+"""
+import time
+from datetime import date, timedelta
+
+from app.gsc.insights import _query, build_insights
+from benchmarks.fake_gsc import FakeSearchConsole
+
+LATENCY = 0.15
+ROUNDS = 5
+
+
+def _sequential(service, site_url, days):
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    prev_end = start - timedelta(days=1)
+    prev_start = prev_end - timedelta(days=days - 1)
+    _query(service, site_url, start, end, [])
+    _query(service, site_url, prev_start, prev_end, [])
+    _query(service, site_url, start, end, ["page"])
+    _query(service, site_url, prev_start, prev_end, ["page"])
+    _query(service, site_url, start, end, ["query"], row_limit=50)
+
+
+def _timed(fn):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    service = FakeSearchConsole(latency=LATENCY)
+    seq = _timed(lambda: _sequential(service, "https://example.com/", 28))
+    con = _timed(lambda: build_insights(service, "https://example.com/", days=28))
+    print(f"latenza iniettata per query: {LATENCY * 1000:.0f} ms")
+    print(f"sequenziale (5 query):  {seq * 1000:7.1f} ms")
+    print(f"concorrente (5 query):  {con * 1000:7.1f} ms  ({seq / con:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
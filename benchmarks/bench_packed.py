@@ -0,0 +1,99 @@
+"""Storico del sito: una riga per giorno (GscSiteDaily) vs un anno per riga
+in array impacchettati (GscSiteYear, app/gsc/packed.py).
+
+  - spazio su disco di tabella + indici (dbstat di SQLite), per 4 anni di
+    storico su 50 siti;
+  - latenza di `get_site_series` (la serie del grafico) su 28, 90 e 480
+    giorni, dalle righe e dai blob, e verifica che le due serie coincidano.
+
+Gira su SQLite in un file temporaneo; su PostgreSQL ogni riga ha in più
+~24 byte di header di tupla, quindi il rapporto di spazio cresce ancora.
+"""
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+from app import create_app
+from app.extensions import db
+from app.gsc.history import bulk_upsert, get_site_series
+from app.gsc.packed import pack_all_sites
+from app.gsc.site_ids import ensure_site_id
+from app.models import GscSiteDaily, GscSiteYear, User
+from config import Config
+
+SITES = 50
+YEARS = 4
+PERIODS = (28, 90, 480)
+REPEAT = 20
+
+
+def _rows(site_id, seed):
+    end = date.today() - timedelta(days=1)
+    return [
+        {
+            "site_id": site_id, "date": end - timedelta(days=i),
+            "clicks": 50 + (i * seed) % 97, "impressions": 3000 + (i * 31) % 1500,
+            "ctr": 0.021 + (i % 9) / 1000, "position": 8.0 + (i % 13) / 4,
+        }
+        for i in range(365 * YEARS)
+    ]
+
+
+def _table_bytes(table):
+    """Byte su disco della tabella e dei suoi indici."""
+    sql = (
+        "SELECT coalesce(sum(pgsize), 0) FROM dbstat WHERE name = :t "
+        "OR name IN (SELECT name FROM sqlite_schema WHERE type = 'index' AND tbl_name = :t)"
+    )
+    return db.session.execute(db.text(sql), {"t": table}).scalar()
+
+
+def _read_ms(app, user_id, sites, days, packed):
+    app.config["GSC_PACKED_SERIES"] = packed
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        for site in sites:
+            get_site_series(user_id, site, days)
+            db.session.remove()  # niente identity map tra una lettura e l'altra
+    return (time.perf_counter() - t0) * 1000 / (REPEAT * len(sites))
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        user = User(name="bench", email="bench@example.com", password_hash="-")
+        db.session.add(user)
+        db.session.commit()
+        sites = [f"https://site-{i}.example/" for i in range(SITES)]
+        for i, site in enumerate(sites):
+            bulk_upsert(GscSiteDaily, _rows(ensure_site_id(user.id, site), i + 3), ("site_id", "date"))
+        t0 = time.perf_counter()
+        pack_all_sites()
+        pack_s = time.perf_counter() - t0
+
+        daily_rows, yearly_rows = GscSiteDaily.query.count(), GscSiteYear.query.count()
+        daily_kb = _table_bytes(GscSiteDaily.__tablename__) / 1024
+        yearly_kb = _table_bytes(GscSiteYear.__tablename__) / 1024
+        print(f"{SITES} siti x {YEARS} anni (impacchettati in {pack_s * 1000:.0f}ms)")
+        print(f"  {'riga per giorno':<18} {daily_rows:>7} righe {daily_kb:>8.0f}KB")
+        print(f"  {'anno per riga':<18} {yearly_rows:>7} righe {yearly_kb:>8.0f}KB  ({daily_kb / yearly_kb:.1f}x)")
+
+        print(f"{'giorni':>7} {'righe':>10} {'blob':>10}")
+        for days in PERIODS:
+            rows_ms = _read_ms(app, user.id, sites, days, packed=False)
+            packed_ms = _read_ms(app, user.id, sites, days, packed=True)
+            app.config["GSC_PACKED_SERIES"] = False
+            expected = get_site_series(user.id, sites[0], days)
+            app.config["GSC_PACKED_SERIES"] = True
+            same = get_site_series(user.id, sites[0], days) == expected
+            print(f"{days:>7} {rows_ms:>8.2f}ms {packed_ms:>8.2f}ms{'' if same else '  DIVERSE!'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Costo per richiesta della costruzione del service Search Console:
+`discovery.build` (riparsa il documento a ogni chiamata) vs il client
+condiviso di app/gsc/client.py (documento parsato una volta per worker)."""
+import time
+
+import google.oauth2.credentials
+import googleapiclient.discovery
+
+from app.gsc.client import API_SERVICE_NAME, API_VERSION, build_service
+
+ROUNDS = 200
+
+
+def _per_call(fn):
+    fn()  # primo giro fuori misura: caricamento moduli, warm-up del documento
+    t0 = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn()
+    return (time.perf_counter() - t0) / ROUNDS
+
+
+def main():
+    credentials = google.oauth2.credentials.Credentials(token="bench")
+    before = _per_call(lambda: googleapiclient.discovery.build(
+        API_SERVICE_NAME, API_VERSION, credentials=credentials, static_discovery=True
+    ))
+    after = _per_call(lambda: build_service(credentials))
+    print(f"discovery.build per richiesta: {before * 1000:6.3f} ms")
+    print(f"client condiviso:              {after * 1000:6.3f} ms  ({before / after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""sync_site_daily: scrittura riga per riga via ORM (versione precedente) vs
+INSERT ... ON CONFLICT multi-riga (`bulk_upsert`), su 480 giorni e su più anni.
+
+Gira su SQLite in un file temporaneo; su PostgreSQL il divario cresce, perché
+ogni statement singolo paga anche un round-trip di rete.
+"""
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+from app import create_app
+from app.extensions import db
+from app.gsc.history import bulk_upsert
+from app.gsc.site_ids import ensure_site_id
+from app.models import GscSiteDaily, User
+from config import Config
+
+SIZES = (480, 365 * 4)
+KEY = ("site_id", "date")
+
+
+def _rows(site_id, days, bump=0):
+    end = date.today() - timedelta(days=1)
+    return [
+        {
+            "site_id": site_id, "date": end - timedelta(days=i),
+            "clicks": 100 + i % 7 + bump, "impressions": 4000 + i, "ctr": 0.025, "position": 12.5,
+        }
+        for i in range(days)
+    ]
+
+
+def _orm_loop(rows):
+    # Copia del percorso precedente: carica i giorni esistenti, poi add/update uno per uno.
+    existing = {r.date: r for r in GscSiteDaily.query.filter_by(site_id=rows[0]["site_id"]).all()}
+    for values in rows:
+        row = existing.get(values["date"])
+        if row is None:
+            db.session.add(GscSiteDaily(**values))
+        else:
+            for k in ("clicks", "impressions", "ctr", "position"):
+                setattr(row, k, values[k])
+    db.session.commit()
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        user = User(name="bench", email="bench@example.com", password_hash="-")
+        db.session.add(user)
+        db.session.commit()
+
+        print(f"{'giorni':>7} {'fase':<16} {'ORM loop':>10} {'bulk upsert':>12}")
+        for days in SIZES:
+            orm_site = ensure_site_id(user.id, f"https://orm-{days}.example/")
+            bulk_site = ensure_site_id(user.id, f"https://bulk-{days}.example/")
+            for phase, bump in (("primo sync", 0), ("re-sync uguale", 0), ("re-sync cambiato", 1)):
+                orm = _timed(lambda: _orm_loop(_rows(orm_site, days, bump)))
+                bulk = _timed(lambda: bulk_upsert(GscSiteDaily, _rows(bulk_site, days, bump), KEY))
+                print(f"{days:>7} {phase:<16} {orm:>8.1f}ms {bulk:>10.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
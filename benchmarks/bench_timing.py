@@ -0,0 +1,69 @@
+"""Costo della strumentazione (app/metrics/timing.py), spenta e accesa.
+
+  - un singolo `span()` vuoto, in µs;
+  - una richiesta a /gsc/api/insights già in cache (il percorso più corto
+    che tocca DB e credenziali), dal test client, con Search Console finto
+    come in benchmarks/load_insights.py; e l'header Server-Timing che ne esce.
+
+Gira su SQLite in un file temporaneo.
+"""
+import os
+import statistics
+import tempfile
+import time
+
+from app.metrics import timing
+from benchmarks.load_insights import CACHED_SITE
+
+ROUNDS = 100_000
+REQUESTS = 300
+RUNS = 5
+
+
+def _per_span():
+    t0 = time.perf_counter()
+    for _ in range(ROUNDS):
+        with timing.span("bench"):
+            pass
+    return (time.perf_counter() - t0) / ROUNDS * 1e6
+
+
+def _per_request(client):
+    """Mediana su RUNS giri del tempo medio di una richiesta, in ms."""
+    runs = []
+    for _ in range(RUNS):
+        t0 = time.perf_counter()
+        for _ in range(REQUESTS):
+            client.get("/gsc/api/insights", query_string={"site": CACHED_SITE, "days": 28})
+        runs.append((time.perf_counter() - t0) / REQUESTS * 1000)
+    return statistics.median(runs)
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    os.environ["LOAD_DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["LOAD_CACHE_DIR"] = os.path.join(workdir, "cache")
+    from benchmarks.load_insights import make_app
+
+    app = make_app()
+    client = app.test_client()
+    client.get("/gsc/api/insights", query_string={"site": CACHED_SITE, "days": 28})  # riempie la cache
+
+    results = {}
+    for on in (False, True):
+        timing.enable(on)
+        results[on] = (_per_span(), _per_request(client))
+    header = client.get("/gsc/api/insights", query_string={"site": CACHED_SITE, "days": 28}).headers["Server-Timing"]
+    timing.enable(False)
+
+    print(f"{'':<8} {'span()':>10} {'richiesta in cache':>20}")
+    for on, label in ((False, "spenta"), (True, "accesa")):
+        span_us, request_ms = results[on]
+        print(f"{label:<8} {span_us:>8.2f}µs {request_ms:>18.3f}ms")
+    delta = results[True][1] - results[False][1]
+    print(f"costo per richiesta: {delta * 1000:+.0f}µs ({delta / results[False][1]:+.1%})")
+    print(f"Server-Timing: {header}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Finto server OpenAI-compatibile (POST /chat/completions) su 127.0.0.1.
+
+Serve ai benchmark del client DeepSeek (app/ai/deepseek.py) senza rete né
+costi: latenza iniettata, primi N tentativi rifiutati con 429 + Retry-After, e
+contatori di quello che il client fa davvero — connessioni TCP aperte e
+massimo di richieste contemporanee.
+
+La risposta analizza le pagine del prompt (gli url che contiene). Con
+`"stream": true` risponde in SSE come l'API vera, un pezzo di testo ogni
+`token_delay` secondi, così si misura il tempo al primo risultato.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeDeepSeek:
+    def __init__(self, latency=0.05, fail_first=0, retry_after="0.1", token_delay=0.0, chunk_chars=16):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.chunk_chars = chunk_chars
+        self.fail_first = fail_first
+        self.retry_after = retry_after
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self, fail_first=0):
+        with self._lock:
+            self.fail_first = fail_first
+            self.requests = self.connections = self.max_in_flight = 0
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, come l'API vera
+            # Header e body escono in due write: senza TCP_NODELAY Nagle + ACK
+            # ritardato aggiungono ~40 ms a ogni risposta su connessione riusata.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with fake._lock:
+                    fake.requests += 1
+                    rejected = fake.fail_first > 0
+                    if rejected:
+                        fake.fail_first -= 1
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    time.sleep(fake.latency)
+                    payload = json.loads(body)
+                    if rejected:
+                        self._send(429, {"error": "rate limited"}, {"Retry-After": fake.retry_after})
+                    elif payload.get("stream"):
+                        self._stream(self._content(payload))
+                    else:
+                        content = self._content(payload)
+                        for _ in range(0, len(content), fake.chunk_chars):
+                            time.sleep(fake.token_delay)  # stessa generazione, consegnata tutta alla fine
+                        self._send(200, self._completion(content))
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def _content(self, payload):
+                prompt = payload["messages"][-1]["content"] if payload.get("messages") else ""
+                pages = [
+                    {
+                        "url": url,
+                        "score": 40 + i % 50,
+                        "suggestions": [f"Rewrite the title of {url} to match the main query intent."] * 3,
+                    }
+                    for i, url in enumerate(re.findall(r"'url': '([^']+)'", prompt))
+                ]
+                return json.dumps({"pages": pages})
+
+            def _completion(self, content):
+                return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+
+            def _stream(self, content):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i in range(0, len(content), fake.chunk_chars):
+                    delta = {"choices": [{"index": 0, "delta": {"content": content[i:i + fake.chunk_chars]}}]}
+                    self._chunk(f"data: {json.dumps(delta)}\n\n")
+                    time.sleep(fake.token_delay)
+                self._chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, text):
+                raw = text.encode()
+                self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+
+            def _send(self, status, data, headers=None):
+                raw = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(raw)
+
+        return Handler
@@ -0,0 +1,214 @@
+"""Finto service Search Console con dati sintetici realistici e latenza iniettata.
+
+Imita la forma del client googleapiclient usata dall'app
+(`service.searchanalytics().query(siteUrl=..., body=...).execute()`), così i
+benchmark misurano il nostro codice e non la rete.
+
+Ogni sito (uno per siteUrl, deterministico dato `seed`) ha `pages` pagine:
+
+  - traffico a coda lunga (impression per pagina ~ 1/rank^ZIPF), posizione
+    media che peggiora col rank, CTR che cala con la posizione;
+  - andamento giornaliero con stagionalità settimanale e annuale e rumore,
+    più un trend per pagina (alcune crescono, molte calano), così i delta
+    tra periodi e le stelle della vista Insights non sono tutti uguali;
+  - dati solo negli ultimi `months` mesi (la retention di GSC) e fino a
+    `lag_days` giorni fa (il ritardo di pubblicazione);
+  - le pagine con meno di mezza impression nel periodo non compaiono, come
+    nell'API vera; righe ordinate per click, paginate con rowLimit/startRow.
+
+Dimensioni supportate: nessuna (totale), date, page, query, query+page.
+I totali sono la somma delle righe per pagina; la serie per data torna con
+le stesse pagine a meno degli arrotondamenti. I risultati sono in cache per
+(sito, dimensioni, periodo), fino a CACHED_RESULTS risposte: ripetendo una
+chiamata il finto costa solo la latenza, non il calcolo della risposta.
+"""
+import math
+import random
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+
+ZIPF = 1.1
+IMPRESSIONS_PER_PAGE = 40     # impression medie al giorno per pagina
+QUERIES_PER_PAGE = 3
+CACHED_RESULTS = 64
+WEEKLY = (1.08, 1.12, 1.1, 1.06, 0.98, 0.8, 0.76)  # lun..dom
+
+
+class _Site:
+    """Il modello di un sito: attributi per pagina e curva giornaliera."""
+
+    def __init__(self, site_url, pages, seed):
+        rng = random.Random(seed ^ zlib.crc32(site_url.encode()))
+        self.seed = rng.randrange(2**32)
+        self.urls = [f"{site_url.rstrip('/')}/{self._path(i)}" for i in range(pages)]
+        weights = [1 / (rank + 1) ** ZIPF for rank in range(pages)]
+        norm = pages / sum(weights)
+        self.share = [w * norm for w in weights]               # somma = pages
+        self.position = [
+            min(90.0, 1.0 + 2.5 * math.log10(rank + 1) + rng.uniform(0, 4)) for rank in range(pages)
+        ]
+        self.ctr = [0.32 / p ** 1.1 for p in self.position]
+        # Variazione relativa per anno, limitata perché nessuna pagina vada
+        # sotto zero nei 16 mesi di storico.
+        self.slope = [min(0.7, max(-0.9, rng.gauss(-0.15, 0.5))) for _ in range(pages)]
+        # Somme sulle pagine per la serie del sito: il giorno d vale
+        # base(d) * (x0 + x1 * t), con t gli anni da oggi.
+        self.impressions = (sum(self.share), sum(w * k for w, k in zip(self.share, self.slope)))
+        self.clicks = (
+            sum(w * c for w, c in zip(self.share, self.ctr)),
+            sum(w * k * c for w, k, c in zip(self.share, self.slope, self.ctr)),
+        )
+        self.weighted_position = (
+            sum(w * p for w, p in zip(self.share, self.position)),
+            sum(w * k * p for w, k, p in zip(self.share, self.slope, self.position)),
+        )
+        self.daily = {}
+
+    @staticmethod
+    def _path(i):
+        section = ("blog", "prodotti", "guide", "categoria")[i % 4]
+        return f"{section}/pagina-{i}"
+
+    def base(self, day):
+        """Impression per pagina media del giorno (prima di share e trend)."""
+        value = self.daily.get(day)
+        if value is None:
+            noise = random.Random(self.seed + day.toordinal()).gauss(1.0, 0.06)
+            season = 1 + 0.12 * math.sin(2 * math.pi * day.timetuple().tm_yday / 365)
+            value = self.daily[day] = IMPRESSIONS_PER_PAGE * WEEKLY[day.weekday()] * season * max(0.5, noise)
+        return value
+
+    def day_row(self, day):
+        """(clicks, impressions, position) del sito in un giorno."""
+        base, t = self.base(day), _years_ago(day)
+        impressions = base * (self.impressions[0] + self.impressions[1] * t)
+        clicks = base * (self.clicks[0] + self.clicks[1] * t)
+        position = base * (self.weighted_position[0] + self.weighted_position[1] * t) / impressions
+        return round(clicks), round(impressions), position
+
+    def page_rows(self, days):
+        """(url, clicks, impressions, ctr, position) per pagina sui giorni dati."""
+        if not days:
+            return []
+        s0 = sum(self.base(d) for d in days)
+        s1 = sum(self.base(d) * _years_ago(d) for d in days)
+        rows = []
+        for url, share, slope, ctr, position in zip(self.urls, self.share, self.slope, self.ctr, self.position):
+            impressions = round(share * (s0 + slope * s1))
+            if impressions:
+                clicks = round(impressions * ctr)
+                rows.append((url, clicks, impressions, clicks / impressions, position))
+        rows.sort(key=lambda r: (-r[1], -r[2]))
+        return rows
+
+
+def _years_ago(day):
+    return (day - date.today()).days / 365
+
+
+def _row(keys, clicks, impressions, position):
+    row = {
+        "clicks": clicks,
+        "impressions": impressions,
+        "ctr": clicks / impressions if impressions else 0.0,
+        "position": round(position, 2),
+    }
+    if keys is not None:
+        row["keys"] = keys
+    return row
+
+
+def _totals(rows):
+    clicks = sum(r[1] for r in rows)
+    impressions = sum(r[2] for r in rows)
+    position = sum(r[2] * r[4] for r in rows) / impressions if impressions else 0.0
+    return clicks, impressions, position
+
+
+class _Request:
+    def __init__(self, service, site_url, body):
+        self._service = service
+        self._site_url = site_url
+        self._body = body
+
+    def execute(self, http=None):
+        time.sleep(self._service.latency)
+        with self._service._lock:
+            self._service.calls += 1
+        body = self._body
+        dims = tuple(body.get("dimensions") or ())
+        rows = self._service._rows(
+            self._site_url, dims, date.fromisoformat(body["startDate"]), date.fromisoformat(body["endDate"])
+        )
+        start_row = body.get("startRow", 0)
+        rows = rows[start_row:start_row + body.get("rowLimit", 1000)]
+        return {"rows": rows} if rows else {}
+
+
+class _SearchAnalytics:
+    def __init__(self, service):
+        self._service = service
+
+    def query(self, siteUrl, body):
+        return _Request(self._service, siteUrl, body)
+
+
+class FakeSearchConsole:
+    def __init__(self, latency=0.15, pages=500, months=16, lag_days=2, seed=0):
+        self.latency = latency
+        self.pages = pages
+        self.months = months
+        self.lag_days = lag_days
+        self.seed = seed
+        self.calls = 0
+        self._sites = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def searchanalytics(self):
+        return _SearchAnalytics(self)
+
+    def _days(self, start, end):
+        today = date.today()
+        first = max(start, today - timedelta(days=round(self.months * 30.44)))
+        last = min(end, today - timedelta(days=self.lag_days))
+        return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+    def _rows(self, site_url, dims, start, end):
+        key = (site_url, dims, start, end)
+        with self._lock:
+            rows = self._results.get(key)
+            if rows is None:
+                if len(self._results) >= CACHED_RESULTS:  # load test con un sito nuovo a richiesta
+                    self._results.clear()
+                    self._sites.clear()
+                site = self._sites.get(site_url)
+                if site is None:
+                    site = self._sites[site_url] = _Site(site_url, self.pages, self.seed)
+                rows = self._results[key] = self._build(site, dims, self._days(start, end))
+        return rows
+
+    def _build(self, site, dims, days):
+        if dims == ("date",):
+            return [_row([day.isoformat()], *site.day_row(day)) for day in days]
+        pages = site.page_rows(days)
+        if not dims:
+            clicks, impressions, position = _totals(pages)
+            return [_row(None, clicks, impressions, position)] if impressions else []
+        if dims == ("page",):
+            return [_row([url], c, i, p) for url, c, i, _, p in pages]
+        if dims in (("query",), ("query", "page")):
+            # Ogni pagina si divide il traffico fra QUERIES_PER_PAGE query (60/30/10).
+            result = []
+            for n, (url, c, i, _, p) in enumerate(pages):
+                for k, part in enumerate((0.6, 0.3, 0.1)[:QUERIES_PER_PAGE]):
+                    query = f"{url.rsplit('/', 1)[-1].replace('-', ' ')} {('come', 'migliore', 'prezzo')[k]}"
+                    result.append((query, url, round(c * part), round(i * part), p + k))
+            result = [r for r in result if r[3]]
+            result.sort(key=lambda r: (-r[2], -r[3]))
+            if dims == ("query",):
+                return [_row([q], c, i, p) for q, _, c, i, p in result]
+            return [_row([q, url], c, i, p) for q, url, c, i, p in result]
+        raise ValueError(f"dimensioni non supportate dal finto: {list(dims)}")
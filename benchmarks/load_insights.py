@@ -0,0 +1,145 @@
+"""Load test di /gsc/api/insights servito da gunicorn (gunicorn.conf.py),
+con Search Console finto (benchmarks/fake_gsc.py, LATENCY per query).
+
+Due disposizioni del server: un solo worker con un thread (come un server
+sincrono qualunque) e quella di produzione, 3 worker gthread x 4 thread con
+preload. Per ciascuna, a concorrenza crescente per DURATION secondi:
+
+  - "cache": sempre lo stesso sito, risposta già in cache (sync saltato dal
+    watermark, JSON letto da app/gsc/cache.py);
+  - "sito nuovo": un sito diverso a ogni richiesta, quindi backfill dello
+    storico su DB + cinque query a GSC + scrittura in cache.
+
+Richieste al secondo, latenza p50/p95 ed errori. Gira su SQLite in un file
+temporaneo; LOAD_DATABASE_URL=postgresql://... per provarlo su Postgres.
+"""
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+LATENCY = 0.05
+CONCURRENCY = (1, 4, 12, 24)
+DURATION = 5
+LAYOUTS = (("1 worker x 1 thread", ["--workers", "1", "--threads", "1"]), ("3 worker x 4 thread", []))
+CACHED_SITE = "https://cached.example/"
+
+
+def make_app():
+    """App per gunicorn (`benchmarks.load_insights:make_app()`): DB e cache
+    da ambiente, Search Console finto, utente di benchmark già loggato."""
+    from flask_login import login_user
+
+    from app import create_app
+    from app.extensions import db
+    from app.gsc import gsc
+    from app.models import User
+    from benchmarks.fake_gsc import FakeSearchConsole
+    from config import Config
+
+    class LoadConfig(Config):
+        SQLALCHEMY_DATABASE_URI = os.environ["LOAD_DATABASE_URL"]
+        INSIGHTS_CACHE_DIR = os.environ["LOAD_CACHE_DIR"]
+
+    app = create_app(LoadConfig)
+    gsc.load_gsc_credentials = lambda user_id: {"token": "load"}
+    gsc._credentials_from_dict = lambda creds: None
+    gsc._build_service = lambda credentials: FakeSearchConsole(latency=LATENCY)
+    gsc.save_if_refreshed = lambda *args: None
+
+    with app.app_context():
+        user = User.query.filter_by(email="load@example.com").first()
+        if user is None:
+            user = User(name="load", email="load@example.com", password_hash="-")
+            db.session.add(user)
+            db.session.commit()
+        user_id = user.id
+
+    @app.before_request
+    def _login():
+        login_user(db.session.get(User, user_id))
+
+    return app
+
+
+def _serve(port, extra, env, log):
+    command = [
+        sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+        "--bind", f"127.0.0.1:{port}", *extra, "benchmarks.load_insights:make_app()",
+    ]
+    server = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"gunicorn non è partito, vedi {log.name}")
+
+
+def _load(url, sites, concurrency):
+    """(richieste/s, p50 ms, p95 ms, errori) con `concurrency` client per DURATION secondi."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + DURATION
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            with lock:
+                site = next(sites)
+            t0 = time.perf_counter()
+            status = session.get(url, params={"site": site, "days": 28}, timeout=60).status_code
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+                errors += status != 200
+
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    elapsed = time.monotonic() - t0
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    return len(latencies) / elapsed, pick(0.5), pick(0.95), errors
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        LOAD_DATABASE_URL=os.environ.get("LOAD_DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'load.db')}"),
+        LOAD_CACHE_DIR=os.path.join(workdir, "cache"),
+    )
+    print(f"latenza GSC finta {LATENCY * 1000:.0f} ms/query, {DURATION}s per livello")
+    print(f"{'server':<20} {'scenario':<11} {'client':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'errori':>7}")
+    for port, (layout, extra) in enumerate(LAYOUTS, 3901):
+        with open(os.path.join(workdir, f"gunicorn-{port}.log"), "w") as log:
+            server = _serve(port, extra, env, log)
+            try:
+                url = f"http://127.0.0.1:{port}/gsc/api/insights"
+                requests.get(url, params={"site": CACHED_SITE, "days": 28}, timeout=60)
+                fresh = (f"https://{port}-{n}.example/" for n in itertools.count())
+                for scenario, sites in (("cache", itertools.repeat(CACHED_SITE)), ("sito nuovo", fresh)):
+                    for concurrency in CONCURRENCY:
+                        rps, p50, p95, errors = _load(url, sites, concurrency)
+                        print(
+                            f"{layout:<20} {scenario:<11} {concurrency:>6} {rps:>8.1f} "
+                            f"{p50:>7.0f}ms {p95:>7.0f}ms {errors:>7}"
+                        )
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Suite dei percorsi caldi, con risultati in JSON da confrontare tra commit.
+
+    python -m benchmarks.suite                        # tutti i casi
+    python -m benchmarks.suite --quick                # taglie piccole, pochi giri
+    python -m benchmarks.suite --compare benchmarks/results/abc1234.json
+
+Gira contro Search Console finto (benchmarks/fake_gsc.py: siti da 10 a
+100.000 pagine, 16 mesi di giorni) e DeepSeek finto (benchmarks/fake_deepseek.py),
+su SQLite in un file temporaneo. Casi:
+
+  - build_insights/live/<pagine>: la vista Insights tutta da Google (primo
+    accesso a un sito, storico non ancora scaricato);
+  - sync_page_daily/<pagine>, build_insights/db/<pagine>: backfill dello
+    storico per pagina (PAGE_HISTORY_DAYS giorni) e la vista letta dal DB.
+    Solo per i siti con al più DB_ROWS_MAX righe di storico per pagina;
+  - sync_site_daily/backfill, sync_site_daily/resync: primo sync di un sito
+    (BACKFILL_DAYS giorni) e risincronizzazione forzata della coda;
+  - get_site_series/<giorni>/rows|packed: la serie del grafico dalle righe
+    giornaliere e dagli anni impacchettati (app/gsc/packed.py);
+  - compact_pages/<pagine>: riduzione delle pagine per il prompt AI;
+  - analyze_site/cold, analyze_site/warm: analisi AI di AI_MAX_PAGES_PER_SITE
+    pagine, tutte da DeepSeek e tutte dalla cache delle impronte.
+
+Latenze finte con --gsc-latency e --deepseek-latency (default 0: si misura
+il nostro codice, non l'attesa). Il JSON (default benchmarks/results/<commit>.json)
+ha commit, parametri e, per caso, mediana/min/max in ms; `--compare` stampa
+il rapporto con un run precedente ed esce con 1 se un caso peggiora oltre
+`--threshold`.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+PAGES = (10, 1000, 100_000)
+QUICK_PAGES = (10, 1000)
+REPEAT = 7
+QUICK_REPEAT = 3
+DB_ROWS_MAX = 2_000_000
+SERIES_DAYS = (28, 90, 480)
+COMPACT_PAGES = (200, 10_000)
+THRESHOLD = 0.15
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _measure(fn, repeat, warmup=True):
+    """ms di `repeat` esecuzioni di fn(i), dopo un giro di riscaldamento con i=-1."""
+    if warmup:
+        fn(-1)
+    samples = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def _summary(samples):
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+        "max_ms": round(max(samples), 3),
+        "runs": len(samples),
+    }
+
+
+def _pages_for_prompt(n):
+    """Pagine nella forma che build_insights passa ad analyze_site."""
+    return [
+        {
+            "url": f"https://ai.example/blog/post-{i}", "clicks": 1000 // (i + 1) + 3,
+            "impressions": 20000 // (i + 1) + 40, "ctr": 0.031, "position": 4.0 + i % 40,
+            "clicks_prev": 1200 // (i + 1) + 3, "clicks_delta_pct": -35.0 + i % 50, "stars": 3,
+        }
+        for i in range(n)
+    ]
+
+
+def run(pages, repeat, gsc_latency, deepseek_latency):
+    """Esegue la suite. Ritorna {caso: riepilogo}."""
+    from app import create_app
+    from app.ai.service import _compact_pages, analyze_site
+    from app.extensions import db
+    from app.gsc.history import get_site_series, sync_site_daily
+    from app.gsc.insights import build_insights
+    from app.gsc.packed import pack_all_sites
+    from app.gsc.page_history import PAGE_HISTORY_DAYS, sync_page_daily
+    from app.gsc.site_ids import ensure_site_id
+    from app.models import User
+    from benchmarks.fake_deepseek import FakeDeepSeek
+    from benchmarks.fake_gsc import FakeSearchConsole
+    from config import Config
+
+    results = {}
+
+    def case(name, fn, times=repeat, warmup=True):
+        results[name] = _summary(_measure(fn, times, warmup))
+        r = results[name]
+        print(f"  {name:<34} {r['median_ms']:>10.2f}ms  (min {r['min_ms']:.2f}, max {r['max_ms']:.2f})", flush=True)
+
+    with tempfile.TemporaryDirectory() as tmp, FakeDeepSeek(latency=deepseek_latency) as fake:
+        class SuiteConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'suite.db')}"
+            DEEPSEEK_API = "bench"
+            DEEPSEEK_BASE_URL = fake.url
+
+        app = create_app(SuiteConfig)
+        app.logger.setLevel("WARNING")
+        with app.app_context():
+            user = User(name="suite", email="suite@example.com", password_hash="-")
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+
+            for n in pages:
+                service = FakeSearchConsole(latency=gsc_latency, pages=n)
+                site = f"https://live-{n}.example/"
+                case(f"build_insights/live/{n}", lambda i: build_insights(service, site, days=28))
+                if n * PAGE_HISTORY_DAYS > DB_ROWS_MAX:
+                    continue
+                site = f"https://db-{n}.example/"
+                sync_site_daily(service, user_id, site, 28)
+                case(f"sync_page_daily/{n}", lambda i: sync_page_daily(service, user_id, site), times=1, warmup=False)
+                case(f"build_insights/db/{n}", lambda i: build_insights(service, site, days=28, user_id=user_id))
+
+            service = FakeSearchConsole(latency=gsc_latency, pages=100)
+            case(
+                "sync_site_daily/backfill",
+                lambda i: sync_site_daily(service, user_id, f"https://backfill-{i}.example/", 28),
+            )
+            site = "https://series.example/"
+            sync_site_daily(service, user_id, site, 28)  # primo sync: BACKFILL_DAYS giorni
+            case("sync_site_daily/resync", lambda i: sync_site_daily(service, user_id, site, 28, force=True))
+
+            pack_all_sites()
+            for days in SERIES_DAYS:
+                for packed in (False, True):
+                    app.config["GSC_PACKED_SERIES"] = packed
+
+                    def series(i):
+                        get_site_series(user_id, site, days)
+                        db.session.remove()  # niente identity map tra una lettura e l'altra
+
+                    case(f"get_site_series/{days}/{'packed' if packed else 'rows'}", series)
+            app.config["GSC_PACKED_SERIES"] = False
+
+            for n in COMPACT_PAGES:
+                prompt_pages = _pages_for_prompt(n)
+                case(f"compact_pages/{n}", lambda i: _compact_pages(prompt_pages, n))
+
+            prompt_pages = _pages_for_prompt(app.config["AI_MAX_PAGES_PER_SITE"])
+
+            def analyze(site):
+                # Come un job: il sito è già nel registro (property verificata).
+                ensure_site_id(user_id, site)
+                analyze_site(user_id, site, prompt_pages)
+
+            case("analyze_site/cold", lambda i: analyze(f"https://ai-{i}.example/"))
+            case("analyze_site/warm", lambda i: analyze("https://ai-warm.example/"))
+            db.session.remove()
+            db.engine.dispose()  # chiude il file prima di cancellare la cartella
+    return results
+
+
+def compare(base, current, threshold):
+    """Stampa il confronto caso per caso. Ritorna i casi peggiorati."""
+    if base.get("params") != current.get("params"):
+        print(f"attenzione: parametri diversi dal run di confronto ({base.get('params')})")
+    print(f"confronto con {base.get('commit')} ({base.get('created_at')}):")
+    worse = []
+    for name, result in current["results"].items():
+        old = base["results"].get(name)
+        if old is None:
+            print(f"  {name:<34} {'nuovo':>10}")
+            continue
+        ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  PEGGIORATO"
+            worse.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  migliorato"
+        print(f"  {name:<34} {old['median_ms']:>10.2f}ms -> {result['median_ms']:>10.2f}ms  {ratio:5.2f}x{flag}")
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suite dei benchmark dei percorsi caldi.")
+    parser.add_argument("--quick", action="store_true", help=f"pagine {QUICK_PAGES}, {QUICK_REPEAT} giri")
+    parser.add_argument("--pages", type=int, nargs="+", help=f"dimensioni dei siti (default {PAGES})")
+    parser.add_argument("--repeat", type=int, help=f"giri per caso (default {REPEAT})")
+    parser.add_argument("--gsc-latency", type=float, default=0.0, help="secondi per query GSC finta")
+    parser.add_argument("--deepseek-latency", type=float, default=0.0, help="secondi per chiamata DeepSeek finta")
+    parser.add_argument("--out", help="file JSON dei risultati (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="JSON di un run precedente da confrontare")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="variazione tollerata della mediana")
+    args = parser.parse_args(argv)
+
+    params = {
+        "pages": args.pages or list(QUICK_PAGES if args.quick else PAGES),
+        "repeat": args.repeat or (QUICK_REPEAT if args.quick else REPEAT),
+        "gsc_latency": args.gsc_latency,
+        "deepseek_latency": args.deepseek_latency,
+    }
+    commit = _git("rev-parse", "--short", "HEAD")
+    print(f"commit {commit}, pagine {params['pages']}, {params['repeat']} giri per caso")
+    report = {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": run(params["pages"], params["repeat"], params["gsc_latency"], params["deepseek_latency"]),
+    }
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{commit or 'senza-commit'}{'-dirty' if report['dirty'] else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"risultati in {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            worse = compare(json.load(f), report, args.threshold)
+        if worse:
+            print(f"{len(worse)} casi peggiorati oltre il {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Gunicorn in produzione (Dockerfile): `gunicorn -c gunicorn.conf.py run:app`.
+
+Layout di ARCHITECTURE.md, sez. 3: il carico è I/O-bound (DB, Google,
+DeepSeek), quindi pochi worker gthread con più thread ciascuno. Con
+`preload_app` l'app si carica una volta nel master e i worker la condividono
+via fork; l'engine SQLAlchemy si svuota prima del fork e di nuovo nel worker
+(`dispose_engines` in app/__init__.py), così ogni worker ha il suo pool
+(DB_POOL_* in config.py). Valori sovrascrivibili da ambiente.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 3000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 3))      # 2 vCPU: 3 worker evitano thrashing
+worker_class = "gthread"                                 # I/O-bound: thread meglio di processi
+threads = int(os.environ.get("GUNICORN_THREADS", 4))     # 3 x 4 = 12 richieste concorrenti
+timeout = 60                   # l'onboarding OAuth può essere lento
+graceful_timeout = 30
+keepalive = 5
+max_requests = 1000            # ricicla i worker: previene leak lenti
+max_requests_jitter = 100
+preload_app = True             # condivide memoria tra worker via fork
+accesslog = os.environ.get("GUNICORN_ACCESSLOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
+
+
+def when_ready(server):
+    # App già caricata nel master (preload), worker non ancora forkati: le
+    # librerie che l'app importa al primo uso si caricano qui una volta sola.
+    if server.cfg.preload_app:
+        from app import dispose_engines, import_deferred
+
+        import_deferred()
+        dispose_engines(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app import dispose_engines
+
+        dispose_engines(server.app.wsgi(), close=False)
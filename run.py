@@ -1,3 +1,5 @@
+"""Entry point. In sviluppo `python run.py` avvia il server di Flask con il
+debugger; in produzione gunicorn importa `app` da qui (gunicorn.conf.py)."""
 import os
 
 from app import create_app
@@ -0,0 +1,2 @@
+"""Processo scheduler, separato dai worker web (vedi ARCHITECTURE.md, sez. 2):
+con 3 worker Gunicorn un job dentro l'app partirebbe 3 volte."""
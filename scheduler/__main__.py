@@ -0,0 +1,48 @@
+"""Loop dello scheduler: `python -m scheduler`.
+
+Ogni INGEST_INTERVAL_HOURS fa un giro di app/gsc/ingest.py su tutti gli
+account collegati. Il lock dentro run_ingest rende innocuo avviare più
+repliche: solo una lavora, le altre saltano il giro.
+
+Nel frattempo, ogni JOBS_POLL_SECONDS, esegue i job di analisi AI rimasti in
+coda (app/ai/jobs.py): l'ingestione gira in un thread a parte, così un giro
+lungo non blocca i job.
+"""
+import threading
+import time
+
+from app import create_app
+from app.ai.jobs import run_pending_jobs
+from app.gsc.ingest import run_ingest
+
+JOBS_POLL_SECONDS = 15
+
+
+def _ingest_loop(app):
+    interval = app.config["INGEST_INTERVAL_HOURS"] * 3600
+    while True:
+        started = time.monotonic()
+        with app.app_context():
+            try:
+                results = run_ingest()
+                if results is not None:
+                    app.logger.info("Ingest completato: %d account.", len(results))
+            except Exception:
+                app.logger.exception("Ingest fallito")
+        time.sleep(max(60.0, interval - (time.monotonic() - started)))
+
+
+def main():
+    app = create_app()
+    threading.Thread(target=_ingest_loop, args=(app,), name="ingest", daemon=True).start()
+    while True:
+        with app.app_context():
+            try:
+                run_pending_jobs()
+            except Exception:
+                app.logger.exception("Job AI in coda non eseguiti")
+        time.sleep(JOBS_POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
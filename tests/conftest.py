@@ -0,0 +1,51 @@
+"""Fixture comuni: un'app su SQLite in un file temporaneo, una per sessione
+(create_app registra i blueprint di Flask-Admin, che sono globali), e lo
+schema ricreato da zero per ogni test che la usa."""
+import os
+import tempfile
+
+import pytest
+
+from config import Config
+
+
+@pytest.fixture(scope="session")
+def _app():
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class TestConfig(Config):
+            TESTING = True
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'test.db')}"
+            WTF_CSRF_ENABLED = False
+
+        app = create_app(TestConfig)
+        yield app
+        from app.extensions import db
+
+        with app.app_context():
+            db.engine.dispose()
+
+
+@pytest.fixture
+def app(_app):
+    from app.extensions import db
+    from app.gsc import site_ids
+
+    with _app.app_context():
+        db.drop_all()
+        db.create_all()
+        site_ids._ids.clear()
+        yield _app
+        db.session.remove()
+
+
+@pytest.fixture
+def user(app):
+    from app.extensions import db
+    from app.models import User
+
+    user = User(name="test", email="test@example.com", password_hash="-")
+    db.session.add(user)
+    db.session.commit()
+    return user
@@ -0,0 +1,26 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.ai.service import site_budget
+from app.extensions import db
+from app.gsc.site_ids import ensure_site_id
+from app.models import AiBudget
+
+SITE = "https://grande.example/"
+
+
+def test_site_row_overrides_the_global_one_field_by_field(app, user):
+    db.session.add(AiBudget(max_pages=50, max_tokens=1000))
+    db.session.add(AiBudget(site_id=ensure_site_id(user.id, SITE), max_pages=10))
+    db.session.commit()
+    assert site_budget(user.id, SITE) == (10, 1000)
+    assert site_budget(user.id, "https://altro.example/") == (50, 1000)
+
+
+def test_only_one_global_row(app):
+    db.session.add(AiBudget(max_pages=50))
+    db.session.commit()
+    db.session.add(AiBudget(max_pages=80))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+
+from app.ai.jobs import MAX_ATTEMPTS, run_pending_jobs
+from app.extensions import db
+from app.gsc.site_ids import ensure_site_id
+from app.models import AiAnalysisJob
+
+SITE = "https://lavoro.example/"
+
+
+def _running_job(user_id, lease_left, attempts=1):
+    """Job "running" preso da un worker, con la lease che scade tra `lease_left`."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    job = AiAnalysisJob(
+        site_id=ensure_site_id(user_id, SITE),
+        status="running",
+        created_at=now - timedelta(minutes=2),
+        started_at=now - timedelta(minutes=2),
+        lease_until=now + lease_left,
+        attempts=attempts,
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_job_of_a_dead_worker_is_taken_again(user):
+    job_id = _running_job(user.id, timedelta(seconds=-1))
+    assert run_pending_jobs() == 1
+    job = db.session.get(AiAnalysisJob, job_id)
+    # Ripreso ed eseguito: l'utente non ha GSC collegato, quindi finisce lì.
+    assert (job.status, job.error, job.attempts) == ("failed", "not_connected", 2)
+
+
+def test_job_is_given_up_after_max_attempts(user):
+    job_id = _running_job(user.id, timedelta(seconds=-1), attempts=MAX_ATTEMPTS)
+    assert run_pending_jobs() == 0
+    job = db.session.get(AiAnalysisJob, job_id)
+    assert (job.status, job.error) == ("failed", "timeout")
+
+
+def test_job_with_a_live_lease_is_left_alone(user):
+    job_id = _running_job(user.id, timedelta(seconds=30))
+    assert run_pending_jobs() == 0
+    job = db.session.get(AiAnalysisJob, job_id)
+    assert (job.status, job.attempts) == ("running", 1)
@@ -0,0 +1,28 @@
+from app.extensions import db
+from app.gsc.site_ids import ensure_site_id
+from app.models import AiAnalyzerConfig, Site
+
+SITE = "https://verificato.example/"
+
+
+def _client(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+    return client
+
+
+def test_toggle_on_unknown_site_leaves_no_rows(app, user):
+    response = _client(app, user).post("/ai/toggle", data={"site": "https://altrui.example/", "enabled": "true"})
+    assert response.status_code == 404
+    assert response.get_json()["error"] == "unknown_site"
+    assert Site.query.count() == 0
+    assert AiAnalyzerConfig.query.count() == 0
+
+
+def test_toggle_on_registered_site(app, user):
+    ensure_site_id(user.id, SITE)
+    response = _client(app, user).post("/ai/toggle", data={"site": SITE, "enabled": "true"})
+    assert response.status_code == 200
+    assert response.get_json()["enabled"]
+    assert db.session.query(AiAnalyzerConfig.enabled).scalar()
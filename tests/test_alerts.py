@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+
+from app.extensions import db
+from app.gsc.alerts import evaluate_site_pages
+from app.gsc.monthly import SERIES_MONTHS, add_months, month_start
+from app.gsc.page_history import PAGE_HISTORY_DAYS
+from app.gsc.site_ids import ensure_site_id
+from app.models import GscPageMonthly, GscSiteMonthly, GscSyncState
+
+SITE = "https://example.com/"
+PAGE = "https://example.com/costumi-da-bagno"
+
+
+def _seed(user_id, page_clicks, pages_covered_start):
+    """Sito stabile con 16 mesi di rollup; la pagina ha `page_clicks` (dal
+    mese più vecchio) negli ultimi len(page_clicks) mesi conclusi."""
+    site_id = ensure_site_id(user_id, SITE)
+    last = month_start(month_start(date.today()) - timedelta(days=1))
+    for i in range(SERIES_MONTHS):
+        month = add_months(last, i - SERIES_MONTHS + 1)
+        db.session.add(GscSiteMonthly(site_id=site_id, month=month, clicks=10000, impressions=200000, days=30))
+    for i, clicks in enumerate(page_clicks):
+        month = add_months(last, i - len(page_clicks) + 1)
+        db.session.add(
+            GscPageMonthly(
+                site_id=site_id, page_url=PAGE, month=month, clicks=clicks, impressions=clicks * 20, position=5.0
+            )
+        )
+    db.session.add(GscSyncState(site_id=site_id, pages_covered_start=pages_covered_start))
+    db.session.commit()
+
+
+def test_seasonality_not_applicable_with_short_page_history(user):
+    # Storico del sito di 16 mesi, storico per pagina di PAGE_HISTORY_DAYS:
+    # il filtro 5 non si applica e nessun alert si dice confermato YoY.
+    _seed(user.id, [300, 300, 300, 100, 100, 100], date.today() - timedelta(days=PAGE_HISTORY_DAYS - 1))
+    evaluation = evaluate_site_pages(user.id, SITE)
+    assert not evaluation.yoy_applicable
+    assert [c.url for c in evaluation.candidates] == [PAGE]
+    assert evaluation.candidates[0].yoy_confirmed is None
+
+
+def test_seasonality_rejects_page_with_long_history(user):
+    # Stesso calo, ma un anno fa la pagina faceva uguale: stagionale.
+    clicks = [300] * SERIES_MONTHS
+    clicks[1:4] = clicks[13:16] = [100, 100, 100]
+    _seed(user.id, clicks, add_months(month_start(date.today()), -SERIES_MONTHS - 1))
+    evaluation = evaluate_site_pages(user.id, SITE)
+    assert evaluation.yoy_applicable
+    assert evaluation.candidates == []
+    assert evaluation.rejected() == {"stagionalità": 1}
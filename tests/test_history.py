@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.gsc.history import GSC_LAG_DAYS, get_period_totals, sync_site_daily
+from app.gsc.site_ids import ensure_site_id, get_site_id
+from app.models import GscSiteDaily, GscSyncState, Site
+
+SITE = "https://piccolo.example/"
+DAYS = 28
+
+
+def _windows():
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=DAYS - 1)
+    prev_end = start - timedelta(days=1)
+    return start, end, prev_end - timedelta(days=DAYS - 1), prev_end
+
+
+def _seed(user_id, days):
+    site_id = ensure_site_id(user_id, SITE)
+    for day in days:
+        db.session.add(GscSiteDaily(site_id=site_id, date=day, clicks=1, impressions=10, ctr=0.1, position=5.0))
+    start, end, prev_start, _ = _windows()
+    db.session.add(GscSyncState(site_id=site_id, covered_start=prev_start, covered_end=end))
+    db.session.commit()
+
+
+def test_zero_traffic_days_do_not_force_the_live_path(user):
+    start, end, prev_start, _ = _windows()
+    days = [prev_start + timedelta(days=i) for i in range(2 * DAYS) if i % 7]  # un giorno a settimana a zero
+    _seed(user.id, days)
+    cur, prev = get_period_totals(user.id, SITE, *_windows())
+    assert cur["clicks"] == sum(1 for d in days if d >= start)
+    assert prev["clicks"] == sum(1 for d in days if d < start)
+
+
+def test_unpublished_tail_trims_both_windows(user):
+    start, end, prev_start, _ = _windows()
+    missing = GSC_LAG_DAYS - 1
+    _seed(user.id, [prev_start + timedelta(days=i) for i in range(2 * DAYS - missing)])
+    cur, prev = get_period_totals(user.id, SITE, *_windows())
+    assert cur["clicks"] == prev["clicks"] == DAYS - missing
+
+
+def test_uncovered_previous_window_goes_live(user):
+    start, end, prev_start, prev_end = _windows()
+    _seed(user.id, [start + timedelta(days=i) for i in range(DAYS)])
+    GscSyncState.query.one().covered_start = start
+    db.session.commit()
+    assert get_period_totals(user.id, SITE, start, end, prev_start, prev_end) is None
+
+
+class _Service:
+    """searchanalytics().query(...).execute() con le righe date, o l'errore
+    di Google per una property non verificata."""
+
+    def __init__(self, rows=None, error=None):
+        self.rows, self.error = rows or [], error
+
+    def searchanalytics(self):
+        return self
+
+    def query(self, siteUrl, body):
+        return self
+
+    def execute(self):
+        if self.error:
+            raise self.error
+        return {"rows": self.rows}
+
+
+def test_rejected_property_is_not_registered(user):
+    with pytest.raises(PermissionError):
+        sync_site_daily(_Service(error=PermissionError("User does not have sufficient permission")), user.id, SITE, DAYS)
+    assert Site.query.count() == 0
+
+    day = date.today() - timedelta(days=5)
+    row = {"keys": [day.isoformat()], "clicks": 3, "impressions": 30, "ctr": 0.1, "position": 4.0}
+    assert sync_site_daily(_Service([row]), user.id, SITE, DAYS) == 1
+    assert get_site_id(user.id, SITE) is not None
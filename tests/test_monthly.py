@@ -0,0 +1,33 @@
+from datetime import date, timedelta
+
+from app.extensions import db
+from app.gsc.monthly import add_months, get_site_months, month_start, year_over_year
+from app.gsc.site_ids import ensure_site_id
+from app.models import GscSiteMonthly, GscSyncState
+
+SITE = "https://piccolo.example/"
+
+
+def test_year_over_year_on_months_with_zero_traffic_days(user):
+    # Sito piccolo: GSC non ritorna i giorni senza traffico, quindi i mesi
+    # interi hanno meno righe che giorni. Conta il watermark, non `days`.
+    site_id = ensure_site_id(user.id, SITE)
+    this_month = month_start(date.today())
+    for n in range(1, 15):
+        db.session.add(GscSiteMonthly(site_id=site_id, month=add_months(this_month, -n), clicks=100 + n, days=20))
+    db.session.add(
+        GscSyncState(
+            site_id=site_id,
+            covered_start=add_months(this_month, -14),
+            covered_end=date.today() - timedelta(days=1),
+        )
+    )
+    db.session.commit()
+
+    months = get_site_months(user.id, SITE)
+    yoy = year_over_year(months)
+    last_complete = next(m for m in reversed(months) if m["complete"])
+    assert yoy["month"] == last_complete["month"]
+    assert yoy["clicks_year_ago"] == next(
+        m["clicks"] for m in months if m["month"] == add_months(date.fromisoformat(yoy["month"]), -12).isoformat()
+    )
@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import text
+
+from app import _ensure_tables
+from app.extensions import db
+from app.models import SchemaVersion
+
+
+@pytest.fixture
+def legacy_db(app):
+    """DB segnato come vecchio, con l'elenco delle property ancora in gsc_sites."""
+    db.session.execute(
+        text(
+            "CREATE TABLE gsc_sites (id INTEGER PRIMARY KEY, user_id INTEGER, site_url TEXT, "
+            "permission_level TEXT, fetched_at DATETIME)"
+        )
+    )
+    SchemaVersion.query.delete()
+    db.session.commit()
+    yield app
+    db.session.execute(text("DROP TABLE IF EXISTS gsc_sites"))
+    db.session.commit()
+
+
+def test_boot_refuses_tables_to_migrate(legacy_db):
+    with pytest.raises(RuntimeError, match="migrate-sites"):
+        _ensure_tables(legacy_db)
+
+
+def test_init_db_fails_until_migrate_sites(legacy_db):
+    runner = legacy_db.test_cli_runner()
+    result = runner.invoke(args=["init-db"])
+    assert result.exit_code != 0
+    assert "migrate-sites" in result.output
+
+    assert runner.invoke(args=["migrate-sites"]).exit_code == 0
+    assert runner.invoke(args=["init-db"]).exit_code == 0
+    _ensure_tables(legacy_db)
@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import RuleThresholds
+from app.rules import SERIES_MONTHS, resolve
+
+
+def test_resolve_rejects_windows_longer_than_the_series():
+    assert resolve({"window_months": SERIES_MONTHS // 2}).window_months == SERIES_MONTHS // 2
+    with pytest.raises(ValueError):
+        resolve({"window_months": SERIES_MONTHS // 2 + 1})
+
+
+def test_alerts_with_invalid_thresholds_is_a_client_error(app, user):
+    db.session.add(RuleThresholds(window_months=SERIES_MONTHS))
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+    response = client.get("/gsc/api/alerts?site=https://example.com/")
+    assert response.status_code == 422
+    assert response.get_json()["error"] == "invalid_thresholds"
+
+
+def test_only_one_global_row(app):
+    db.session.add(RuleThresholds(min_pct_loss=0.3))
+    db.session.commit()
+    db.session.add(RuleThresholds(min_pct_loss=0.5))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()